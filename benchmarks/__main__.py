@@ -0,0 +1,87 @@
+"""Runs the benchmarks and saves their results as JSON, to compare them across commits.
+
+Run it from the repository's root:
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --quick --only evaluation sync
+    python -m benchmarks --compare before.json --output after.json
+"""
+import argparse
+import importlib
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+BENCHMARKS = (
+    "evaluation",
+    "actor_ids",
+    "sync",
+    "contention",
+    "web_ui",
+    "flags_map_updates",
+    "sqlite_delta_sync",
+    "flags_memory",
+)
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(names: List[str], quick: bool = False) -> Dict[str, Any]:
+    results: Dict[str, Dict[str, float]] = {}
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        module = importlib.import_module(f"benchmarks.{name}")
+        results[name] = module.run(quick=quick)  # type: ignore
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "quick": quick,
+        "results": results,
+    }
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """Prints the ratio of each current result to the previous one."""
+    for name, results in current["results"].items():
+        previous_results = previous["results"].get(name, {})
+        for key, value in results.items():
+            previous_value = previous_results.get(key, None)
+            if not previous_value:
+                print(f"{name}.{key}: {value:.6g} (new)")
+            else:
+                print(f"{name}.{key}: {value:.6g} ({value / previous_value:.2f}x)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a smoke run")
+    parser.add_argument("--output", help="path of the JSON file to write the results to")
+    parser.add_argument("--compare", help="path of a previous results' JSON file")
+    args = parser.parse_args()
+
+    report = run(args.only, quick=args.quick)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(json.load(previous_file), report)
+    elif not args.output:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Compares large actor allowlists: frozensets against ActorIdSets, with or without a Bloom filter.
+
+Run it from the repository's root: python -m benchmarks.actor_ids
+"""
+import json
+import sys
+import tracemalloc
+from typing import Callable, Collection, Dict, List
+
+from flypper.entities.actor_ids import ActorIdSet
+
+from benchmarks.utils import time_per_call
+
+ACTOR_COUNT = 500_000
+
+def allocated_bytes(build: Callable[[], Collection[str]]) -> int:
+    """Measures the memory held by the collection build returns."""
+    tracemalloc.start()
+    try:
+        collection = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del collection
+    return size
+
+def run(quick: bool = False) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    actor_count = 10_000 if quick else ACTOR_COUNT
+    actor_ids: List[str] = [f"user_{i:08d}" for i in range(actor_count)]
+
+    builders: Dict[str, Callable[[], Collection[str]]] = {
+        "frozenset": lambda: frozenset(f"user_{i:08d}" for i in range(actor_count)),
+        "actor_id_set": lambda: ActorIdSet(actor_ids),
+        "actor_id_set_bloom": lambda: ActorIdSet(actor_ids, bloom_bits_per_id=10),
+    }
+    for name, build in builders.items():
+        results[f"{name}_bytes"] = allocated_bytes(build)
+        collection = build()
+        results[f"{name}_hit_seconds"] = time_per_call(lambda: actor_ids[actor_count // 3] in collection, number=10_000)
+        results[f"{name}_miss_seconds"] = time_per_call(lambda: "user_missing" in collection, number=10_000)
+
+    results["json_list_bytes"] = len(json.dumps(actor_ids))
+    results["packed_bytes"] = len(ActorIdSet(actor_ids).pack())
+    packed = ActorIdSet(actor_ids).pack()
+    results["unpack_seconds"] = time_per_call(lambda: ActorIdSet.unpack(packed), number=1 if quick else 5)
+    results["json_loads_seconds"] = time_per_call(lambda: frozenset(json.loads(json.dumps(actor_ids))), number=1 if quick else 5)
+    return results
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name}: {value:.9g}", file=sys.stdout)
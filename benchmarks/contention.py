@@ -0,0 +1,73 @@
+"""Measures Client.flags() throughput and tail latency, many threads sharing a client.
+
+The storage takes some time to answer, like a remote one would: threads reading
+the flags while another one syncs show how the client behaves under contention.
+
+Run it from the repository's root: python -m benchmarks.contention
+"""
+from threading import Barrier, Thread
+from time import perf_counter
+from typing import Dict, List
+
+from flypper import Client
+
+from benchmarks.utils import SlowStorage, create_flag_data, percentile
+
+THREAD_COUNTS = (1, 4, 16)
+STORAGE_DELAY = 0.005
+TTL = 0.05
+
+def measure(client: Client, thread_count: int, duration: float) -> Dict[str, float]:
+    """Reads the client's flags from thread_count threads during duration seconds."""
+    latencies: List[List[float]] = [[] for _ in range(thread_count)]
+    barrier = Barrier(thread_count + 1)
+
+    def read_flags(thread_latencies: List[float]) -> None:
+        barrier.wait()
+        stop_at = perf_counter() + duration
+        while True:
+            started_at = perf_counter()
+            if started_at >= stop_at:
+                return
+            client(user_id="user_42").is_enabled("flag_0")
+            thread_latencies.append(perf_counter() - started_at)
+
+    threads = [Thread(target=read_flags, args=(thread_latencies,)) for thread_latencies in latencies]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+
+    all_latencies = sorted(latency for thread_latencies in latencies for latency in thread_latencies)
+    return {
+        "reads_per_second": len(all_latencies) / duration,
+        "p50_seconds": percentile(all_latencies, 0.50),
+        "p99_seconds": percentile(all_latencies, 0.99),
+        "p999_seconds": percentile(all_latencies, 0.999),
+        "max_seconds": all_latencies[-1] if all_latencies else float("nan"),
+    }
+
+def run(
+    quick: bool = False,
+    storage_delay: float = STORAGE_DELAY,
+    ttl: float = TTL,
+) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    duration = 0.2 if quick else 2.0
+    storage = SlowStorage(delay=storage_delay)
+    for i in range(1_000):
+        storage.upsert(create_flag_data(name=f"flag_{i}"))
+
+    for mode in ("sync", "background_refresh"):
+        for thread_count in (THREAD_COUNTS[:2] if quick else THREAD_COUNTS):
+            client = Client(storage=storage, ttl=ttl, background_refresh=mode == "background_refresh")
+            client.flags()
+            for name, value in measure(client, thread_count, duration).items():
+                results[f"{mode}_{thread_count}_threads_{name}"] = value
+            client.stop()
+    return results
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name}: {value:.6f}")
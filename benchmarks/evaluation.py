@@ -0,0 +1,88 @@
+"""Measures flag evaluations: single checks, batched checks, all flags at once and contexts built per second.
+
+Run it from the repository's root: python -m benchmarks.evaluation
+"""
+from typing import Dict
+
+from flypper import Client
+from flypper.storage.in_memory import InMemoryStorage
+
+from benchmarks.utils import create_flag_data, time_per_call
+
+ACTOR_COUNT = 10_000
+
+def run(quick: bool = False) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    number = 1_000 if quick else 100_000
+    actor_ids = [f"user_{i}" for i in range(100 if quick else ACTOR_COUNT)]
+
+    storage = InMemoryStorage()
+    storage.upsert({**create_flag_data(name="enabled"), "enabled": True})
+    storage.upsert({
+        **create_flag_data(name="actors"),
+        "enabled_for_actors": {"actor_key": "user_id", "actor_ids": actor_ids[:100]},
+    })
+    storage.upsert({
+        **create_flag_data(name="percentage"),
+        "enabled_for_percentage_of_actors": {"actor_key": "user_id", "percentage": 25.0},
+    })
+    client = Client(storage=storage, ttl=3600)
+    cached_client = Client(storage=storage, ttl=3600, bucket_cache_size=ACTOR_COUNT)
+
+    context = client(user_id="user_42")
+    cached_context = cached_client(user_id="user_42")
+    for flag_name in ("enabled", "actors", "percentage"):
+        results[f"is_enabled_{flag_name}_seconds"] = time_per_call(
+            lambda: context.is_enabled(flag_name),
+            number=number,
+        )
+    results["is_enabled_percentage_bucket_cache_seconds"] = time_per_call(
+        lambda: cached_context.is_enabled("percentage"),
+        number=number,
+    )
+    results["is_enabled_missing_seconds"] = time_per_call(
+        lambda: context.is_enabled("missing"),
+        number=number,
+    )
+
+    results["evaluate_many_percentage_per_actor_seconds"] = time_per_call(
+        lambda: context.evaluate_many("percentage", "user_id", actor_ids),
+        number=max(number // len(actor_ids), 1),
+    ) / len(actor_ids)
+    results["is_enabled_loop_percentage_per_actor_seconds"] = time_per_call(
+        lambda: [context.is_enabled("percentage", user_id=actor_id) for actor_id in actor_ids],
+        number=max(number // len(actor_ids), 1),
+    ) / len(actor_ids)
+
+    many_flags_storage = InMemoryStorage()
+    many_flags_storage.upsert_many(
+        {**create_flag_data(name=f"flag_{index}"), "enabled": index % 2 == 0}
+        for index in range(100 if quick else 1_000)
+    )
+    many_flags_client = Client(storage=many_flags_storage, ttl=3600)
+    many_flags_number = max(number // 1_000, 1)
+
+    def is_enabled_loop() -> None:
+        context = many_flags_client(user_id="user_42")
+        for flag_name in many_flags_client.flags():
+            context.is_enabled(flag_name)
+
+    results["is_enabled_loop_all_flags_seconds"] = time_per_call(is_enabled_loop, number=many_flags_number)
+    results["evaluate_all_seconds"] = time_per_call(
+        lambda: many_flags_client(user_id="user_42").evaluate_all(),
+        number=many_flags_number,
+    )
+    results["payload_pack_seconds"] = time_per_call(
+        lambda: many_flags_client(user_id="user_42").payload().pack(),
+        number=many_flags_number,
+    )
+
+    results["context_creation_seconds"] = time_per_call(
+        lambda: client(user_id="user_42").is_enabled("enabled"),
+        number=number,
+    )
+    return results
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name}: {value * 1_000_000:.3f} us")
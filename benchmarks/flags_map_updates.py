@@ -0,0 +1,54 @@
+"""Compares applying deltas to the client's flags: dict copies against a PersistentMap.
+
+Run it from the repository's root: python -m benchmarks.flags_map_updates
+"""
+from typing import Dict, List
+
+from flypper import Flag
+from flypper.client import apply_updates
+from flypper.persistent_map import PersistentMap
+
+from benchmarks.utils import build_flags, time_per_call
+
+FLAG_COUNT = 50_000
+DELTA_SIZES = (1, 10, 100, 1_000)
+ROUNDS = 50
+
+def apply_updates_with_a_copy(flags: Dict[str, Flag], new_flags: List[Flag]) -> Dict[str, Flag]:
+    """The previous strategy: copy the whole dict, then update it."""
+    flags = flags.copy()
+    for new_flag in new_flags:
+        if new_flag.is_deleted:
+            flags.pop(new_flag.name, None)
+        else:
+            flags[new_flag.name] = new_flag
+    return flags
+
+def run(quick: bool = False) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    rounds = 2 if quick else ROUNDS
+    flags = build_flags(1_000 if quick else FLAG_COUNT)
+    dict_flags = {flag.name: flag for flag in flags}
+    persistent_flags: PersistentMap[str, Flag] = PersistentMap(dict_flags)
+
+    for delta_size in DELTA_SIZES:
+        delta = build_flags(delta_size, version=1)
+
+        results[f"dict_copy_delta_{delta_size}_seconds"] = time_per_call(
+            lambda: apply_updates_with_a_copy(dict_flags, delta),
+            number=rounds,
+        )
+        results[f"persistent_map_delta_{delta_size}_seconds"] = time_per_call(
+            lambda: apply_updates(persistent_flags, delta),
+            number=rounds,
+        )
+
+    name = flags[len(flags) // 2].name
+    results["dict_lookup_seconds"] = time_per_call(lambda: dict_flags.get(name), number=10_000)
+    results["persistent_map_lookup_seconds"] = time_per_call(lambda: persistent_flags.get(name), number=10_000)
+
+    return results
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name}: {value * 1_000_000:.3f} us")
@@ -0,0 +1,67 @@
+"""Measures the memory taken by the flags, per flag, at 10k, 100k and 1M flags, and how fast they decode.
+
+The flags mix plain ones, ones enabled for a few actors and percentage rollouts,
+decoded from JSON documents like the SQLite storage and snapshots do.
+
+Run it from the repository's root: python -m benchmarks.flags_memory
+"""
+import gc
+import json
+import tracemalloc
+from time import perf_counter
+from typing import Dict, List
+
+from flypper import Flag
+
+FLAG_COUNTS = (10_000, 100_000, 1_000_000)
+
+def build_documents(count: int) -> List[str]:
+    documents = []
+    for index in range(count):
+        data: Dict[str, object] = {
+            "name": f"flag_{index}",
+            "deleted": False,
+            "enabled": True,
+            "enabled_for_actors": None,
+            "enabled_for_percentage_of_actors": None,
+            "updated_at": 1_700_000_000.0 + index,
+            "version": index + 1,
+        }
+        if index % 3 == 1:
+            data["enabled_for_actors"] = {"actor_key": "user_id", "actor_ids": [str(index + i) for i in range(5)]}
+        elif index % 3 == 2:
+            data["enabled_for_percentage_of_actors"] = {"actor_key": "user_id", "percentage": 12.5}
+        documents.append(json.dumps(data, separators=(",", ":")))
+    return documents
+
+def measure(documents: List[str]) -> Dict[str, float]:
+    gc.collect()
+    tracemalloc.start()
+    flags = {flag.name: flag for flag in (Flag(json.loads(document)) for document in documents)}
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # The decoding time is measured again without tracing, which slows allocations down.
+    del flags
+    gc.collect()
+    started_at = perf_counter()
+    flags = {flag.name: flag for flag in (Flag(json.loads(document)) for document in documents)}
+    elapsed = perf_counter() - started_at
+    return {
+        "bytes_per_flag": memory / len(documents),
+        "decode_seconds_per_flag": elapsed / len(documents),
+    }
+
+def run(quick: bool = False) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    for count in FLAG_COUNTS[:1] if quick else FLAG_COUNTS:
+        for name, value in measure(build_documents(count)).items():
+            results[f"{name}_{count}"] = value
+    return results
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        if name.startswith("bytes"):
+            print(f"{name}: {value:.0f} B")
+        else:
+            print(f"{name}: {value * 1_000_000:.3f} us")
@@ -0,0 +1,50 @@
+"""Measures delta syncs against a SqliteStorage holding many flags.
+
+Run it from the repository's root: python -m benchmarks.sqlite_delta_sync
+"""
+import os
+import tempfile
+from time import perf_counter
+from typing import Dict
+
+from flypper import Client
+from flypper.storage.sqlite import SqliteStorage
+
+from benchmarks.utils import create_flag_data
+
+FLAG_COUNT = 100_000
+DELTA_SIZES = (1, 10, 100, 1_000, 10_000)
+
+def run(quick: bool = False) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    flag_count = 1_000 if quick else FLAG_COUNT
+    delta_sizes = [delta_size for delta_size in DELTA_SIZES if delta_size < flag_count]
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SqliteStorage(os.path.join(directory, "flypper.sqlite3"))
+
+        started_at = perf_counter()
+        storage.upsert_many(create_flag_data(name=f"flag_{i}") for i in range(flag_count))
+        results["upsert_all_seconds"] = perf_counter() - started_at
+
+        client = Client(storage=storage, ttl=0)
+        started_at = perf_counter()
+        client.flags()
+        results["full_sync_seconds"] = perf_counter() - started_at
+
+        for delta_size in delta_sizes:
+            storage.upsert_many(create_flag_data(name=f"flag_{i}") for i in range(delta_size))
+
+            started_at = perf_counter()
+            client.flags()
+            results[f"delta_sync_{delta_size}_seconds"] = perf_counter() - started_at
+
+        started_at = perf_counter()
+        client.flags()
+        results["empty_delta_sync_seconds"] = perf_counter() - started_at
+
+        storage.close()
+    return results
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name}: {value * 1000:.3f} ms")
@@ -0,0 +1,48 @@
+"""Measures the client's syncs against an InMemoryStorage, by flag count and delta size.
+
+Run it from the repository's root: python -m benchmarks.sync
+"""
+from time import perf_counter
+from typing import Dict
+
+from flypper import Client
+from flypper.storage.in_memory import InMemoryStorage
+
+from benchmarks.utils import create_flag_data, time_per_call
+
+FLAG_COUNTS = (1_000, 10_000, 100_000)
+DELTA_SIZES = (1, 100, 1_000)
+
+def run(quick: bool = False) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    for flag_count in (FLAG_COUNTS[:1] if quick else FLAG_COUNTS):
+        storage = InMemoryStorage()
+        for i in range(flag_count):
+            storage.upsert(create_flag_data(name=f"flag_{i}"))
+
+        results[f"full_sync_{flag_count}_flags_seconds"] = time_per_call(
+            lambda: Client(storage=storage, ttl=0).flags(),
+            number=1,
+        )
+
+        client = Client(storage=storage, ttl=0)
+        client.flags()
+        results[f"empty_delta_sync_{flag_count}_flags_seconds"] = time_per_call(client.flags, number=100)
+
+        for delta_size in DELTA_SIZES:
+            if delta_size > flag_count:
+                continue
+
+            timings = []
+            for _ in range(2 if quick else 10):
+                for i in range(delta_size):
+                    storage.upsert(create_flag_data(name=f"flag_{i}"))
+                started_at = perf_counter()
+                client.flags()
+                timings.append(perf_counter() - started_at)
+            results[f"delta_sync_{flag_count}_flags_{delta_size}_updates_seconds"] = min(timings)
+    return results
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name}: {value * 1000:.3f} ms")
@@ -0,0 +1,48 @@
+from time import perf_counter, sleep
+from typing import Callable, List, Sequence, cast
+
+from flypper import Flag, FlagData, UnversionedFlagData
+from flypper.storage.in_memory import InMemoryStorage
+
+def create_flag_data(name: str) -> UnversionedFlagData:
+    return {
+        "name": name,
+        "enabled": True,
+        "deleted": False,
+        "enabled_for_actors": None,
+        "enabled_for_percentage_of_actors": None,
+    }
+
+class SlowStorage(InMemoryStorage):
+    """An InMemoryStorage taking delay seconds to list the flags, like a remote storage would."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def list(self, version__gt: int = 0) -> List[Flag]:
+        sleep(self.delay)
+        return super().list(version__gt=version__gt)
+
+def time_per_call(fn: Callable[[], object], number: int, repeat: int = 3) -> float:
+    """Returns the best, over repeat runs, of the mean time taken by a call to fn."""
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (perf_counter() - started_at) / number)
+    return best
+
+def percentile(sorted_values: Sequence[float], ratio: float) -> float:
+    """Returns the value at the given ratio of already sorted values, 0.99 for the p99."""
+    if not sorted_values:
+        return float("nan")
+    index = min(int(ratio * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def build_flags(count: int, version: int = 0, prefix: str = "flag_") -> List[Flag]:
+    return [
+        Flag(data=cast(FlagData, {**create_flag_data(name=f"{prefix}{i}"), "updated_at": 0.0, "version": version}))
+        for i in range(count)
+    ]
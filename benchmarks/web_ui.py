@@ -0,0 +1,43 @@
+"""Measures the web UI's index rendering with many flags, cached or not.
+
+Run it from the repository's root: python -m benchmarks.web_ui
+"""
+from typing import Dict
+
+from werkzeug.test import Client as WsgiClient
+
+from flypper.storage.in_memory import InMemoryStorage
+from flypper.wsgi.web_ui import FlypperWebUI
+
+from benchmarks.utils import create_flag_data, time_per_call
+
+FLAG_COUNT = 10_000
+
+def run(quick: bool = False) -> Dict[str, float]:
+    flag_count = 100 if quick else FLAG_COUNT
+    storage = InMemoryStorage()
+    for i in range(flag_count):
+        storage.upsert(create_flag_data(name=f"flag_{i}"))
+    wsgi_client = WsgiClient(FlypperWebUI(storage=storage, render_cache_size=0))
+    cached_wsgi_client = WsgiClient(FlypperWebUI(storage=storage))
+    etag = cached_wsgi_client.get("/flypper/").headers["ETag"]
+    number = 1 if quick else 20
+
+    return {
+        f"index_{flag_count}_flags_seconds": time_per_call(
+            lambda: wsgi_client.get("/flypper/"),
+            number=number,
+        ),
+        f"index_{flag_count}_flags_cached_seconds": time_per_call(
+            lambda: cached_wsgi_client.get("/flypper/"),
+            number=number,
+        ),
+        f"index_{flag_count}_flags_not_modified_seconds": time_per_call(
+            lambda: cached_wsgi_client.get("/flypper/", headers={"If-None-Match": etag}),
+            number=number,
+        ),
+    }
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name}: {value * 1000:.3f} ms")
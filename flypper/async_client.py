@@ -0,0 +1,122 @@
+import asyncio
+from time import monotonic, perf_counter
+from typing import Callable, Mapping, Optional, TYPE_CHECKING
+
+from flypper.bucket_cache import BucketCache
+from flypper.payload import OrderingCache
+from flypper.client import apply_updates, synced_version
+from flypper.context import Context
+from flypper.entities.flag import actor_bucket
+from flypper.persistent_map import PersistentMap
+from flypper.storage.abstract import FullListing
+
+if TYPE_CHECKING:
+    from flypper.entities.flag import Flag
+    from flypper.entities.segment import Segment
+    from flypper.metrics import Instrumentation
+    from flypper.usage import UsageTracker
+    from flypper.storage.async_abstract import AsyncAbstractStorage
+
+class AsyncClient:
+    """AsyncClient is the asyncio counterpart of Client.
+
+    It caches the flags in the same way, but syncs with an AsyncAbstractStorage
+    without blocking the event loop. Coroutines finding an expired cache at the
+    same time share the same storage roundtrip.
+
+    Contexts are built from the loaded flags, so checking flags stays synchronous:
+
+        context = await client.context(user_id="42")
+        if context.is_enabled("new_feature"):
+            ...
+    """
+
+    def __init__(
+        self,
+        storage: "AsyncAbstractStorage",
+        ttl: float = 5.0,
+        time_fn: Callable[[], float] = monotonic,
+        bucket_cache_size: Optional[int] = None,
+        usage_tracker: Optional["UsageTracker"] = None,
+        instrumentation: Optional["Instrumentation"] = None,
+    ):
+        self._storage: "AsyncAbstractStorage" = storage
+        self._ttl: float = ttl
+        self._last_version: int = 0
+        self._next_sync: float = 0
+        self._flags: PersistentMap[str, "Flag"] = PersistentMap()
+        self._last_segment_version: int = 0
+        self._segments: PersistentMap[str, "Segment"] = PersistentMap()
+        self._time_fn: Callable[[], float] = time_fn
+        self._sync_task: Optional["asyncio.Future[None]"] = None
+        self.bucket_cache: Optional[BucketCache] = (
+            BucketCache(maxsize=bucket_cache_size)
+            if bucket_cache_size is not None
+            else None
+        )
+        self.ordering_cache: OrderingCache = OrderingCache()
+        self.usage_tracker: Optional["UsageTracker"] = usage_tracker
+        self.instrumentation: Optional["Instrumentation"] = instrumentation
+
+    async def flags(self) -> Mapping[str, "Flag"]:
+        """Lists the flag, by their name, in a read-only mapping: copy it with dict() to modify it.
+
+        It will call the storage at most once every ttl seconds, fetching
+        only the latest updates since the last storage roundtrip.
+        """
+        if self._time_fn() >= self._next_sync:
+            await self._sync()
+        return self._flags
+
+    async def context(self, **entries: str) -> Context:
+        """Builds a context from this client, once its flags are loaded."""
+        flags = await self.flags()
+        return Context(client=self, entries=entries, flags=flags, segments=self._segments)
+
+    @property
+    def bucket(self) -> Callable[[str], int]:
+        """The function used to compute the actors' buckets, cached or not."""
+        return self.bucket_cache or actor_bucket
+
+    async def _sync(self) -> None:
+        """Syncs the cache with the storage, sharing the in-flight sync if any."""
+        sync_task = self._sync_task
+        if sync_task is None:
+            sync_task = asyncio.ensure_future(self._fetch())
+            self._sync_task = sync_task
+        # A cancelled caller must not cancel the sync other coroutines are waiting for.
+        await asyncio.shield(sync_task)
+
+    async def _fetch(self) -> None:
+        try:
+            now = self._time_fn()
+
+            # Get the latest flags updates from the backend.
+            started_at = perf_counter()
+            try:
+                new_flags = await self._storage.list(version__gt=self._last_version)
+            except Exception:
+                if self.instrumentation is not None:
+                    self.instrumentation.on_sync_error(perf_counter() - started_at)
+                raise
+            if self.instrumentation is not None:
+                self.instrumentation.on_sync(perf_counter() - started_at, len(new_flags))
+
+            # Segments are synced after the flags, so flags never miss the segments they use.
+            if self._storage.supports_segments:
+                new_segments = await self._storage.list_segments(version__gt=self._last_segment_version)
+                if new_segments:
+                    self._segments = apply_updates(self._segments, new_segments)
+                    self._last_segment_version = max(segment.version for segment in new_segments)
+
+            if new_flags or isinstance(new_flags, FullListing):
+                self._flags = apply_updates(self._flags, new_flags)
+                self.ordering_cache.clear()
+
+                # Keep track of the latest version we received.
+                self._last_version = synced_version(new_flags)
+
+            # Compute the minimum time the next sync could occur.
+            self._next_sync = now + self._ttl
+        finally:
+            self._sync_task = None
@@ -0,0 +1,38 @@
+from functools import lru_cache
+from typing import NamedTuple
+
+from flypper.entities.flag import actor_bucket
+
+class BucketCacheStats(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+class BucketCache:
+    """BucketCache keeps the most recently used actors' buckets in memory.
+
+    An actor's bucket doesn't depend on the flag, so a single cache can serve
+    every percentage rollout checked by a client. The cache is bounded and
+    evicts the least recently used actors first. It is safe to share between threads.
+    """
+
+    def __init__(self, maxsize: int = 10_000):
+        self._maxsize: int = maxsize
+        self._bucket = lru_cache(maxsize=maxsize)(actor_bucket)
+
+    def __call__(self, actor_id: str) -> int:
+        return self._bucket(actor_id)
+
+    def stats(self) -> BucketCacheStats:
+        """Reports the number of hits and misses since the cache was created or cleared."""
+        info = self._bucket.cache_info()
+        return BucketCacheStats(
+            hits=info.hits,
+            misses=info.misses,
+            maxsize=self._maxsize,
+            currsize=info.currsize,
+        )
+
+    def clear(self) -> None:
+        self._bucket.cache_clear()
@@ -0,0 +1,71 @@
+from random import random
+from typing import Callable, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit is open and the client has no flags to serve."""
+
+class SyncTimeoutError(TimeoutError):
+    """Raised when fetching the updates from the storage takes longer than the sync timeout."""
+
+class CircuitBreaker:
+    """CircuitBreaker stops a client from calling a failing storage, retrying it with a backoff.
+
+    The circuit is closed while the syncs succeed. After failure_threshold
+    consecutive failures it opens: the storage isn't called until the retry
+    time, when a single sync tries it again, half-opening the circuit. Its
+    success closes the circuit, its failure opens it again.
+
+    The delay before retrying starts at backoff_base seconds and doubles with
+    each failure, up to backoff_max. It is jittered, between half of it and
+    all of it, so the clients of a storage coming back don't all retry at once.
+
+    It isn't thread-safe: clients only use it while holding their semaphore.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        random_fn: Callable[[], float] = random,
+    ):
+        self.failure_threshold: int = failure_threshold
+        self.backoff_base: float = backoff_base
+        self.backoff_max: float = backoff_max
+        self._random_fn: Callable[[], float] = random_fn
+        self.state: str = CLOSED
+        self.consecutive_failures: int = 0
+        self.retry_at: float = 0.0
+        self.last_error: Optional[BaseException] = None
+
+    def allow(self, now: float) -> bool:
+        """Tells if the storage can be called, half-opening the circuit once its retry time has come."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now >= self.retry_at:
+            self.state = HALF_OPEN
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.retry_at = 0.0
+        self.last_error = None
+
+    def record_failure(self, now: float, error: BaseException) -> float:
+        """Records a failed sync, returns the time the storage can be called again."""
+        self.consecutive_failures = self.consecutive_failures + 1
+        self.last_error = error
+        if self.state == CLOSED and self.consecutive_failures < self.failure_threshold:
+            return now
+
+        retries = self.consecutive_failures - self.failure_threshold
+        delay = min(self.backoff_base * 2 ** min(retries, 32), self.backoff_max)
+        self.state = OPEN
+        self.retry_at = now + delay * (0.5 + 0.5 * self._random_fn())
+        return self.retry_at
@@ -1,13 +1,100 @@
-from time import monotonic
-from threading import Semaphore
-from typing import Callable, Dict, TYPE_CHECKING
+import logging
+import os
+import weakref
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from queue import Empty, SimpleQueue
+from time import monotonic, perf_counter
+from threading import Event, Lock, Semaphore, Thread
+from typing import Any, Callable, List, Mapping, Optional, Sequence, Tuple, TypeVar, TYPE_CHECKING
 
+from flypper.bucket_cache import BucketCache
+from flypper.circuit_breaker import CLOSED, CircuitBreaker, CircuitOpenError, SyncTimeoutError
 from flypper.context import Context
+from flypper.entities.flag import actor_bucket
+from flypper.payload import OrderingCache
+from flypper.persistent_map import PersistentMap
+from flypper.snapshot import Snapshot, write_snapshot
+from flypper.storage.abstract import FullListing
 
 if TYPE_CHECKING:
     from flypper.entities.flag import Flag
+    from flypper.entities.segment import Segment
+    from flypper.metrics import Instrumentation
+    from flypper.usage import UsageTracker
     from flypper.storage.abstract import AbstractStorage
 
+logger = logging.getLogger(__name__)
+
+# Flags and segments are synced the same way.
+Entity = TypeVar("Entity", "Flag", "Segment")
+Result = TypeVar("Result")
+
+# Seconds between two background refreshes at least, whatever the ttl.
+MIN_REFRESH_INTERVAL = 0.1
+
+def apply_updates(
+    flags: PersistentMap[str, "Entity"],
+    new_flags: List["Entity"],
+) -> PersistentMap[str, "Entity"]:
+    """Returns the flags updated with their latest version, deleted flags being removed.
+
+    The given flags are left untouched, so the running contexts can operate using
+    the reference of the outdated version they might have. Both versions share
+    the unchanged flags, so applying the updates doesn't copy all the flags.
+
+    A FullListing replaces all the flags instead.
+    """
+    if isinstance(new_flags, FullListing):
+        return PersistentMap((flag.name, flag) for flag in new_flags if not flag.is_deleted)
+    return flags.evolve(
+        updates=[(flag.name, flag) for flag in new_flags if not flag.is_deleted],
+        removals=[flag.name for flag in new_flags if flag.is_deleted],
+    )
+
+def synced_version(new_flags: List["Flag"]) -> int:
+    """The version to sync the updates after, once the given ones are applied."""
+    if isinstance(new_flags, FullListing):
+        return new_flags.version
+    return max(flag.version for flag in new_flags)
+
+class _Worker:
+    """Runs calls one after the other in a daemon thread, started by the first call.
+
+    Unlike a ThreadPoolExecutor's, the thread doesn't delay the interpreter's exit
+    while a call to the storage hangs. It exits after idle_timeout seconds without calls.
+    """
+
+    def __init__(self, name: str, idle_timeout: float = 60.0):
+        self._name: str = name
+        self._idle_timeout: float = idle_timeout
+        self._calls: "SimpleQueue[Tuple[Callable[[], Any], Future]]" = SimpleQueue()
+        self._thread: Optional[Thread] = None
+        self._lock: Lock = Lock()
+
+    def submit(self, call: Callable[[], Result]) -> "Future[Result]":
+        future: "Future[Result]" = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+            self._calls.put((call, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            try:
+                call, future = self._calls.get(timeout=self._idle_timeout)
+            except Empty:
+                with self._lock:
+                    if self._calls.empty():
+                        self._thread = None
+                        return
+                continue
+            try:
+                future.set_result(call())
+            except BaseException as error:
+                future.set_exception(error)
+
 class Client:
     """Client caches the flags' configuration at the application level.
 
@@ -17,6 +104,43 @@ class Client:
     It efficiently synchronize by only asking for the updates since its last sync.
     To get there, the storage and the client agree on a global version number associated
     with each update.
+
+    Setting a bucket_cache_size enables a cache of the actors' buckets, shared by
+    all the percentage rollouts checked through this client's contexts.
+
+    Giving a usage_tracker counts the flags' evaluations made through the contexts.
+    Giving an instrumentation, a MetricsRegistry for instance, reports how the syncs
+    and the evaluations go, the client being reported under its name.
+
+    With background_refresh, a daemon thread syncs with the storage every ttl seconds,
+    MIN_REFRESH_INTERVAL at least, and reading the flags never waits on the storage.
+    If the flags are older than max_staleness seconds (defaults to twice that interval),
+    for instance because the storage keeps failing, reading the flags falls back to a
+    synchronous sync. In a forked process, the background refresh restarts on the first
+    read of the flags.
+
+    With watch, the background thread waits for the storage to notify it of the
+    changes and applies them as soon as they land, instead of polling every ttl
+    seconds. It falls back to polling when the storage doesn't support watching.
+    The storage is watched from another daemon thread, so stop doesn't wait for
+    the watch to return.
+
+    When a sync fails, the client keeps serving the flags of its last successful
+    sync, and only raises when it has none. A circuit_breaker (defaults to a
+    CircuitBreaker()) spaces out the retries of a failing storage with a jittered
+    exponential backoff: requests don't wait on it meanwhile. Failed watches count
+    as failed syncs. With a sync_timeout, a sync taking longer than sync_timeout
+    seconds fails, the storage call going on in a daemon thread, reused by the next
+    syncs. Check circuit_breaker.state and staleness to know how
+    outdated the served flags might be.
+
+    When the storage holds segments, the client syncs them along with the flags,
+    with their own version, after the flags: flags referencing a new segment
+    never miss it.
+
+    A client can dump its flags and segments to a snapshot file, and be built from one.
+    A client built from a snapshot only fetches the updates made after it on its first
+    sync, and keeps serving the snapshot's flags if the storage can't be reached at boot.
     """
 
     def __init__(
@@ -24,53 +148,368 @@ class Client:
         storage: "AbstractStorage",
         ttl: float = 5.0,
         time_fn: Callable[[], float] = monotonic,
+        bucket_cache_size: Optional[int] = None,
+        usage_tracker: Optional["UsageTracker"] = None,
+        instrumentation: Optional["Instrumentation"] = None,
+        background_refresh: bool = False,
+        max_staleness: Optional[float] = None,
+        watch: bool = False,
+        sync_timeout: Optional[float] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        name: Optional[str] = None,
     ):
+        self.name: Optional[str] = name
         self._storage: "AbstractStorage" = storage
         self._ttl: float = ttl
+        self._refresh_interval: float = max(ttl, MIN_REFRESH_INTERVAL)
         self._last_version: int = 0
         self._next_sync: float = 0
-        self._flags: Dict[str, "Flag"] = {}
+        self._flags: PersistentMap[str, "Flag"] = PersistentMap()
+        self._last_segment_version: int = 0
+        self._segments: PersistentMap[str, "Segment"] = PersistentMap()
         self._time_fn: Callable[[], float] = time_fn
         self._semaphore: Semaphore = Semaphore()
+        self._synced_at: Optional[float] = None
+        self._max_staleness: float = max_staleness if max_staleness is not None else 2 * self._refresh_interval
+        self._refresher: Optional[Thread] = None
+        self._start_lock: Lock = Lock()
+        self._restart_after_fork: bool = False
+        self._watch: bool = watch
+        self._bootstrapped: bool = False
+        self._stop_event: Event = Event()
+        self._wake_event: Event = Event()
+        self._watcher: _Worker = _Worker("flypper-watch")
+        self._fetcher: _Worker = _Worker("flypper-sync")
+        self._sync_timeout: Optional[float] = sync_timeout
+        self._pending_fetch: Optional["Future[Tuple[List[Flag], List[Segment]]]"] = None
+        self.circuit_breaker: CircuitBreaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.bucket_cache: Optional[BucketCache] = (
+            BucketCache(maxsize=bucket_cache_size)
+            if bucket_cache_size is not None
+            else None
+        )
+        self.ordering_cache: OrderingCache = OrderingCache()
+        self.usage_tracker: Optional["UsageTracker"] = usage_tracker
+        self.instrumentation: Optional["Instrumentation"] = instrumentation
+        if instrumentation is not None:
+            instrumentation.register_client(self)
+
+        _clients.add(self)
 
-    def flags(self) -> Dict[str, "Flag"]:
-        """Lists the flag, by their name.
+        if background_refresh or watch:
+            self.start()
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        storage: "AbstractStorage",
+        path: str,
+        missing_ok: bool = False,
+        **kwargs,
+    ) -> "Client":
+        """Builds a client from the flags of a snapshot file, see dump_snapshot.
+
+        With missing_ok, a missing snapshot file builds a regular client."""
+        try:
+            snapshot = Snapshot(path)
+        except FileNotFoundError:
+            if not missing_ok:
+                raise
+            return cls(storage=storage, **kwargs)
+
+        background_refresh = kwargs.pop("background_refresh", False)
+        watch = kwargs.pop("watch", False)
+        client = cls(storage=storage, **kwargs)
+        client._flags = PersistentMap(snapshot.items())
+        client._last_version = snapshot.version
+        client._segments = PersistentMap(snapshot.segments.items())
+        client._last_segment_version = snapshot.segments_version
+        client._bootstrapped = True
+        client._watch = watch
+        if background_refresh or watch:
+            client.start()
+        return client
+
+    def dump_snapshot(self, path: str) -> None:
+        """Writes the current flags and segments, and their versions, to a snapshot file."""
+        with self._semaphore:
+            flags, version = self._flags, self._last_version
+            segments, segments_version = self._segments, self._last_segment_version
+        write_snapshot(path, flags, version, segments, segments_version)
+
+    def flags(self) -> Mapping[str, "Flag"]:
+        """Lists the flag, by their name, in a read-only mapping: copy it with dict() to modify it.
 
         It will call the storage at most once every ttl seconds, fetching
         only the latest updates since the last storage roundtrip.
+
+        When refreshed in the background, it only reads the latest flags without locking.
         """
+        if self._restart_after_fork:
+            self._restart_after_fork = False
+            self.start()
+        if self._refresher is not None:
+            synced_at = self._synced_at
+            if synced_at is not None and self._time_fn() - synced_at <= self._max_staleness:
+                return self._flags
         self._sync()
         return self._flags
 
+    def segments(self) -> Mapping[str, "Segment"]:
+        """Lists the segments, by their name, as of the latest sync: call flags first."""
+        return self._segments
+
+    def start(self) -> None:
+        """Starts refreshing the flags in a background thread.
+
+        The first sync happens before returning, so the flags are available right away."""
+        with self._start_lock:
+            if self._refresher is not None:
+                return
+            self._sync()
+            self._stop_event = Event()
+            self._wake_event = Event()
+            self._refresher = Thread(
+                target=self._refresh_loop,
+                args=(self._stop_event, self._wake_event),
+                name="flypper-refresh",
+                daemon=True,
+            )
+            self._refresher.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops the background refresh, waiting for the thread to exit."""
+        self._restart_after_fork = False
+        refresher = self._refresher
+        if refresher is None:
+            return
+        self._stop_event.set()
+        self._wake_event.set()
+        self._refresher = None
+        refresher.join(timeout)
+
+    @property
+    def version(self) -> int:
+        """The version of the latest update received from the storage."""
+        return self._last_version
+
+    @property
+    def segments_version(self) -> int:
+        """The version of the latest segments' update received from the storage."""
+        return self._last_segment_version
+
+    def version_lag(self) -> Optional[int]:
+        """Number of versions the client is behind its storage, queries the storage.
+
+        None when the storage doesn't support a cheap current_version."""
+        if not self._storage.supports_current_version:
+            return None
+        last_version = max(self._last_version, self._last_segment_version)
+        return max(self._storage.current_version() - last_version, 0)
+
+    def staleness(self) -> float:
+        """Time since the client's last successful sync, infinite if it never synced."""
+        synced_at = self._synced_at
+        if synced_at is None:
+            return float("inf")
+        return max(self._time_fn() - synced_at, 0.0)
+
+    @property
+    def bucket(self) -> Callable[[str], int]:
+        """The function used to compute the actors' buckets, cached or not."""
+        return self.bucket_cache or actor_bucket
+
     def __call__(self, **entries: str) -> Context:
         """Builds a context from this client."""
         return Context(client=self, entries=entries)
 
-    def _sync(self):
+    def _sync(self, force: bool = False):
         """Syncs the cache with the storage."""
-        with self._semaphore:
-            now = self._time_fn()
+        # Avoid taking the lock while the cache is fresh.
+        if not force and self._time_fn() < self._next_sync:
+            return
 
-            if now < self._next_sync:
-                return
+        if self.instrumentation is None:
+            with self._semaphore:
+                self._sync_locked(force)
+        else:
+            waiting_since = perf_counter()
+            with self._semaphore:
+                self.instrumentation.on_lock_wait(perf_counter() - waiting_since)
+                self._sync_locked(force)
+
+    def _sync_locked(self, force: bool) -> None:
+        """Syncs the cache with the storage, must be called with the semaphore."""
+        now = self._time_fn()
+
+        if not force and now < self._next_sync:
+            return
+
+        # A client built from a snapshot serves its flags until a first successful sync.
+        has_flags = self._synced_at is not None or self._bootstrapped
+        breaker = self.circuit_breaker
+        if not breaker.allow(now):
+            if not has_flags:
+                raise CircuitOpenError("Flypper's storage keeps failing") from breaker.last_error
+            return
+
+        # Get the latest flags updates from the backend.
+        try:
+            new_flags, new_segments = self._fetch()
+        except Exception as error:
+            retry_at = breaker.record_failure(now, error)
+            if not has_flags:
+                raise
+            # Space out the next syncs, the requests serving the last known flags meanwhile.
+            self._next_sync = max(retry_at, now + self._ttl)
+            logger.exception("Flypper failed to sync, serving its last known flags")
+            return
+        breaker.record_success()
+        self._apply(new_flags, now, new_segments)
 
-            # Get the latest flags updates from the backend.
+    def _fetch(self) -> Tuple[List["Flag"], List["Segment"]]:
+        """Fetches the flags' and segments' updates, in a thread when syncs have a timeout."""
+        if self._sync_timeout is None:
+            return self._list(), self._list_segments()
+
+        pending_fetch = self._pending_fetch
+        if pending_fetch is not None and not pending_fetch.done():
+            raise SyncTimeoutError("Flypper's previous sync is still running")
+
+        future = self._fetcher.submit(lambda: (self._list(), self._list_segments()))
+        self._pending_fetch = future
+        try:
+            return future.result(timeout=self._sync_timeout)
+        except FutureTimeoutError:
+            raise SyncTimeoutError(f"Flypper's sync took more than {self._sync_timeout} seconds")
+
+    def _list(self) -> List["Flag"]:
+        """Lists the updates since the last sync, reporting to the instrumentation."""
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return self._storage.list(version__gt=self._last_version)
+
+        started_at = perf_counter()
+        try:
             new_flags = self._storage.list(version__gt=self._last_version)
+        except Exception:
+            instrumentation.on_sync_error(perf_counter() - started_at)
+            raise
+        instrumentation.on_sync(perf_counter() - started_at, len(new_flags))
+        return new_flags
+
+    def _list_segments(self) -> List["Segment"]:
+        """Lists the segments' updates since the last sync, if the storage holds segments."""
+        if not self._storage.supports_segments:
+            return []
+        return self._storage.list_segments(version__gt=self._last_segment_version)
+
+    def _apply(self, new_flags: List["Flag"], now: float, new_segments: Sequence["Segment"] = ()) -> None:
+        """Applies the updates fetched at the given time, must be called with the semaphore."""
+        # Updates fetched without the semaphore may already be applied.
+        if isinstance(new_flags, FullListing):
+            if new_flags.version < self._last_version:
+                new_flags = []
+        else:
+            new_flags = [flag for flag in new_flags if flag.version > self._last_version]
+        new_segments = [segment for segment in new_segments if segment.version > self._last_segment_version]
+
+        if new_segments:
+            # Publish the segments first: readers of the new flags find the segments they use.
+            self._segments = apply_updates(self._segments, new_segments)
+            self._last_segment_version = max(segment.version for segment in new_segments)
+
+        if new_flags or isinstance(new_flags, FullListing):
+            # Publish the new flags at once, readers may not hold the lock.
+            self._flags = apply_updates(self._flags, new_flags)
+            self.ordering_cache.clear()
 
-            if new_flags:
-                # Don't directly update the _flags, create a copy so the running contexts
-                # can operate using the reference of the outdated copy they might have.
-                self._flags = self._flags.copy()
+            # Keep track of the latest version we received.
+            self._last_version = synced_version(new_flags)
 
-                # Update the cached flags with their latest version.
-                for new_flag in new_flags:
-                    if new_flag.is_deleted:
-                        del self._flags[new_flag.name]
+        # Compute the minimum time the next sync could occur.
+        self._next_sync = now + self._ttl
+        self._synced_at = now
+
+    def _refresh_loop(self, stop_event: Event, wake_event: Event) -> None:
+        """Syncs with the storage every refresh interval, or as soon as it changes, until stopped."""
+        watching = self._watch and self._storage.supports_watch
+        while not stop_event.is_set():
+            try:
+                if watching and self.circuit_breaker.state != CLOSED:
+                    # Poll the failing storage, the circuit breaker spacing out the retries.
+                    if not stop_event.wait(self._refresh_interval):
+                        self._sync(force=True)
+                elif watching:
+                    watch_started_at = monotonic()
+                    new_flags = self._watch_storage(stop_event, wake_event)
+                    if new_flags is None:
+                        return
+                    if not new_flags:
+                        # The watch returned early without updates: don't watch again right away.
+                        elapsed = monotonic() - watch_started_at
+                        if elapsed < self._refresh_interval and stop_event.wait(self._refresh_interval - elapsed):
+                            return
+                    if self._storage.supports_segments:
+                        # The updates may be the segments': sync both.
+                        self._sync(force=True)
                     else:
-                        self._flags[new_flag.name] = new_flag
+                        with self._semaphore:
+                            self._apply(new_flags, self._time_fn())
+                elif not stop_event.wait(self._refresh_interval):
+                    self._sync(force=True)
+            except Exception:
+                logger.exception("Flypper failed to refresh its flags in the background")
+                stop_event.wait(self._refresh_interval)
+
+    def _watch_storage(self, stop_event: Event, wake_event: Event) -> Optional[List["Flag"]]:
+        """Waits for the storage's next updates, from the watch thread, None if stopped meanwhile."""
+        if self._storage.supports_segments:
+            # Flags and segments have their own versions: wait for an update of either of them.
+            version__gt = max(self._last_version, self._last_segment_version)
+        else:
+            version__gt = self._last_version
+
+        # Stopping sets the stop event, then the wake event: check it once the wake event is cleared.
+        wake_event.clear()
+        if stop_event.is_set():
+            return None
+        future = self._watcher.submit(lambda: self._storage.watch(version__gt=version__gt, timeout=self._refresh_interval))
+        future.add_done_callback(lambda _: wake_event.set())
+        wake_event.wait()
+        if stop_event.is_set():
+            return None
+        try:
+            new_flags = future.result()
+        except Exception as error:
+            # Open the circuit like failed syncs do: the loop then polls with a backoff.
+            with self._semaphore:
+                self.circuit_breaker.record_failure(self._time_fn(), error)
+            raise
+        with self._semaphore:
+            self.circuit_breaker.record_success()
+        return new_flags
+
+    def _after_fork(self) -> None:
+        """Resets the synchronization primitives and threads, that don't survive a fork.
+
+        The background refresh restarts on the next read of the flags: the fork hook
+        doesn't call the storage."""
+        self._semaphore = Semaphore()
+        self._start_lock = Lock()
+        self._pending_fetch = None
+        self._watcher = _Worker("flypper-watch")
+        self._fetcher = _Worker("flypper-sync")
+        if self._refresher is not None:
+            self._refresher = None
+            self._restart_after_fork = True
+
+# The clients to reset in forked processes, through a single fork hook.
+_clients: "weakref.WeakSet[Client]" = weakref.WeakSet()
 
-                # Keep track of the latest version we received.
-                self._last_version = max(flag.version for flag in new_flags)
+def _after_fork_in_child() -> None:
+    for client in list(_clients):
+        client._after_fork()
 
-            # Compute the minimum time the next sync could occur.
-            self._next_sync = now + self._ttl
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
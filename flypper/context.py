@@ -1,8 +1,16 @@
-from typing import Dict, Optional, TYPE_CHECKING
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple, Union, TYPE_CHECKING, cast
+
+from flypper.payload import FlagsPayload
 
 if TYPE_CHECKING:
+    from flypper.async_client import AsyncClient
     from flypper.client import Client
     from flypper.entities.flag import Flag
+    from flypper.entities.segment import Segment
+    from flypper.metrics import Instrumentation
+    from flypper.payload import OrderingCache
+    from flypper.snapshot import SnapshotClient
+    from flypper.usage import UsageTracker
 
 class Context:
     """Context allows to retrieve flags consistently across its lifetime.
@@ -12,25 +20,107 @@ class Context:
 
     It also stores a list of context's entries to use when checking flags,
     so we don't have to pass them everywhere.
+
+    The flags can also be given upfront, in which case the client is never called.
+    This is how contexts are built from an AsyncClient, their checks staying synchronous.
+
+    Whether an actor is part of a segment is only checked once per context,
+    however many flags are enabled for that segment.
     """
 
-    def __init__(self, client: "Client", entries: Dict[str, str] = {}):
-        self._client: "Client" = client
+    def __init__(
+        self,
+        client: Union["Client", "AsyncClient", "SnapshotClient"],
+        entries: Dict[str, str] = {},
+        flags: Optional[Mapping[str, "Flag"]] = None,
+        segments: Optional[Mapping[str, "Segment"]] = None,
+    ):
+        self._client: Union["Client", "AsyncClient", "SnapshotClient"] = client
         self._common_entries: Dict[str, str] = entries.copy()
-        self._synced: bool = False
-        self._flags_cache: Dict[str, "Flag"] = {}
+        self._bucket: Callable[[str], int] = client.bucket
+        self._ordering_cache: "OrderingCache" = client.ordering_cache
+        self._usage_tracker: Optional["UsageTracker"] = client.usage_tracker
+        self._instrumentation: Optional["Instrumentation"] = client.instrumentation
+        self._synced: bool = flags is not None
+        self._flags_cache: Mapping[str, "Flag"] = flags if flags is not None else {}
+        self._segments_cache: Mapping[str, "Segment"] = segments if segments is not None else {}
+        self._segment_memberships: Dict[Tuple[str, Optional[str]], bool] = {}
+        # The evaluations of evaluate_all, by the names given, None for all the flags.
+        self._payloads: Dict[Optional[Tuple[str, ...]], FlagsPayload] = {}
 
     def is_enabled(self, flag_name: str, **entries: str) -> bool:
         """Checks if a flag is enabled given the context's entries.
 
         Also takes a list of entries to override the context's ones."""
         flag = self._flags().get(flag_name, None)
-        return bool(flag and flag.is_enabled(**self._common_entries, **entries))
+        if flag is None:
+            return False
+
+        enabled = flag.evaluate({**self._common_entries, **entries}, self._bucket, self._in_segment)
+        if self._usage_tracker is not None:
+            self._usage_tracker.record(flag_name, enabled)
+        if self._instrumentation is not None:
+            self._instrumentation.on_evaluation(flag_name, enabled)
+        return enabled
 
     def is_disabled(self, flag_name: str, **entries: str) -> bool:
         """Does the opposite of is_enabled: checks if a flag is disabled, given the context's entries."""
         return not self.is_enabled(flag_name=flag_name, **entries)
 
+    def evaluate_many(
+        self,
+        flag_name: str,
+        actor_key: str,
+        actor_ids: Iterable[str],
+        entries: Optional[Mapping[str, str]] = None,
+    ) -> List[bool]:
+        """Checks a flag for many actors at once, given the context's entries and the extra ones.
+
+        Returns one boolean per actor id, each actor id being used as the actor_key entry."""
+        flag = self._flags().get(flag_name, None)
+        if flag is None:
+            return [False for _ in actor_ids]
+        all_entries = {**self._common_entries, **entries} if entries else self._common_entries
+        if flag.segment_names:
+            return [
+                flag.evaluate({**all_entries, actor_key: actor_id}, self._bucket, self._in_segment)
+                for actor_id in actor_ids
+            ]
+        return flag.evaluate_many(actor_key, actor_ids, all_entries)
+
+    def evaluate_all(self, names: Optional[Iterable[str]] = None) -> Dict[str, bool]:
+        """Checks many flags at once, all of them by default, given the context's entries.
+
+        Missing flags are disabled. The evaluations are memoized until the context's
+        entries change, and aren't reported to the usage tracker nor the instrumentation:
+        evaluating all the flags doesn't tell which ones are used."""
+        return self.payload(names).to_dict()
+
+    def payload(self, names: Optional[Iterable[str]] = None) -> FlagsPayload:
+        """Same as evaluate_all, as a compact FlagsPayload to embed in pages.
+
+        Without names, the flags are ordered by name."""
+        key = tuple(names) if names is not None else None
+        payload = self._payloads.get(key, None)
+        if payload is not None:
+            return payload
+
+        # A single pass, without merging the entries for each flag.
+        entries, bucket, in_segment = self._common_entries, self._bucket, self._in_segment
+        flags = self._flags()
+        if key is None:
+            ordered_names, ordered_flags, version = self._ordering_cache.get(flags)
+            evaluations = [flag.evaluate(entries, bucket, in_segment) for flag in ordered_flags]
+        else:
+            ordered_names, version = key, None
+            evaluations = []
+            for name in ordered_names:
+                flag = flags.get(name, None)
+                evaluations.append(flag is not None and flag.evaluate(entries, bucket, in_segment))
+
+        payload = self._payloads[key] = FlagsPayload.from_evaluations(ordered_names, evaluations, version)
+        return payload
+
     #
     # Use [] to get and set the context's entries
     #
@@ -40,6 +130,7 @@ class Context:
 
     def __setitem__(self, entry_name, entry_value) -> None:
         self._common_entries[entry_name] = entry_value
+        self._payloads.clear()
 
     #
     # Use the context as a context manager
@@ -51,9 +142,24 @@ class Context:
     def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
         pass
 
-    def _flags(self) -> Dict[str, "Flag"]:
+    def _flags(self) -> Mapping[str, "Flag"]:
         """Retrieves all flags from the client once then keep returning them."""
         if not self._synced:
-            self._flags_cache = self._client.flags()
+            # Contexts built from an AsyncClient are always given their flags.
+            client = cast("Union[Client, SnapshotClient]", self._client)
+            self._flags_cache = client.flags()
+            self._segments_cache = client.segments()
             self._synced = True
         return self._flags_cache
+
+    def _in_segment(self, segment_name: str, entries: Mapping[str, str]) -> bool:
+        """Tells if the entries' actor is part of the segment, memoized by actor id."""
+        segment = self._segments_cache.get(segment_name, None)
+        if segment is None:
+            return False
+
+        key = (segment_name, entries.get(segment.actor_key, None))
+        in_segment = self._segment_memberships.get(key, None)
+        if in_segment is None:
+            in_segment = self._segment_memberships[key] = segment.contains(entries)
+        return in_segment
@@ -0,0 +1,265 @@
+import base64
+import operator
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain
+from math import log
+from typing import Collection, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING, cast
+
+if TYPE_CHECKING:
+    from flypper.entities.flag import _EnabledForActors
+
+# Lists of actor ids at least this long are compiled into an ActorIdSet,
+# and packed by pack_actor_ids. Shorter ones are faster as the keys of a dict,
+# that keep the list's order and are smaller than a frozenset.
+COMPACT_THRESHOLD = 10_000
+# Lists of at most this many actor ids are compiled into tuples, several times
+# smaller than dicts and as fast to search.
+SMALL_THRESHOLD = 8
+BLOOM_BITS_PER_ID = 10
+
+_COUNT = struct.Struct("<I")
+# Every _BLOCK_SIZE-th id is kept as a bytes object, bisected at C speed, so the
+# binary search in Python only happens within a block.
+_BLOCK_SIZE = 32
+
+class ActorIdSet(Collection[str]):
+    """ActorIdSet is an immutable set of actor ids, compact in memory.
+
+    The ids are sorted and deduplicated, then stored back to back in a single
+    bytes object, along with an array of their offsets. Membership tests use a
+    binary search over them, where a frozenset would hold a str object and a
+    hash table slot per id. It takes about 5 times less memory than a frozenset,
+    for lookups in the microseconds instead of the tenths of microseconds.
+
+    With bloom_bits_per_id, a Bloom filter of that many bits per id answers
+    most of the membership tests of missing ids without searching: 10 bits per
+    id let about 1% of them through. It makes the lookups of present ids slower.
+
+    The set can be packed into a compressed string that storages can persist,
+    see pack_actor_ids.
+    """
+
+    __slots__ = ("_blob", "_offsets", "_index", "_bloom", "_bloom_mask", "_bloom_hashes")
+
+    def __init__(self, actor_ids: Iterable[str] = (), bloom_bits_per_id: int = 0):
+        encoded_ids = sorted({actor_id.encode("utf-8") for actor_id in actor_ids})
+        self._blob: bytes = b"".join(encoded_ids)
+        self._offsets: "array[int]" = array("I", accumulate([0] + [len(encoded_id) for encoded_id in encoded_ids]))
+        self._build_index()
+        self._build_bloom(bloom_bits_per_id)
+
+    @classmethod
+    def unpack(cls, packed: str, bloom_bits_per_id: int = 0) -> "ActorIdSet":
+        """Builds a set back from its packed form, see pack."""
+        payload = zlib.decompress(base64.b64decode(packed))
+        (count,) = _COUNT.unpack_from(payload)
+        lengths = array("I")
+        lengths_end = _COUNT.size + count * lengths.itemsize
+        lengths.frombytes(payload[_COUNT.size:lengths_end])
+        if sys.byteorder == "big":
+            lengths.byteswap()
+        return cls._from_parts(payload[lengths_end:], lengths, bloom_bits_per_id)
+
+    @classmethod
+    def _from_parts(cls, blob: bytes, lengths: "array[int]", bloom_bits_per_id: int) -> "ActorIdSet":
+        actor_id_set: "ActorIdSet" = cls.__new__(cls)
+        actor_id_set._blob = blob
+        actor_id_set._offsets = array("I", accumulate(chain((0,), lengths)))
+        actor_id_set._build_index()
+        actor_id_set._build_bloom(bloom_bits_per_id)
+        return actor_id_set
+
+    def pack(self) -> str:
+        """Packs the set into a compressed, ASCII only, string."""
+        lengths = self._lengths()
+        if sys.byteorder == "big":
+            lengths.byteswap()
+        payload = _COUNT.pack(len(self)) + lengths.tobytes() + self._blob
+        return base64.b64encode(zlib.compress(payload, 9)).decode("ascii")
+
+    def evolve(
+        self,
+        added: Iterable[str] = (),
+        removed: Iterable[str] = (),
+        bloom_bits_per_id: int = 0,
+    ) -> "ActorIdSet":
+        """Returns a new set with the added ids, then without the removed ones.
+
+        The ids already sorted are spliced around the few changed ones, instead of
+        being sorted again: adding or removing k ids costs k binary searches and
+        copies of the blob's parts."""
+        removed_keys = {actor_id.encode("utf-8") for actor_id in removed}
+        added_keys = {actor_id.encode("utf-8") for actor_id in added} - removed_keys
+        blob, offsets, lengths = self._blob, self._offsets, self._lengths()
+
+        # Edits by position, an addition going before the removal at the same position.
+        edits: List[Tuple[int, bool, bytes]] = []
+        for key in chain(added_keys, removed_keys):
+            position = self._bisect_left(key)
+            present = position < len(self) and blob[offsets[position]:offsets[position + 1]] == key
+            if present != (key in added_keys):
+                edits.append((position, present, key))
+        edits.sort()
+
+        blob_parts: List[bytes] = []
+        new_lengths: "array[int]" = array("I")
+        start = 0
+        for position, is_removal, key in edits:
+            blob_parts.append(blob[offsets[start]:offsets[position]])
+            new_lengths.extend(lengths[start:position])
+            if is_removal:
+                start = position + 1
+            else:
+                blob_parts.append(key)
+                new_lengths.append(len(key))
+                start = position
+        blob_parts.append(blob[offsets[start]:])
+        new_lengths.extend(lengths[start:])
+        return ActorIdSet._from_parts(b"".join(blob_parts), new_lengths, bloom_bits_per_id)
+
+    def __contains__(self, actor_id: object) -> bool:
+        if not isinstance(actor_id, str):
+            return False
+        if self._bloom is not None and not self._might_contain(actor_id):
+            return False
+
+        key = actor_id.encode("utf-8")
+        block = bisect_right(self._index, key) - 1
+        if block < 0:
+            return False
+
+        # Search the last id lower than or equal to the key, within the block.
+        blob, offsets = self._blob, self._offsets
+        low = block * _BLOCK_SIZE
+        high = min(low + _BLOCK_SIZE, len(offsets) - 1) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if blob[offsets[middle]:offsets[middle + 1]] <= key:
+                low = middle
+            else:
+                high = middle - 1
+        return blob[offsets[low]:offsets[low + 1]] == key
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterates over the ids, sorted by their UTF-8 encoding."""
+        blob, offsets = self._blob, self._offsets
+        for index in range(len(offsets) - 1):
+            yield blob[offsets[index]:offsets[index + 1]].decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ActorIdSet):
+            return self._blob == other._blob and self._offsets == other._offsets
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self._blob)
+
+    def __repr__(self) -> str:
+        return f"ActorIdSet({list(self)!r})"
+
+    def _lengths(self) -> "array[int]":
+        offsets = self._offsets
+        return array("I", map(operator.sub, offsets[1:], offsets[:-1]))
+
+    def _bisect_left(self, key: bytes) -> int:
+        """Returns the position of the first id greater than or equal to the key."""
+        block = max(bisect_left(self._index, key) - 1, 0)
+        blob, offsets = self._blob, self._offsets
+        low = block * _BLOCK_SIZE
+        high = min(low + _BLOCK_SIZE, len(offsets) - 1)
+        while low < high:
+            middle = (low + high) // 2
+            if blob[offsets[middle]:offsets[middle + 1]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _build_index(self) -> None:
+        blob, offsets = self._blob, self._offsets
+        self._index: List[bytes] = [
+            blob[offsets[index]:offsets[index + 1]]
+            for index in range(0, len(offsets) - 1, _BLOCK_SIZE)
+        ]
+
+    def _build_bloom(self, bits_per_id: int) -> None:
+        self._bloom: Optional[bytearray] = None
+        self._bloom_mask: int = 0
+        self._bloom_hashes: int = 0
+        if bits_per_id <= 0 or len(self) == 0:
+            return
+
+        bit_count = 64
+        while bit_count < len(self) * bits_per_id:
+            bit_count = bit_count * 2
+        self._bloom = bytearray(bit_count // 8)
+        self._bloom_mask = bit_count - 1
+        # Fewer hashes than optimal: each one is costly in Python, and 4 of them
+        # only let 1.2% of the missing ids through instead of 0.8% with 10 bits per id.
+        self._bloom_hashes = max(1, min(round(bits_per_id * log(2)), 4))
+        for actor_id in self:
+            for bit in self._bloom_bits(actor_id):
+                self._bloom[bit >> 3] |= 1 << (bit & 7)
+
+    def _bloom_bits(self, actor_id: str) -> Iterator[int]:
+        # The filter only lives in this process: hash() being seeded per process is fine.
+        actor_hash = hash(actor_id) & 0xFFFF_FFFF_FFFF_FFFF
+        bit = actor_hash & 0xFFFF_FFFF
+        step = (actor_hash >> 32) | 1
+        mask = self._bloom_mask
+        for _ in range(self._bloom_hashes):
+            yield bit & mask
+            bit = bit + step
+
+    def _might_contain(self, actor_id: str) -> bool:
+        """Same as checking all the _bloom_bits, inlined since it runs on each lookup."""
+        bloom = cast(bytearray, self._bloom)
+        actor_hash = hash(actor_id) & 0xFFFF_FFFF_FFFF_FFFF
+        bit = actor_hash & 0xFFFF_FFFF
+        step = (actor_hash >> 32) | 1
+        mask = self._bloom_mask
+        for _ in range(self._bloom_hashes):
+            masked_bit = bit & mask
+            if not bloom[masked_bit >> 3] & (1 << (masked_bit & 7)):
+                return False
+            bit = bit + step
+        return True
+
+def compile_actor_ids(enabled_for_actors: "_EnabledForActors") -> Collection[str]:
+    """Builds the set of actor ids to check from a flag's data, packed or not.
+
+    Long lists of ids become an ActorIdSet with a Bloom filter, short ones the keys of
+    a dict, and the shortest ones a tuple: both keep the ids in their original order."""
+    packed = enabled_for_actors.get("packed_actor_ids", None)
+    if packed is not None:
+        return ActorIdSet.unpack(packed, bloom_bits_per_id=BLOOM_BITS_PER_ID)
+
+    actor_ids = enabled_for_actors.get("actor_ids", None) or []
+    if len(actor_ids) >= COMPACT_THRESHOLD:
+        return ActorIdSet(actor_ids, bloom_bits_per_id=BLOOM_BITS_PER_ID)
+    if len(actor_ids) <= SMALL_THRESHOLD:
+        return tuple(dict.fromkeys(actor_ids))
+    return dict.fromkeys(actor_ids).keys()
+
+def pack_actor_ids(
+    enabled_for_actors: "_EnabledForActors",
+    threshold: int = COMPACT_THRESHOLD,
+) -> "_EnabledForActors":
+    """Replaces a list of at least threshold actor ids by its packed form.
+
+    The packed form is much smaller than the list, for storages to persist and
+    for clients to sync. Lists shorter than the threshold are left as they are."""
+    actor_ids = enabled_for_actors.get("actor_ids", None)
+    if actor_ids is None or len(actor_ids) < threshold:
+        return enabled_for_actors
+    return {
+        "actor_key": enabled_for_actors["actor_key"],
+        "packed_actor_ids": ActorIdSet(actor_ids).pack(),
+    }
@@ -1,71 +1,283 @@
+from copy import deepcopy
 from hashlib import md5
-from typing import Dict, List, Optional
+from sys import intern
+from typing import Any, Callable, Collection, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple, cast
 from typing_extensions import TypedDict
 
-class _EnabledForActors(TypedDict):
+from flypper.entities.actor_ids import compile_actor_ids
+from flypper.entities.rules import Predicate, Rule, compile_rules, rule_entries
+
+class _EnabledForActorsKey(TypedDict):
     actor_key: str
+
+class _EnabledForActors(_EnabledForActorsKey, total=False):
+    # Either the list of actor ids, or its packed form, see pack_actor_ids.
     actor_ids: List[str]
+    packed_actor_ids: str
 
 class _EnabledForPercentageOfActors(TypedDict):
     actor_key: str
     percentage: float
 
-class UnversionedFlagData(TypedDict):
+class _UnversionedFlagDataKeys(TypedDict):
     name: str
     deleted: bool
     enabled: bool
     enabled_for_actors: Optional[_EnabledForActors]
     enabled_for_percentage_of_actors: Optional[_EnabledForPercentageOfActors]
 
+class UnversionedFlagData(_UnversionedFlagDataKeys, total=False):
+    # The names of the segments the flag is enabled for, the actor must be in one of them.
+    enabled_for_segments: Optional[List[str]]
+    # Conditions on the entries, that must all match, see flypper.entities.rules.
+    rules: Optional[List[Rule]]
+
 class FlagData(UnversionedFlagData):
     updated_at: float
     version: int
 
+# The keys of the data the flag compiles, the other ones are kept as they are.
+_DATA_KEYS = frozenset(FlagData.__annotations__)
+
+def actor_bucket(actor_id: str) -> int:
+    """Computes the bucket, from 0 to 9999, an actor falls in for percentage rollouts.
+
+    The bucket only depends on the actor's id, not on the flag."""
+    actor_md5 = md5(actor_id.encode("utf-8")).digest()
+    return int.from_bytes(actor_md5, "big") % 100_00
+
+def _bucket_threshold(percentage: float) -> int:
+    """Finds the highest bucket enabled by the given percentage.
+
+    A bucket is enabled when bucket / 100.00 <= percentage, so comparing
+    buckets against this threshold gives the exact same results."""
+    if not percentage >= 0.00:
+        return -1
+    threshold = min(int(min(percentage, 100.00) * 100), 100_00 - 1)
+    while threshold < 100_00 - 1 and (threshold + 1) / 100.00 <= percentage:
+        threshold = threshold + 1
+    while threshold >= 0 and threshold / 100.00 > percentage:
+        threshold = threshold - 1
+    return threshold
+
 class Flag:
+    """Flag holds a flag's data and evaluates it against some entries.
+
+    The rules held in the data are compiled once, when the flag is built,
+    so checking a flag doesn't need to read the data again. Building a flag
+    with invalid rules, or segments, raises a ValueError.
+
+    Flags are immutable and compact, processes can hold millions of them: they
+    don't keep their data, only what evaluating them needs, in slots. Names and
+    actor keys are interned, so the flags and their versions share them.
+
+    The data is rebuilt on each access, for the web UI and the storages writing it:
+    read it once rather than in a loop. It is the data the flag was built from,
+    except for the lists of actor ids: they come back deduplicated, and sorted
+    too when they hold at least COMPACT_THRESHOLD ids, only kept in an ActorIdSet.
+    """
+
+    __slots__ = (
+        "name",
+        "is_deleted",
+        "version",
+        "updated_at",
+        "_enabled",
+        "_enabled_in_data",
+        "_segment_names",
+        "_rules_data",
+        "_rules",
+        "_rule_entries",
+        "_actors_key",
+        "_actor_ids",
+        "_packed_actor_ids",
+        "_percentage_data",
+        "_percentage_key",
+        "_bucket_threshold",
+        "_extra_data",
+    )
+
     def __init__(self, data: FlagData):
-        self.data: FlagData = data.copy()
-        self.name: str = self.data["name"]
-        self.is_deleted: bool = self.data["deleted"]
-        self.version: int = self.data["version"]
+        self.name: str = intern(data["name"])
+        self.is_deleted: bool = data["deleted"]
+        self.version: int = data["version"]
+        self.updated_at: float = data["updated_at"]
+        self._compile(data)
+
+    @property
+    def data(self) -> FlagData:
+        """The flag's data, rebuilt on each access."""
+        enabled_for_actors: Optional[_EnabledForActors] = None
+        if self._actors_key is not None:
+            if self._packed_actor_ids is not None:
+                enabled_for_actors = {"actor_key": self._actors_key, "packed_actor_ids": self._packed_actor_ids}
+            else:
+                enabled_for_actors = {"actor_key": self._actors_key, "actor_ids": list(self._actor_ids)}
+
+        percentage_data = self._percentage_data
+        data: FlagData = {
+            "name": self.name,
+            "deleted": self.is_deleted,
+            "enabled": self._enabled_in_data,
+            "enabled_for_actors": enabled_for_actors,
+            "enabled_for_percentage_of_actors": {
+                "actor_key": percentage_data[0],
+                "percentage": percentage_data[1],
+            } if percentage_data is not None else None,
+            "updated_at": self.updated_at,
+            "version": self.version,
+        }
+        if self._segment_names:
+            data["enabled_for_segments"] = list(self._segment_names)
+        if self._rules_data is not None:
+            # The flag keeps the rules it was built from: give a copy away, so it stays immutable.
+            data["rules"] = deepcopy(self._rules_data)
+        if self._extra_data is not None:
+            data = cast(FlagData, {**self._extra_data, **data})
+        return data
+
+    @property
+    def actor_ids(self) -> Collection[str]:
+        """The ids of the actors the flag is enabled for, whether the data is packed or not."""
+        return self._actor_ids
 
     def is_enabled(self, **entries: str) -> bool:
-        return (
-            self.is_deleted is False
-            and self.data["enabled"]
-            and self._is_enabled_for_actors(entries)
-            and self._is_enabled_for_percentage_of_actors(entries)
-        )
+        return self.evaluate(entries)
 
-    def _is_enabled_for_actors(self, entries: Dict[str, str]) -> bool:
-        enabled_for_actors = self.data["enabled_for_actors"]
+    @property
+    def segment_names(self) -> Tuple[str, ...]:
+        """The names of the segments the flag is enabled for, empty if it isn't restricted to segments."""
+        return self._segment_names
 
-        if enabled_for_actors is None:
-            return True
+    def evaluate(
+        self,
+        entries: Mapping[str, str],
+        bucket: Callable[[str], int] = actor_bucket,
+        in_segment: Optional[Callable[[str, Mapping[str, str]], bool]] = None,
+    ) -> bool:
+        """Checks the flag against some entries.
 
-        actor_id = entries.get(enabled_for_actors["actor_key"], None)
+        The bucket function can be swapped, to cache the actors' buckets for instance.
+        Flags enabled for segments need in_segment, to tell if the entries are part
+        of a segment, given its name. Contexts memoize it."""
+        if not self._enabled:
+            return False
 
-        if actor_id is None:
+        if self._rules is not None and not self._rules(entries):
             return False
 
-        return actor_id in enabled_for_actors["actor_ids"]
+        if self._segment_names:
+            if in_segment is None or not any(
+                in_segment(segment_name, entries)
+                for segment_name in self._segment_names
+            ):
+                return False
 
-    def _is_enabled_for_percentage_of_actors(self, entries: Dict[str, str]) -> bool:
-        enabled_for_percentage_of_actors = self.data["enabled_for_percentage_of_actors"]
+        if self._actors_key is not None:
+            actor_id = entries.get(self._actors_key, None)
+            if actor_id is None or actor_id not in self._actor_ids:
+                return False
 
-        if enabled_for_percentage_of_actors is None:
-            return True
+        if self._percentage_key is not None:
+            actor_id = entries.get(self._percentage_key, None)
+            if actor_id is None or bucket(actor_id) > self._bucket_threshold:
+                return False
 
-        flag_percentage = enabled_for_percentage_of_actors["percentage"]
+        return True
 
-        if flag_percentage == 100.00:
-            return True
+    def evaluate_many(
+        self,
+        actor_key: str,
+        actor_ids: Iterable[str],
+        entries: Optional[Mapping[str, str]] = None,
+    ) -> List[bool]:
+        """Checks the flag for many actors at once, returning one boolean per actor id.
 
-        actor_id = entries.get(enabled_for_percentage_of_actors["actor_key"], None)
+        Each result is the same as is_enabled(**entries, **{actor_key: actor_id}),
+        but the checks that don't depend on the actor are only done once.
+        Like is_enabled, it doesn't know about segments: see Context.evaluate_many."""
+        actor_ids = list(actor_ids)
+        if entries is None:
+            entries = {}
 
-        if actor_id is None:
-            return False
+        if not self._enabled or self._segment_names:
+            return [False] * len(actor_ids)
+
+        mask = [True] * len(actor_ids)
+
+        if self._actors_key is not None:
+            if self._actors_key == actor_key:
+                allowed = self._actor_ids
+                mask = [actor_id in allowed for actor_id in actor_ids]
+            elif entries.get(self._actors_key, None) not in self._actor_ids:
+                return [False] * len(actor_ids)
+
+        if self._percentage_key is not None:
+            if self._percentage_key == actor_key:
+                threshold = self._bucket_threshold
+                mask = [
+                    enabled and actor_bucket(actor_id) <= threshold
+                    for enabled, actor_id in zip(mask, actor_ids)
+                ]
+            else:
+                actor_id = entries.get(self._percentage_key, None)
+                if actor_id is None or actor_bucket(actor_id) > self._bucket_threshold:
+                    return [False] * len(actor_ids)
+
+        if self._rules is not None:
+            rules = self._rules
+            if actor_key in self._rule_entries:
+                mask = [
+                    enabled and rules({**entries, actor_key: actor_id})
+                    for enabled, actor_id in zip(mask, actor_ids)
+                ]
+            elif not rules(entries):
+                return [False] * len(actor_ids)
+
+        return mask
+
+    def _compile(self, data: FlagData) -> None:
+        """Precomputes what is_enabled needs from the flag's data."""
+        self._enabled_in_data: bool = bool(data["enabled"])
+        self._enabled: bool = self.is_deleted is False and self._enabled_in_data
+
+        segment_names = data.get("enabled_for_segments", None)
+        if segment_names is not None and (
+            not isinstance(segment_names, list)
+            or not all(isinstance(segment_name, str) for segment_name in segment_names)
+        ):
+            raise ValueError(f"The segments must be a list of names, not {segment_names!r}")
+        self._segment_names: Tuple[str, ...] = tuple(intern(segment_name) for segment_name in segment_names or ())
+
+        rules = data.get("rules", None) or None
+        self._rules_data: Optional[List[Rule]] = rules
+        self._rules: Optional[Predicate] = compile_rules(rules)
+        self._rule_entries: FrozenSet[str] = rule_entries(rules)
+
+        enabled_for_actors = data["enabled_for_actors"]
+        self._actors_key: Optional[str] = None
+        self._actor_ids: Collection[str] = ()
+        self._packed_actor_ids: Optional[str] = None
+        if enabled_for_actors is not None:
+            self._actors_key = intern(enabled_for_actors["actor_key"])
+            self._actor_ids = compile_actor_ids(enabled_for_actors)
+            # The packed form is a few bytes per actor: keep it, instead of packing it again for the data.
+            self._packed_actor_ids = enabled_for_actors.get("packed_actor_ids", None)
 
-        actor_md5 = md5(actor_id.encode("utf-8")).digest()
-        actor_percentage = (int.from_bytes(actor_md5, "big") % 100_00) / 100.00
+        enabled_for_percentage_of_actors = data["enabled_for_percentage_of_actors"]
+        self._percentage_data: Optional[Tuple[str, float]] = None
+        self._percentage_key: Optional[str] = None
+        self._bucket_threshold: int = 100_00 - 1
+        if enabled_for_percentage_of_actors is not None:
+            percentage_key = intern(enabled_for_percentage_of_actors["actor_key"])
+            percentage = enabled_for_percentage_of_actors["percentage"]
+            self._percentage_data = (percentage_key, percentage)
+            # A 100% rollout doesn't even require the actor to be present.
+            if percentage != 100.00:
+                self._percentage_key = percentage_key
+                self._bucket_threshold = _bucket_threshold(percentage)
 
-        return actor_percentage <= flag_percentage
+        extra_keys = data.keys() - _DATA_KEYS
+        self._extra_data: Optional[Dict[str, Any]] = None
+        if extra_keys:
+            self._extra_data = {key: cast(Mapping[str, Any], data)[key] for key in extra_keys}
@@ -0,0 +1,209 @@
+import operator
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from time import time
+from typing import Any, Callable, FrozenSet, List, Mapping, Optional, Tuple, Union
+from typing_extensions import TypedDict
+
+class Rule(TypedDict, total=False):
+    # Either all, or any, of the nested rules must match...
+    all: List["Rule"]
+    any: List["Rule"]
+    # ...or a condition on an entry, with the operator comparing it to the value or values.
+    # The time operators, after and before, compare the current time instead.
+    entry: str
+    operator: str
+    value: Union[str, float]
+    values: List[str]
+
+# Checks some entries, compiled from a rule.
+Predicate = Callable[[Mapping[str, str]], bool]
+
+_NO_ENTRIES: FrozenSet[str] = frozenset()
+
+_COMPARISONS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "gt": operator.gt,
+    "gte": operator.ge,
+}
+_SEMVER_COMPARISONS = {f"semver_{name}": compare for name, compare in _COMPARISONS.items()}
+_SEMVER = re.compile(r"v?(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?")
+
+OPERATORS: Tuple[str, ...] = (
+    *_COMPARISONS,
+    "in",
+    "not_in",
+    *_SEMVER_COMPARISONS,
+    "after",
+    "before",
+)
+
+def compile_rules(rules: Optional[List[Rule]], time_fn: Callable[[], float] = time) -> Optional[Predicate]:
+    """Compiles a flag's rules, that must all match, into a single predicate. None without rules.
+
+    Conditions on an entry missing from the entries never match, whatever their operator.
+    Raises a ValueError when a rule is invalid."""
+    if not rules:
+        return None
+    if not isinstance(rules, list):
+        raise ValueError("Rules must be a list")
+    if len(rules) == 1:
+        return compile_rule(rules[0], time_fn)
+    return compile_rule({"all": rules}, time_fn)
+
+def compile_rule(rule: Rule, time_fn: Callable[[], float] = time) -> Predicate:
+    """Compiles a rule into a predicate, so checking it doesn't read the rule again."""
+    if not isinstance(rule, dict):
+        raise ValueError(f"Rules must be objects, not {rule!r}")
+
+    if "all" in rule or "any" in rule:
+        nested_rules = rule["all"] if "all" in rule else rule["any"]
+        if not isinstance(nested_rules, list) or not nested_rules:
+            raise ValueError("The all and any rules need a non-empty list of rules")
+        predicates = tuple(compile_rule(nested_rule, time_fn) for nested_rule in nested_rules)
+        return _all_of(predicates) if "all" in rule else _any_of(predicates)
+
+    operator_name = rule.get("operator", None)
+    if operator_name in ("after", "before"):
+        timestamp = _parse_time(rule.get("value", None))
+        return _time_after(timestamp, time_fn) if operator_name == "after" else _time_before(timestamp, time_fn)
+
+    entry = rule.get("entry", None)
+    if not isinstance(entry, str):
+        raise ValueError(f"The {operator_name} operator needs an entry")
+
+    if operator_name in ("in", "not_in"):
+        values = rule.get("values", None)
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            raise ValueError(f"The {operator_name} operator needs a list of string values")
+        return _is_in(entry, frozenset(values), expected=operator_name == "in")
+
+    if operator_name in _COMPARISONS:
+        value = rule.get("value", None)
+        if isinstance(value, str):
+            return _compare_strings(entry, _COMPARISONS[operator_name], value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return _compare_numbers(entry, _COMPARISONS[operator_name], float(value))
+        raise ValueError(f"The {operator_name} operator needs a string or number value")
+
+    if operator_name in _SEMVER_COMPARISONS:
+        value = rule.get("value", None)
+        version = _semver_key(value) if isinstance(value, str) else None
+        if version is None:
+            raise ValueError(f"The {operator_name} operator needs a semantic version value, not {value!r}")
+        return _compare_semvers(entry, _SEMVER_COMPARISONS[operator_name], version)
+
+    raise ValueError(f"Unknown rule operator: {operator_name!r}")
+
+def rule_entries(rules: Optional[List[Rule]]) -> FrozenSet[str]:
+    """Lists the entries the rules check."""
+    if not rules:
+        return _NO_ENTRIES
+    entries = set()
+    pending = list(rules or [])
+    while pending:
+        rule = pending.pop()
+        pending.extend(rule.get("all", None) or rule.get("any", None) or [])
+        if "entry" in rule:
+            entries.add(rule["entry"])
+    return frozenset(entries)
+
+#
+# Predicates, built once per rule. Checking them doesn't allocate, apart from parsing numbers.
+#
+
+def _all_of(predicates: Tuple[Predicate, ...]) -> Predicate:
+    def _check(entries: Mapping[str, str]) -> bool:
+        for predicate in predicates:
+            if not predicate(entries):
+                return False
+        return True
+    return _check
+
+def _any_of(predicates: Tuple[Predicate, ...]) -> Predicate:
+    def _check(entries: Mapping[str, str]) -> bool:
+        for predicate in predicates:
+            if predicate(entries):
+                return True
+        return False
+    return _check
+
+def _is_in(entry: str, values: FrozenSet[str], expected: bool) -> Predicate:
+    def _check(entries: Mapping[str, str]) -> bool:
+        value = entries.get(entry, None)
+        return value is not None and (value in values) is expected
+    return _check
+
+def _compare_strings(entry: str, compare: Callable[[Any, Any], bool], expected: str) -> Predicate:
+    def _check(entries: Mapping[str, str]) -> bool:
+        value = entries.get(entry, None)
+        return value is not None and compare(value, expected)
+    return _check
+
+def _compare_numbers(entry: str, compare: Callable[[Any, Any], bool], expected: float) -> Predicate:
+    def _check(entries: Mapping[str, str]) -> bool:
+        value = entries.get(entry, None)
+        if value is None:
+            return False
+        try:
+            return compare(float(value), expected)
+        except ValueError:
+            return False
+    return _check
+
+def _compare_semvers(entry: str, compare: Callable[[Any, Any], bool], expected: tuple) -> Predicate:
+    def _check(entries: Mapping[str, str]) -> bool:
+        value = entries.get(entry, None)
+        if value is None:
+            return False
+        version = _semver_key(value)
+        return version is not None and compare(version, expected)
+    return _check
+
+def _time_after(timestamp: float, time_fn: Callable[[], float]) -> Predicate:
+    def _check(entries: Mapping[str, str]) -> bool:
+        return time_fn() >= timestamp
+    return _check
+
+def _time_before(timestamp: float, time_fn: Callable[[], float]) -> Predicate:
+    def _check(entries: Mapping[str, str]) -> bool:
+        return time_fn() < timestamp
+    return _check
+
+# Apps only run a handful of versions at once: parse each of them once.
+@lru_cache(maxsize=1024)
+def _semver_key(version: str) -> Optional[tuple]:
+    """Builds a key ordering the versions as semantic versioning does, None if it isn't a version.
+
+    Missing minor and patch numbers are zeros. Pre-releases come before their release,
+    and their numeric identifiers before the other ones. Build metadata is ignored."""
+    match = _SEMVER.fullmatch(version.strip())
+    if match is None:
+        return None
+    major, minor, patch, prerelease = match.groups()
+    prerelease_key: tuple = (1,)
+    if prerelease is not None:
+        prerelease_key = (0, *(
+            (0, int(identifier), "") if identifier.isdigit() else (1, 0, identifier)
+            for identifier in prerelease.split(".")
+        ))
+    return (int(major), int(minor or 0), int(patch or 0), prerelease_key)
+
+def _parse_time(value: Any) -> float:
+    """Reads a UNIX timestamp, or an ISO 8601 date and time, UTC unless it has an offset."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            pass
+        else:
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            return moment.timestamp()
+    raise ValueError(f"The time operators need a timestamp or an ISO 8601 value, not {value!r}")
@@ -0,0 +1,45 @@
+from typing import Collection, Mapping
+from typing_extensions import TypedDict
+
+from flypper.entities.actor_ids import compile_actor_ids
+from flypper.entities.flag import _EnabledForActors
+
+class UnversionedSegmentData(TypedDict):
+    name: str
+    deleted: bool
+    actors: _EnabledForActors
+
+class SegmentData(UnversionedSegmentData):
+    updated_at: float
+    version: int
+
+class Segment:
+    """Segment is a named group of actors, that flags can be enabled for.
+
+    Many flags can target the same segment, instead of each of them holding
+    the same list of actor ids. Deleted segments are only tombstones, for
+    the clients' delta syncs.
+    """
+
+    def __init__(self, data: SegmentData):
+        self.data: SegmentData = data.copy()
+        self.name: str = self.data["name"]
+        self.is_deleted: bool = self.data["deleted"]
+        self.version: int = self.data["version"]
+        self.actor_key: str = self.data["actors"]["actor_key"]
+        self.actor_ids: Collection[str] = compile_actor_ids(self.data["actors"])
+
+    def contains(self, entries: Mapping[str, str]) -> bool:
+        """Tells if the actor of the entries is part of the segment."""
+        actor_id = entries.get(self.actor_key, None)
+        return actor_id is not None and actor_id in self.actor_ids
+
+def segment_tombstone(segment_name: str, version: int, updated_at: float) -> Segment:
+    """Builds the deleted segment storages keep for the clients' delta syncs."""
+    return Segment(data={
+        "name": segment_name,
+        "deleted": True,
+        "actors": {"actor_key": "", "actor_ids": []},
+        "updated_at": updated_at,
+        "version": version,
+    })
@@ -0,0 +1,14 @@
+from typing_extensions import TypedDict
+
+class FlagUsage(TypedDict):
+    enabled_count: int
+    disabled_count: int
+    last_evaluated_at: float
+
+def merge_usage(usage: FlagUsage, other: FlagUsage) -> FlagUsage:
+    """Adds up the counts of two usages of the same flag, keeping the latest evaluation time."""
+    return {
+        "enabled_count": usage["enabled_count"] + other["enabled_count"],
+        "disabled_count": usage["disabled_count"] + other["disabled_count"],
+        "last_evaluated_at": max(usage["last_evaluated_at"], other["last_evaluated_at"]),
+    }
@@ -0,0 +1,221 @@
+import logging
+from bisect import bisect_left
+from itertools import count
+from threading import Lock, Thread, current_thread, local
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple, TYPE_CHECKING
+from weakref import WeakValueDictionary, ref
+
+from flypper.circuit_breaker import CLOSED
+
+if TYPE_CHECKING:
+    from flypper.client import Client
+
+logger = logging.getLogger(__name__)
+
+class Instrumentation:
+    """Instrumentation receives callbacks about the clients' syncs and evaluations.
+
+    Every callback does nothing by default, subclasses override the ones they need.
+    A client without instrumentation doesn't call any of them.
+    """
+
+    def register_client(self, client: "Client") -> None:
+        """Called once by each client using this instrumentation."""
+        pass
+
+    def on_lock_wait(self, seconds: float) -> None:
+        """Called with the time a sync waited for another thread's sync to finish."""
+        pass
+
+    def on_sync(self, seconds: float, delta_size: int) -> None:
+        """Called with the time spent fetching updates from the storage, and their number."""
+        pass
+
+    def on_sync_error(self, seconds: float) -> None:
+        """Called with the time spent until fetching updates from the storage failed."""
+        pass
+
+    def on_evaluation(self, flag_name: str, enabled: bool) -> None:
+        """Called each time a context evaluates a flag."""
+        pass
+
+DURATION_BUCKETS: Tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS: Tuple[float, ...] = (0, 1, 10, 100, 1_000, 10_000, 100_000)
+
+class Histogram:
+    """Counts observations in cumulative buckets, like Prometheus histograms."""
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float]):
+        self.name: str = name
+        self.documentation: str = documentation
+        self._buckets: List[float] = sorted(buckets)
+        self._counts: List[int] = [0] * (len(self._buckets) + 1)
+        self._sum: float = 0.0
+        self._lock: Lock = Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        cumulative_count = 0
+        for bound, count in zip(self._buckets + [float("inf")], counts):
+            cumulative_count += count
+            lines.append(f'{self.name}_bucket{{le="{_format(bound)}"}} {cumulative_count}')
+        lines.append(f"{self.name}_sum {_format(total)}")
+        lines.append(f"{self.name}_count {cumulative_count}")
+        return lines
+
+class _EvaluationCounts:
+    """Counts the evaluations by result, each thread incrementing its own counters.
+
+    The counters of the threads that are gone are added up into a single one."""
+
+    def __init__(self):
+        self._local: local = local()
+        self._cells: List[Tuple["ref[Thread]", List[int]]] = []
+        self._finished_threads_cell: List[int] = [0, 0]
+        self._lock: Lock = Lock()
+
+    def increment(self, enabled: bool) -> None:
+        try:
+            cell: List[int] = self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0, 0]
+            with self._lock:
+                self._release_finished_threads()
+                self._cells.append((ref(current_thread()), cell))
+        cell[0 if enabled else 1] += 1
+
+    def totals(self) -> Tuple[int, int]:
+        with self._lock:
+            self._release_finished_threads()
+            cells = [self._finished_threads_cell] + [cell for _, cell in self._cells]
+        return sum(cell[0] for cell in cells), sum(cell[1] for cell in cells)
+
+    def _release_finished_threads(self) -> None:
+        """Moves the counts of the finished threads to a single cell, must be called with the lock."""
+        cells = []
+        for thread_ref, cell in self._cells:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                cells.append((thread_ref, cell))
+            else:
+                self._finished_threads_cell[0] += cell[0]
+                self._finished_threads_cell[1] += cell[1]
+        self._cells = cells
+
+class MetricsRegistry(Instrumentation):
+    """MetricsRegistry aggregates the callbacks into metrics, rendered in the Prometheus text format.
+
+    The FlypperWebUI can expose them, see its metrics argument. The clients' gauges are
+    labelled with their name, clients without one being numbered in registration order.
+    Rendering them queries the current_version of the storages supporting a cheap one,
+    to report how far behind each client is: the others' clients have no version lag.
+    """
+
+    def __init__(
+        self,
+        duration_buckets: Sequence[float] = DURATION_BUCKETS,
+        size_buckets: Sequence[float] = SIZE_BUCKETS,
+    ):
+        self.sync_duration: Histogram = Histogram(
+            "flypper_sync_duration_seconds",
+            "Time spent fetching updates from the storage.",
+            duration_buckets,
+        )
+        self.sync_error_duration: Histogram = Histogram(
+            "flypper_sync_error_duration_seconds",
+            "Time spent until fetching updates from the storage failed.",
+            duration_buckets,
+        )
+        self.lock_wait: Histogram = Histogram(
+            "flypper_sync_lock_wait_seconds",
+            "Time spent waiting for another thread's sync.",
+            duration_buckets,
+        )
+        self.delta_size: Histogram = Histogram(
+            "flypper_sync_delta_size",
+            "Number of flags updated by each sync.",
+            size_buckets,
+        )
+        self._evaluations: _EvaluationCounts = _EvaluationCounts()
+        self._clients: "WeakValueDictionary[str, Client]" = WeakValueDictionary()
+        self._client_numbers: Iterator[int] = count()
+        self._clients_lock: Lock = Lock()
+
+    def register_client(self, client: "Client") -> None:
+        """Registers a client under its name, raises a ValueError if another client has it."""
+        with self._clients_lock:
+            name = client.name if client.name is not None else str(next(self._client_numbers))
+            if self._clients.get(name, client) is not client:
+                raise ValueError(f"A client named {name!r} is already registered")
+            self._clients[name] = client
+
+    def on_lock_wait(self, seconds: float) -> None:
+        self.lock_wait.observe(seconds)
+
+    def on_sync(self, seconds: float, delta_size: int) -> None:
+        self.sync_duration.observe(seconds)
+        self.delta_size.observe(delta_size)
+
+    def on_sync_error(self, seconds: float) -> None:
+        self.sync_error_duration.observe(seconds)
+
+    def on_evaluation(self, flag_name: str, enabled: bool) -> None:
+        self._evaluations.increment(enabled)
+
+    def render(self) -> str:
+        """Renders the metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for histogram in (self.sync_duration, self.sync_error_duration, self.lock_wait, self.delta_size):
+            lines.extend(histogram.render())
+
+        enabled_count, disabled_count = self._evaluations.totals()
+        lines.extend([
+            "# HELP flypper_evaluations_total Number of flags evaluated by contexts.",
+            "# TYPE flypper_evaluations_total counter",
+            f'flypper_evaluations_total{{result="enabled"}} {enabled_count}',
+            f'flypper_evaluations_total{{result="disabled"}} {disabled_count}',
+        ])
+
+        with self._clients_lock:
+            clients = list(self._clients.items())
+        gauges: List[Tuple[str, str, Callable[["Client"], Optional[float]]]] = [
+            ("flypper_client_version", "Version of the latest update received by the client.", lambda client: client.version),
+            ("flypper_client_version_lag", "Number of versions the client is behind the storage.", lambda client: client.version_lag()),
+            ("flypper_client_staleness_seconds", "Time since the client's last successful sync.", lambda client: client.staleness()),
+            ("flypper_client_sync_failures", "Number of consecutive failed syncs.", lambda client: client.circuit_breaker.consecutive_failures),
+            ("flypper_client_circuit_open", "1 while the client's circuit breaker holds off the syncs.", lambda client: client.circuit_breaker.state != CLOSED),
+        ]
+        for name, documentation, value_fn in gauges:
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge"])
+            for client_name, client in clients:
+                try:
+                    value = value_fn(client)
+                except Exception:
+                    logger.exception("Flypper failed to read the %s metric", name)
+                    continue
+                if value is None:
+                    continue
+                lines.append(f'{name}{{client="{_escape(client_name)}"}} {_format(value)}')
+
+        return "\n".join(lines) + "\n"
+
+def _escape(label_value: str) -> str:
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -0,0 +1,105 @@
+import base64
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from flypper.entities.flag import Flag
+
+class FlagOrdering(NamedTuple):
+    names: Tuple[str, ...]
+    flags: Tuple["Flag", ...]
+    version: str
+
+_NO_ORDERING = FlagOrdering((), (), "")
+
+def ordering_version(names: Sequence[str]) -> str:
+    """Computes the version of an ordering of flag names, a short digest changing with the names or their order."""
+    return blake2b("\n".join(names).encode("utf-8"), digest_size=6).hexdigest()
+
+def flag_ordering(flags: Mapping[str, "Flag"]) -> FlagOrdering:
+    """Orders the flags by name, along with the ordering's version."""
+    names = tuple(sorted(flags))
+    return FlagOrdering(names, tuple(flags[name] for name in names), ordering_version(names))
+
+class OrderingCache:
+    """OrderingCache keeps the ordering of a client's latest flags mapping.
+
+    Contexts built between two syncs share the same mapping, so most of them
+    don't sort the names again. Clients clear it when a sync publishes a new
+    mapping, not to keep the previous one alive.
+    """
+
+    __slots__ = ("_latest",)
+
+    def __init__(self):
+        # The mapping and its ordering, in a single tuple so threads replace them at once.
+        self._latest: Tuple[Optional[Mapping[str, "Flag"]], FlagOrdering] = (None, _NO_ORDERING)
+
+    def get(self, flags: Mapping[str, "Flag"]) -> FlagOrdering:
+        """Orders the flags by name, reusing the ordering of the previous call with the same mapping."""
+        latest_flags, ordering = self._latest
+        if latest_flags is not flags:
+            ordering = flag_ordering(flags)
+            self._latest = (flags, ordering)
+        return ordering
+
+    def clear(self) -> None:
+        self._latest = (None, _NO_ORDERING)
+
+class FlagsPayload:
+    """FlagsPayload holds whether some flags are enabled, as a bitset, for front-ends to bootstrap.
+
+    The i-th bit of the bitset is set when the i-th flag of the ordering is enabled.
+    The packed form only holds the ordering's version and the bitset, for instance
+    "3f9a0c1d2e4b.lQM" for 10 flags: front-ends fetch the names of an ordering once,
+    by its version, then only need these few bytes embedded in each page.
+    """
+
+    __slots__ = ("names", "version", "bits", "_evaluations")
+
+    def __init__(self, names: Tuple[str, ...], bits: bytes, version: Optional[str] = None):
+        self.names: Tuple[str, ...] = names
+        self.version: str = version if version is not None else ordering_version(names)
+        self.bits: bytes = bits
+        # The evaluations the bitset was built from, to read them back faster.
+        self._evaluations: Optional[List[bool]] = None
+
+    @classmethod
+    def from_evaluations(
+        cls,
+        names: Tuple[str, ...],
+        evaluations: Iterable[bool],
+        version: Optional[str] = None,
+    ) -> "FlagsPayload":
+        evaluations = list(evaluations)
+        bits = bytearray((len(names) + 7) // 8)
+        for index, enabled in enumerate(evaluations):
+            if enabled:
+                bits[index >> 3] |= 1 << (index & 7)
+        payload = cls(names, bytes(bits), version)
+        payload._evaluations = evaluations
+        return payload
+
+    @classmethod
+    def unpack(cls, packed: str, names: Tuple[str, ...]) -> "FlagsPayload":
+        """Reads a packed payload back, given the names of its ordering.
+
+        Raises a ValueError when the names aren't the ones of the payload's ordering."""
+        version, _, encoded_bits = packed.partition(".")
+        if version != ordering_version(names):
+            raise ValueError(f"The names don't match the payload's ordering {version}")
+        bits = base64.urlsafe_b64decode(encoded_bits + "=" * (-len(encoded_bits) % 4))
+        return cls(names, bits, version)
+
+    def pack(self) -> str:
+        """Packs the payload into a short, URL and HTML safe, string."""
+        encoded_bits = base64.urlsafe_b64encode(self.bits).decode("ascii").rstrip("=")
+        return f"{self.version}.{encoded_bits}"
+
+    def is_enabled(self, index: int) -> bool:
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def to_dict(self) -> Dict[str, bool]:
+        if self._evaluations is not None:
+            return dict(zip(self.names, self._evaluations))
+        return {name: self.is_enabled(index) for index, name in enumerate(self.names)}
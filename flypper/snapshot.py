@@ -0,0 +1,256 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from threading import Event, Semaphore, Thread
+from time import monotonic
+from typing import Callable, Dict, Iterator, Mapping, Optional, Tuple, TYPE_CHECKING
+
+from flypper.context import Context
+from flypper.entities.flag import Flag, actor_bucket
+from flypper.entities.segment import Segment
+from flypper.payload import OrderingCache
+
+if TYPE_CHECKING:
+    from flypper.bucket_cache import BucketCache
+    from flypper.client import Client
+    from flypper.metrics import Instrumentation
+    from flypper.usage import UsageTracker
+
+logger = logging.getLogger(__name__)
+
+# A snapshot file starts with a fixed-size header: a magic string, the flags' version,
+# the segments' version, then the offset and length of the index.
+_MAGIC = b"FLYPPER2"
+_HEADER = struct.Struct("<8sQQQQ")
+# Snapshots written before segments had no segments' version, and only indexed the flags.
+_V1_MAGIC = b"FLYPPER1"
+_V1_HEADER = struct.Struct("<8sQQQ")
+
+def write_snapshot(
+    path: str,
+    flags: Mapping[str, Flag],
+    version: int,
+    segments: Optional[Mapping[str, Segment]] = None,
+    segments_version: int = 0,
+) -> None:
+    """Writes the flags, and the segments, to a snapshot file, atomically replacing the previous one.
+
+    Each flag is stored as its own JSON document, followed by an index of
+    the documents' positions by flag name, so readers only decode the flags they use.
+    """
+    body = bytearray()
+    index: Dict[str, Dict[str, Tuple[int, int]]] = {"flags": {}, "segments": {}}
+    for name, flag in flags.items():
+        document = json.dumps(flag.data, separators=(",", ":")).encode("utf-8")
+        index["flags"][name] = (_HEADER.size + len(body), len(document))
+        body += document
+    for name, segment in (segments or {}).items():
+        document = json.dumps(segment.data, separators=(",", ":")).encode("utf-8")
+        index["segments"][name] = (_HEADER.size + len(body), len(document))
+        body += document
+
+    encoded_index = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    header = _HEADER.pack(_MAGIC, version, segments_version, _HEADER.size + len(body), len(encoded_index))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".flypper-snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(header)
+            tmp_file.write(body)
+            tmp_file.write(encoded_index)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def read_snapshot_version(path: str) -> int:
+    """Reads the version of a snapshot file, only looking at its header."""
+    return _read_snapshot_versions(path)[0]
+
+def _read_snapshot_versions(path: str) -> Tuple[int, int]:
+    """Reads the flags' and the segments' versions of a snapshot file, from its header."""
+    with open(path, "rb") as snapshot_file:
+        version, segments_version, _, _ = _unpack_header(snapshot_file.read(_HEADER.size))
+    return version, segments_version
+
+def _unpack_header(header: bytes) -> Tuple[int, int, int, int]:
+    magic = header[:len(_MAGIC)]
+    if magic == _V1_MAGIC:
+        _, version, index_offset, index_length = _V1_HEADER.unpack(header[:_V1_HEADER.size])
+        return version, 0, index_offset, index_length
+    if magic != _MAGIC:
+        raise ValueError("Not a flypper snapshot")
+    _, version, segments_version, index_offset, index_length = _HEADER.unpack(header[:_HEADER.size])
+    return version, segments_version, index_offset, index_length
+
+class Snapshot(Mapping[str, Flag]):
+    """Snapshot maps a snapshot file in memory, read-only.
+
+    It acts as a mapping of the flags by their name. A flag is only decoded the
+    first time it is looked up. Processes mapping the same file share its memory.
+    The segments, far fewer than the flags, are all decoded upfront.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as snapshot_file:
+            self._mmap: mmap.mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.version, self.segments_version, index_offset, index_length = _unpack_header(
+            self._mmap[:_HEADER.size]
+        )
+        index = json.loads(self._mmap[index_offset:index_offset + index_length])
+        if self._mmap[:len(_MAGIC)] == _V1_MAGIC:
+            index = {"flags": index, "segments": {}}
+        self._index: Dict[str, Tuple[int, int]] = index["flags"]
+        self._decoded: Dict[str, Flag] = {}
+        self.segments: Dict[str, Segment] = {
+            name: Segment(data=json.loads(self._mmap[offset:offset + length]))
+            for name, (offset, length) in index["segments"].items()
+        }
+
+    def __getitem__(self, name: str) -> Flag:
+        flag = self._decoded.get(name, None)
+        if flag is None:
+            offset, length = self._index[name]
+            flag = Flag(json.loads(self._mmap[offset:offset + length]))
+            self._decoded[name] = flag
+        return flag
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+class SnapshotClient:
+    """SnapshotClient serves the flags from a snapshot file written by another process.
+
+    It plays the role of a Client in worker processes: at most once every ttl seconds,
+    it reads the snapshot's header and only maps the file again when its version changed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 1.0,
+        time_fn: Callable[[], float] = monotonic,
+        bucket_cache: Optional["BucketCache"] = None,
+        usage_tracker: Optional["UsageTracker"] = None,
+        instrumentation: Optional["Instrumentation"] = None,
+    ):
+        self._path: str = path
+        self._ttl: float = ttl
+        self._time_fn: Callable[[], float] = time_fn
+        self._next_check: float = 0
+        self._snapshot: Optional[Snapshot] = None
+        self._semaphore: Semaphore = Semaphore()
+        self.bucket_cache: Optional["BucketCache"] = bucket_cache
+        self.ordering_cache: OrderingCache = OrderingCache()
+        self.usage_tracker: Optional["UsageTracker"] = usage_tracker
+        self.instrumentation: Optional["Instrumentation"] = instrumentation
+
+    def flags(self) -> Mapping[str, Flag]:
+        """Lists the flags of the latest snapshot, by their name."""
+        if self._snapshot is None or self._time_fn() >= self._next_check:
+            self._check()
+        return self._snapshot if self._snapshot is not None else {}
+
+    def segments(self) -> Mapping[str, Segment]:
+        """Lists the segments of the latest snapshot, by their name: call flags first."""
+        return self._snapshot.segments if self._snapshot is not None else {}
+
+    @property
+    def version(self) -> int:
+        """The version of the currently mapped snapshot."""
+        return self._snapshot.version if self._snapshot is not None else 0
+
+    @property
+    def bucket(self) -> Callable[[str], int]:
+        """The function used to compute the actors' buckets, cached or not."""
+        return self.bucket_cache or actor_bucket
+
+    def __call__(self, **entries: str) -> Context:
+        """Builds a context from this client."""
+        return Context(client=self, entries=entries)
+
+    def _check(self) -> None:
+        """Maps the snapshot again if its version changed."""
+        with self._semaphore:
+            now = self._time_fn()
+            if self._snapshot is not None and now < self._next_check:
+                return
+
+            # The previous snapshot isn't closed: running contexts may still use it.
+            # Its memory is released once they are all gone.
+            if self._snapshot is None or _read_snapshot_versions(self._path) != (
+                self._snapshot.version,
+                self._snapshot.segments_version,
+            ):
+                self._snapshot = Snapshot(self._path)
+                self.ordering_cache.clear()
+
+            self._next_check = now + self._ttl
+
+class SnapshotPublisher:
+    """SnapshotPublisher writes the flags of a client to a snapshot file.
+
+    A single process runs the publisher, syncing with the storage through its client,
+    while the other processes read the snapshot through a SnapshotClient.
+    """
+
+    def __init__(self, client: "Client", path: str, interval: float = 1.0):
+        self._client: "Client" = client
+        self._path: str = path
+        self._interval: float = interval
+        self._published_versions: Optional[Tuple[int, int]] = None
+        self._publisher: Optional[Thread] = None
+        self._stop_event: Event = Event()
+
+    def publish(self) -> bool:
+        """Writes a new snapshot if the client's flags, or segments, changed since the last one."""
+        # Read the versions before dumping: the snapshot may be newer, never older.
+        self._client.flags()
+        versions = (self._client.version, self._client.segments_version)
+        if versions == self._published_versions:
+            return False
+        self._client.dump_snapshot(self._path)
+        self._published_versions = versions
+        return True
+
+    def start(self) -> None:
+        """Publishes a first snapshot then keeps publishing from a background thread."""
+        if self._publisher is not None:
+            return
+        self.publish()
+        self._stop_event = Event()
+        self._publisher = Thread(
+            target=self._publish_loop,
+            args=(self._stop_event,),
+            name="flypper-snapshot",
+            daemon=True,
+        )
+        self._publisher.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops publishing, waiting for the background thread to exit."""
+        publisher = self._publisher
+        if publisher is None:
+            return
+        self._stop_event.set()
+        self._publisher = None
+        publisher.join(timeout)
+
+    def _publish_loop(self, stop_event: Event) -> None:
+        while not stop_event.wait(self._interval):
+            try:
+                self.publish()
+            except Exception:
+                logger.exception("Flypper failed to publish its flags snapshot")
@@ -1,14 +1,125 @@
 from abc import ABC, abstractmethod
-from typing import List
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
 
 from flypper.entities.flag import Flag, UnversionedFlagData
+from flypper.entities.segment import Segment, UnversionedSegmentData
+from flypper.entities.usage import FlagUsage
+
+class FlagsPage(NamedTuple):
+    flags: List[Flag]
+    # The cursor to give list_page for the next page, None on the last page.
+    next_cursor: Optional[str]
+
+def paginate(flags: Iterable[Flag], limit: int) -> FlagsPage:
+    """Builds a page from flags ordered by name, consuming at most limit + 1 of them."""
+    page: List[Flag] = []
+    for flag in flags:
+        if len(page) == limit:
+            return FlagsPage(flags=page, next_cursor=page[-1].name if page else None)
+        page.append(flag)
+    return FlagsPage(flags=page, next_cursor=None)
+
+class FullListing(List[Flag]):
+    """All the flags, that list(version__gt=...) returns instead of the updates since a
+    version the storage can't tell all the deletions since, their tombstones being dropped.
+
+    Clients replace their flags with it, then sync the updates after its version."""
+
+    def __init__(self, flags: Iterable[Flag], version: int):
+        super().__init__(flags)
+        self.version: int = version
+
+class Batch:
+    """Batch collects upserts and deletions, written at once by AbstractStorage.batch.
+
+    Only the latest change of each flag is kept."""
+
+    def __init__(self):
+        self._changes: Dict[str, Optional[UnversionedFlagData]] = {}
+        # The flags written by the batch, once it is.
+        self.flags: List[Flag] = []
+
+    def upsert(self, flag_data: UnversionedFlagData) -> None:
+        self._changes[flag_data["name"]] = flag_data
+
+    def delete(self, flag_name: str) -> None:
+        self._changes[flag_name] = None
+
+    @property
+    def upserts(self) -> List[UnversionedFlagData]:
+        return [flag_data for flag_data in self._changes.values() if flag_data is not None]
+
+    @property
+    def deletions(self) -> List[str]:
+        return [flag_name for flag_name, flag_data in self._changes.items() if flag_data is None]
 
 class AbstractStorage(ABC):
+    # Tells if watch can block until new updates are available.
+    supports_watch: bool = False
+    # Tells if the storage holds segments, that clients should sync.
+    supports_segments: bool = False
+    # Tells if current_version is a cheap query, instead of listing all the flags.
+    supports_current_version: bool = False
+
     @abstractmethod
     def list(self, version__gt: int = 0) -> List[Flag]:
-        """Lists all flags that has been 'upserted' after the given version number."""
+        """Lists all flags that has been 'upserted' after the given version number.
+
+        Storages dropping old tombstones return a FullListing for the versions older than them."""
         raise NotImplementedError
 
+    def get(self, flag_name: str) -> Optional[Flag]:
+        """Returns the flag with the given name, None if there is none.
+
+        Soft-deleted flags are returned, unlike fully removed ones. The default behavior
+        lists all the flags, storages should override it with a lookup by name.
+        """
+        return next((flag for flag in self.list() if flag.name == flag_name), None)
+
+    def list_page(
+        self,
+        prefix: str = "",
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        deleted: Optional[bool] = None,
+    ) -> FlagsPage:
+        """Lists at most limit flags whose name starts with the prefix, ordered by name.
+
+        The page starts after the cursor, the next_cursor of the previous page.
+        With deleted, only the soft-deleted flags are listed, or only the other ones.
+        The default behavior lists all the flags, storages should override it
+        with a query using an index on the flags' names.
+        """
+        flags = sorted(
+            (
+                flag
+                for flag in self.list()
+                if flag.name.startswith(prefix)
+                and (cursor is None or flag.name > cursor)
+                and (deleted is None or flag.is_deleted == deleted)
+            ),
+            key=lambda flag: flag.name,
+        )
+        return paginate(flags, limit)
+
+    def current_version(self) -> int:
+        """Returns the version of the latest update, 0 when empty.
+
+        The default behavior lists all the flags, storages should override it with a cheaper query
+        and set supports_current_version.
+        """
+        return max((flag.version for flag in self.list()), default=0)
+
+    def watch(self, version__gt: int, timeout: float) -> List[Flag]:
+        """Waits for flags to be 'upserted' after the given version, for at most timeout seconds.
+
+        Returns the same flags as list, possibly none when the timeout is reached.
+        The default behavior is to list right away, storages able to notify clients
+        of their changes should override it and set supports_watch.
+        """
+        return self.list(version__gt=version__gt)
+
     @abstractmethod
     def upsert(self, flag_data: UnversionedFlagData) -> Flag:
         """Inserts a flag, setting a 'version' and a 'updated_at' from an UnversionedFlagData."""
@@ -18,12 +129,87 @@ class AbstractStorage(ABC):
     def delete(self, flag_name: str) -> None:
         """Fully remove a flag from the store.
 
+        Storages should keep track of the deletion, for instance as a deleted flag with a
+        new version, so that clients' delta syncs also remove the flag from their cache.
+
         Note that soft-delete occurs by upserting a flag with a 'deleted=True' mapping."""
         raise NotImplementedError
 
+    def write_batch(self, upserts: List[UnversionedFlagData], deletions: List[str]) -> List[Flag]:
+        """Upserts then deletes flags, returning the upserted flags.
+
+        Storages should write them atomically, under a single new version, so clients
+        sync them all at once and deleting a missing flag writes nothing. The default
+        behavior upserts and deletes the flags one by one.
+        """
+        flags = [self.upsert(flag_data) for flag_data in upserts]
+        for flag_name in deletions:
+            self.delete(flag_name)
+        return flags
+
+    def upsert_many(self, flags_data: Iterable[UnversionedFlagData]) -> List[Flag]:
+        """Upserts many flags at once, see write_batch."""
+        return self.write_batch(upserts=list(flags_data), deletions=[])
+
+    def delete_many(self, flag_names: Iterable[str]) -> None:
+        """Fully removes many flags at once, see write_batch."""
+        self.write_batch(upserts=[], deletions=list(flag_names))
+
+    @contextmanager
+    def batch(self) -> Iterator[Batch]:
+        """Collects upserts and deletions, then writes and commits them at once:
+
+            with storage.batch() as batch:
+                batch.upsert(flag_data)
+                batch.delete(flag_name)
+
+        Nothing is written if the block raises an exception.
+        """
+        batch = Batch()
+        yield batch
+        batch.flags = self.write_batch(upserts=batch.upserts, deletions=batch.deletions)
+        self.commit()
+
+    def list_segments(self, version__gt: int = 0) -> List[Segment]:
+        """Lists the segments 'upserted' or deleted after the given version number.
+
+        Segments share their versions with the flags. Like for flags, deleted segments
+        are only listed after a version greater than 0, for the clients' delta syncs.
+        The default behavior is to have no segments, storages holding them should
+        override it, along with upsert_segment and delete_segment, and set supports_segments.
+        """
+        return []
+
+    def upsert_segment(self, segment_data: UnversionedSegmentData) -> Segment:
+        """Inserts a segment, setting a 'version' and a 'updated_at' from an UnversionedSegmentData."""
+        raise NotImplementedError
+
+    def delete_segment(self, segment_name: str) -> None:
+        """Removes a segment from the store, flags still referencing it won't match it anymore."""
+        raise NotImplementedError
+
     def commit(self) -> None:
         """For some storages, this can be used to persist changes that were made through upsert and delete.
 
         The default behavior is to do nothing, so it's not needed for subclass to implement it.
         """
         pass
+
+    def record_usage(self, usages: Dict[str, FlagUsage]) -> None:
+        """Adds the given usages to the ones already stored, by flag name.
+
+        The default behavior is to drop them, storages keeping track of the usage should override it.
+        """
+        pass
+
+    def usage(self) -> Dict[str, FlagUsage]:
+        """Returns the usages recorded so far, by flag name."""
+        return {}
+
+    def usage_for(self, flag_names: Iterable[str]) -> Dict[str, FlagUsage]:
+        """Returns the usages recorded so far for the given flags, by flag name.
+
+        The default behavior reads all the usages, storages should override it with lookups by name.
+        """
+        usages = self.usage()
+        return {name: usages[name] for name in flag_names if name in usages}
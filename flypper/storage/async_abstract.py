@@ -0,0 +1,39 @@
+from abc import ABC, abstractmethod
+from typing import List
+
+from flypper.entities.flag import Flag, UnversionedFlagData
+from flypper.entities.segment import Segment
+
+class AsyncAbstractStorage(ABC):
+    """The asyncio counterpart of AbstractStorage, to be used with an AsyncClient."""
+
+    # Tells if the storage holds segments, that clients should sync.
+    supports_segments: bool = False
+
+    @abstractmethod
+    async def list(self, version__gt: int = 0) -> List[Flag]:
+        """Lists all flags that has been 'upserted' after the given version number."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def upsert(self, flag_data: UnversionedFlagData) -> Flag:
+        """Inserts a flag, setting a 'version' and a 'updated_at' from an UnversionedFlagData."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, flag_name: str) -> None:
+        """Fully remove a flag from the store.
+
+        Note that soft-delete occurs by upserting a flag with a 'deleted=True' mapping."""
+        raise NotImplementedError
+
+    async def list_segments(self, version__gt: int = 0) -> List[Segment]:
+        """Lists the segments 'upserted' or deleted after the given version number, see AbstractStorage."""
+        return []
+
+    async def commit(self) -> None:
+        """For some storages, this can be used to persist changes that were made through upsert and delete.
+
+        The default behavior is to do nothing, so it's not needed for subclass to implement it.
+        """
+        pass
@@ -0,0 +1,41 @@
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from typing import List, Optional, TYPE_CHECKING
+
+from flypper.entities.flag import Flag, UnversionedFlagData
+from flypper.entities.segment import Segment
+from flypper.storage.async_abstract import AsyncAbstractStorage
+
+if TYPE_CHECKING:
+    from flypper.storage.abstract import AbstractStorage
+
+class AsyncExecutorStorage(AsyncAbstractStorage):
+    """Adapts a synchronous storage by running its calls in an executor.
+
+    This keeps the event loop running while a blocking storage is queried.
+    Without an executor, the loop's default one is used.
+    """
+
+    def __init__(self, storage: "AbstractStorage", executor: Optional[Executor] = None):
+        self._storage: "AbstractStorage" = storage
+        self._executor: Optional[Executor] = executor
+        self.supports_segments: bool = storage.supports_segments
+
+    async def list(self, version__gt: int = 0) -> List[Flag]:
+        return await self._run(partial(self._storage.list, version__gt=version__gt))
+
+    async def list_segments(self, version__gt: int = 0) -> List[Segment]:
+        return await self._run(partial(self._storage.list_segments, version__gt=version__gt))
+
+    async def upsert(self, flag_data: UnversionedFlagData) -> Flag:
+        return await self._run(partial(self._storage.upsert, flag_data))
+
+    async def delete(self, flag_name: str) -> None:
+        await self._run(partial(self._storage.delete, flag_name))
+
+    async def commit(self) -> None:
+        await self._run(self._storage.commit)
+
+    async def _run(self, call):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
@@ -0,0 +1,26 @@
+from typing import List
+
+from flypper.entities.flag import Flag, UnversionedFlagData
+from flypper.entities.segment import Segment
+from flypper.storage.async_abstract import AsyncAbstractStorage
+from flypper.storage.in_memory import InMemoryStorage
+
+class AsyncInMemoryStorage(AsyncAbstractStorage):
+    """Stores the flags in memory, like InMemoryStorage, behind an async interface."""
+
+    supports_segments = True
+
+    def __init__(self):
+        self._storage: InMemoryStorage = InMemoryStorage()
+
+    async def list(self, version__gt: int = 0) -> List[Flag]:
+        return self._storage.list(version__gt=version__gt)
+
+    async def upsert(self, flag_data: UnversionedFlagData) -> Flag:
+        return self._storage.upsert(flag_data)
+
+    async def delete(self, flag_name: str) -> None:
+        self._storage.delete(flag_name)
+
+    async def list_segments(self, version__gt: int = 0) -> List[Segment]:
+        return self._storage.list_segments(version__gt=version__gt)
@@ -0,0 +1,193 @@
+import gzip
+import http.client
+import json
+from queue import Empty, Full, LifoQueue
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from flypper.entities.flag import Flag, UnversionedFlagData
+from flypper.entities.segment import Segment, UnversionedSegmentData
+from flypper.storage.abstract import AbstractStorage, FullListing
+
+def parse_flags(payload: Any) -> List[Flag]:
+    """Deserializes the flags listed by the web UI's API, a FullListing when flagged as such."""
+    flags = [Flag(data=data) for data in payload["flags"]]
+    if payload.get("full", False):
+        return FullListing(flags, payload["version"])
+    return flags
+
+class HttpStorageError(Exception):
+    """Raised when the web UI's API answers with an unexpected status."""
+
+    def __init__(self, status: int, reason: str):
+        super().__init__(f"{status} {reason}")
+        self.status: int = status
+        self.reason: str = reason
+
+class ReadOnlyStorageError(Exception):
+    """Raised when writing to an HttpStorage: flags are written through the web UI's storage."""
+
+class HttpStorage(AbstractStorage):
+    """Reads the flags from the JSON API of a FlypperWebUI, for instance:
+
+        HttpStorage("https://admin.example.com/flypper")
+
+    Many services can sync through a single web UI instead of each of them
+    connecting to the storage behind it. The storage is read-only.
+
+    Connections are kept alive and reused, at most pool_size of them stay open
+    while idle. The responses are gzipped, and a sync asking for the same
+    version as the previous one sends its ETag, so an unchanged storage only
+    costs a 304 Not Modified.
+
+    It can be watched when the web UI's storage can, which the web UI tells on
+    the first check of supports_watch.
+    """
+
+    supports_segments = True
+    supports_current_version = True
+
+    def __init__(self, url: str, timeout: float = 5.0, pool_size: int = 4):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme: {parts.scheme}")
+        self._https: bool = parts.scheme == "https"
+        self._netloc: str = parts.netloc
+        self._path: str = parts.path.rstrip("/")
+        self._timeout: float = timeout
+        self._pool: "LifoQueue[http.client.HTTPConnection]" = LifoQueue(maxsize=pool_size)
+        # The ETag and flags of the latest delta, by query.
+        self._last_delta: Optional[Tuple[str, str, List[Flag]]] = None
+        self._supports_watch: Optional[bool] = None
+
+    @property
+    def supports_watch(self) -> bool:
+        """Whether the web UI's storage can be watched, False while the web UI can't be reached."""
+        if self._supports_watch is None:
+            try:
+                _, _, payload = self._get("/api/version")
+            except (OSError, http.client.HTTPException, HttpStorageError, ValueError):
+                return False
+            self._supports_watch = bool(payload.get("supports_watch", False))
+        return self._supports_watch
+
+    @supports_watch.setter
+    def supports_watch(self, supports_watch: bool) -> None:
+        self._supports_watch = supports_watch
+
+    def list(self, version__gt: int = 0) -> List[Flag]:
+        query = urlencode({"version__gt": version__gt})
+        last_delta = self._last_delta
+        etag = last_delta[1] if last_delta is not None and last_delta[0] == query else None
+
+        status, headers, payload = self._get(f"/api/flags?{query}", etag=etag)
+        if status == 304 and last_delta is not None:
+            return last_delta[2]
+
+        flags = parse_flags(payload)
+        response_etag = headers.get("ETag", None)
+        if response_etag is not None:
+            self._last_delta = (query, response_etag, flags)
+        return flags
+
+    def list_segments(self, version__gt: int = 0) -> List[Segment]:
+        _, _, payload = self._get(f"/api/segments?{urlencode({'version__gt': version__gt})}")
+        return [Segment(data=data) for data in payload["segments"]]
+
+    def current_version(self) -> int:
+        _, _, payload = self._get("/api/version")
+        return payload["version"]
+
+    def watch(self, version__gt: int, timeout: float) -> List[Flag]:
+        query = urlencode({"version__gt": version__gt, "timeout": timeout})
+        _, _, payload = self._get(f"/api/watch?{query}", timeout=self._timeout + timeout)
+        return parse_flags(payload)
+
+    def upsert(self, flag_data: UnversionedFlagData) -> Flag:
+        raise ReadOnlyStorageError("HttpStorage is read-only")
+
+    def delete(self, flag_name: str) -> None:
+        raise ReadOnlyStorageError("HttpStorage is read-only")
+
+    def write_batch(self, upserts: List[UnversionedFlagData], deletions: List[str]) -> List[Flag]:
+        raise ReadOnlyStorageError("HttpStorage is read-only")
+
+    def upsert_segment(self, segment_data: UnversionedSegmentData) -> Segment:
+        raise ReadOnlyStorageError("HttpStorage is read-only")
+
+    def delete_segment(self, segment_name: str) -> None:
+        raise ReadOnlyStorageError("HttpStorage is read-only")
+
+    def close(self) -> None:
+        """Closes the idle connections."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                return
+
+    def _get(
+        self,
+        path: str,
+        etag: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Tuple[int, http.client.HTTPMessage, Any]:
+        """Sends a GET request, returning the response's status, headers and decoded JSON."""
+        headers = {"Accept": "application/json", "Accept-Encoding": "gzip"}
+        if etag is not None:
+            headers["If-None-Match"] = etag
+
+        connection, reused = self._acquire()
+        try:
+            connection.timeout = timeout if timeout is not None else self._timeout
+            try:
+                response = self._request(connection, self._path + path, headers)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server may have closed an idle connection: retry once on a new one.
+                if not reused:
+                    raise
+                connection.close()
+                response = self._request(connection, self._path + path, headers)
+            body = response.read()
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+        if response.status == 304:
+            return response.status, response.msg, None
+        if response.status != 200:
+            raise HttpStorageError(response.status, response.reason)
+
+        if response.getheader("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return response.status, response.msg, json.loads(body)
+
+    def _request(
+        self,
+        connection: http.client.HTTPConnection,
+        path: str,
+        headers: Dict[str, str],
+    ) -> http.client.HTTPResponse:
+        if connection.sock is not None:
+            connection.sock.settimeout(connection.timeout)
+        connection.request("GET", path, headers=headers)
+        return connection.getresponse()
+
+    def _acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """Takes an idle connection from the pool, or opens a new one."""
+        try:
+            return self._pool.get_nowait(), True
+        except Empty:
+            connection_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            return connection_class(self._netloc, timeout=self._timeout), False
+
+    def _release(self, connection: http.client.HTTPConnection) -> None:
+        try:
+            self._pool.put_nowait(connection)
+        except Full:
+            connection.close()
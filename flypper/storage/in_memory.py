@@ -1,33 +1,245 @@
+from bisect import bisect_left, bisect_right, insort
+from threading import Condition
 from time import time
-from typing import Dict, List, cast
+from typing import Dict, Iterable, Iterator, List, Optional, cast
 
 from flypper.entities.flag import Flag, FlagData, UnversionedFlagData
-from flypper.storage.abstract import AbstractStorage
+from flypper.entities.segment import Segment, SegmentData, UnversionedSegmentData, segment_tombstone
+from flypper.entities.usage import FlagUsage, merge_usage
+from flypper.storage.abstract import AbstractStorage, FlagsPage, FullListing, paginate
 
 class InMemoryStorage(AbstractStorage):
-    def __init__(self):
+    """Stores the flags in memory, along with a changelog ordered by version.
+
+    Listing the flags updated after a given version bisects the changelog,
+    so it only costs the number of changes since that version.
+
+    Deleting a flag leaves a tombstone in the changelog, a deleted flag that
+    clients receive through their delta syncs. Only the most recent tombstones
+    are kept: a client lagging behind more than tombstones_retention deletions
+    gets a FullListing of the flags instead, and syncs them from scratch.
+
+    Batches are written under a single version, atomically for the clients.
+
+    The flags' names are also kept sorted, so pages of flags by name prefix
+    are read straight from their position.
+
+    Clients can watch the storage to be notified of the changes as soon as they happen.
+    """
+
+    supports_watch = True
+    supports_segments = True
+    supports_current_version = True
+
+    def __init__(self, tombstones_retention: int = 10_000):
         self._version: int = 0
         self._flags: Dict[str, Flag] = {}
+        self._sorted_names: List[str] = []
+        self._tombstones: Dict[str, Flag] = {}
+        self._tombstones_retention: int = tombstones_retention
+        # The version of the latest tombstone dropped: deltas from before it may miss deletions.
+        self._dropped_tombstones_version: int = 0
+        self._changelog: List[Flag] = []
+        self._changelog_versions: List[int] = []
+        self._superseded_count: int = 0
+        self._condition: Condition = Condition()
+        self._usages: Dict[str, FlagUsage] = {}
+        # Segments are expected to be few: they are listed by scanning them, tombstones included.
+        self._segments: Dict[str, Segment] = {}
 
     def list(self, version__gt: int = 0) -> List[Flag]:
-        return [
-            flag
-            for flag in self._flags.values()
-            if flag.version > version__gt
-        ]
+        with self._condition:
+            if version__gt <= 0:
+                return list(self._flags.values())
+            if version__gt < self._dropped_tombstones_version:
+                return FullListing(self._flags.values(), self._version)
+
+            start = bisect_right(self._changelog_versions, version__gt)
+            return [
+                flag
+                for flag in self._changelog[start:]
+                if self._is_latest(flag)
+            ]
+
+    def get(self, flag_name: str) -> Optional[Flag]:
+        return self._flags.get(flag_name, None)
+
+    def list_page(
+        self,
+        prefix: str = "",
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        deleted: Optional[bool] = None,
+    ) -> FlagsPage:
+        with self._condition:
+            if cursor is not None and cursor >= prefix:
+                start = bisect_right(self._sorted_names, cursor)
+            else:
+                start = bisect_left(self._sorted_names, prefix)
+
+            def flags() -> Iterator[Flag]:
+                for index in range(start, len(self._sorted_names)):
+                    name = self._sorted_names[index]
+                    if not name.startswith(prefix):
+                        return
+                    flag = self._flags[name]
+                    if deleted is None or flag.is_deleted == deleted:
+                        yield flag
+
+            return paginate(flags(), limit)
+
+    def current_version(self) -> int:
+        return self._version
+
+    def watch(self, version__gt: int, timeout: float) -> List[Flag]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._version > version__gt, timeout)
+            return self.list(version__gt=version__gt)
 
     def upsert(self, flag_data: UnversionedFlagData) -> Flag:
-        self._version = self._version + 1
-        name = flag_data["name"]
-        flag = Flag(
-            data=cast(FlagData, {
-                **flag_data,
+        with self._condition:
+            flag = _build_flag(flag_data, self._version + 1)
+            self._version = flag.version
+            self._upsert(flag)
+            self._condition.notify_all()
+            return flag
+
+    def delete(self, flag_name: str) -> None:
+        with self._condition:
+            if flag_name not in self._flags:
+                raise KeyError(flag_name)
+            self._version = self._version + 1
+            self._delete(flag_name)
+            self._condition.notify_all()
+
+    def write_batch(self, upserts: List[UnversionedFlagData], deletions: List[str]) -> List[Flag]:
+        with self._condition:
+            upserted_names = {flag_data["name"] for flag_data in upserts}
+            for flag_name in deletions:
+                if flag_name not in self._flags and flag_name not in upserted_names:
+                    raise KeyError(flag_name)
+            if not upserts and not deletions:
+                return []
+
+            # Build all the flags first: an invalid one leaves the storage untouched.
+            flags = [_build_flag(flag_data, self._version + 1) for flag_data in upserts]
+            self._version = self._version + 1
+            for flag in flags:
+                self._upsert(flag)
+            for flag_name in deletions:
+                self._delete(flag_name)
+            self._condition.notify_all()
+            return flags
+
+    def list_segments(self, version__gt: int = 0) -> List[Segment]:
+        with self._condition:
+            return [
+                segment
+                for segment in self._segments.values()
+                if segment.version > version__gt and (version__gt > 0 or not segment.is_deleted)
+            ]
+
+    def upsert_segment(self, segment_data: UnversionedSegmentData) -> Segment:
+        with self._condition:
+            self._version = self._version + 1
+            segment = Segment(
+                data=cast(SegmentData, {
+                    **segment_data,
+                    "updated_at": time(),
+                    "version": self._version,
+                }),
+            )
+            self._segments[segment.name] = segment
+            self._condition.notify_all()
+            return segment
+
+    def delete_segment(self, segment_name: str) -> None:
+        with self._condition:
+            segment = self._segments.get(segment_name, None)
+            if segment is None or segment.is_deleted:
+                raise KeyError(segment_name)
+            self._version = self._version + 1
+            self._segments[segment_name] = segment_tombstone(segment_name, self._version, time())
+            self._condition.notify_all()
+
+    def record_usage(self, usages: Dict[str, FlagUsage]) -> None:
+        with self._condition:
+            for flag_name, usage in usages.items():
+                previous_usage = self._usages.get(flag_name, None)
+                self._usages[flag_name] = merge_usage(previous_usage, usage) if previous_usage else usage
+
+    def usage(self) -> Dict[str, FlagUsage]:
+        with self._condition:
+            return self._usages.copy()
+
+    def usage_for(self, flag_names: Iterable[str]) -> Dict[str, FlagUsage]:
+        with self._condition:
+            return {name: self._usages[name] for name in flag_names if name in self._usages}
+
+    def _upsert(self, flag: Flag) -> None:
+        """Upserts a flag built with the current version, must be called with the condition."""
+        name = flag.name
+        if name not in self._flags:
+            insort(self._sorted_names, name)
+        if name in self._flags or self._tombstones.pop(name, None) is not None:
+            self._superseded_count = self._superseded_count + 1
+        self._flags[name] = flag
+        self._append_to_changelog(flag)
+
+    def _delete(self, flag_name: str) -> None:
+        """Deletes a flag with the current version, must be called with the condition."""
+        del self._flags[flag_name]
+        del self._sorted_names[bisect_left(self._sorted_names, flag_name)]
+        tombstone = Flag(
+            data={
+                "name": flag_name,
+                "deleted": True,
+                "enabled": False,
+                "enabled_for_actors": None,
+                "enabled_for_percentage_of_actors": None,
                 "updated_at": time(),
                 "version": self._version,
-            }),
+            },
         )
-        self._flags[name] = flag
-        return flag
+        self._superseded_count = self._superseded_count + 1
+        self._tombstones[flag_name] = tombstone
+        self._append_to_changelog(tombstone)
 
-    def delete(self, flag_name: str) -> None:
-        del self._flags[flag_name]
+        if len(self._tombstones) > self._tombstones_retention:
+            self._drop_oldest_tombstones()
+
+    def _is_latest(self, flag: Flag) -> bool:
+        """Tells if the changelog entry is the latest one for its flag."""
+        name = flag.name
+        return self._flags.get(name) is flag or self._tombstones.get(name) is flag
+
+    def _append_to_changelog(self, flag: Flag) -> None:
+        self._changelog.append(flag)
+        self._changelog_versions.append(flag.version)
+
+        # Compact the changelog once most of its entries were superseded.
+        if self._superseded_count * 2 > len(self._changelog):
+            self._compact()
+
+    def _drop_oldest_tombstones(self) -> None:
+        # Dicts keep the insertion order: the oldest tombstones come first.
+        dropped_count = len(self._tombstones) - self._tombstones_retention
+        for name in list(self._tombstones)[:dropped_count]:
+            tombstone = self._tombstones.pop(name)
+            self._dropped_tombstones_version = max(self._dropped_tombstones_version, tombstone.version)
+        self._superseded_count = self._superseded_count + dropped_count
+
+    def _compact(self) -> None:
+        """Removes the superseded entries from the changelog."""
+        self._changelog = [flag for flag in self._changelog if self._is_latest(flag)]
+        self._changelog_versions = [flag.version for flag in self._changelog]
+        self._superseded_count = 0
+
+def _build_flag(flag_data: UnversionedFlagData, version: int) -> Flag:
+    return Flag(
+        data=cast(FlagData, {
+            **flag_data,
+            "updated_at": time(),
+            "version": version,
+        }),
+    )
@@ -0,0 +1,222 @@
+from bisect import bisect_right
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Generic, Iterable, List, Optional, TypeVar
+
+from flypper.circuit_breaker import CircuitBreaker
+from flypper.entities.flag import Flag, UnversionedFlagData
+from flypper.entities.segment import Segment, UnversionedSegmentData
+from flypper.entities.usage import FlagUsage
+from flypper.storage.abstract import AbstractStorage, FlagsPage, FullListing
+
+Entity = TypeVar("Entity", Flag, Segment)
+
+class _ChangeBuffer(Generic[Entity]):
+    """Keeps the latest version of each flag, or segment, ordered by version to answer delta queries.
+
+    Like storages, it only keeps the tombstones_retention most recent deletions."""
+
+    def __init__(self, tombstones_retention: int = 10_000):
+        # Version of the latest update fetched, and the one of the first fetch or of
+        # the latest tombstone dropped: deletions older than it may be missing.
+        self.cursor: int = 0
+        self.base_version: Optional[int] = None
+        self._latest: Dict[str, Entity] = {}
+        # Names of the deleted flags, or segments, oldest deletion first.
+        self._tombstones: Dict[str, None] = {}
+        self._tombstones_retention: int = tombstones_retention
+        # Updates ordered by version, including the ones superseded by a later update.
+        self._log: List[Entity] = []
+        self._versions: List[int] = []
+
+    def apply(self, updates: List[Entity]) -> None:
+        updates = sorted(
+            (entity for entity in updates if entity.version > self.cursor),
+            key=lambda entity: entity.version,
+        )
+        for entity in updates:
+            self._latest[entity.name] = entity
+            self._tombstones.pop(entity.name, None)
+            if entity.is_deleted:
+                self._tombstones[entity.name] = None
+            self._log.append(entity)
+            self._versions.append(entity.version)
+        if updates:
+            self.cursor = updates[-1].version
+        if self.base_version is None:
+            self.base_version = self.cursor
+
+        # Drop the oldest tombstones: the storage answers the deltas from before them.
+        excess_count = len(self._tombstones) - self._tombstones_retention
+        if excess_count > 0:
+            for name in list(self._tombstones)[:excess_count]:
+                del self._tombstones[name]
+                self.base_version = max(self.base_version, self._latest.pop(name).version)
+
+        # Drop the superseded updates once they make up most of the log.
+        if len(self._log) > 2 * len(self._latest):
+            self._log = [entity for entity in self._log if self._latest.get(entity.name, None) is entity]
+            self._versions = [entity.version for entity in self._log]
+
+    def reset(self, entities: List[Entity], version: int) -> None:
+        """Starts over from all the entities as of the given version, the deletions before it being unknown."""
+        self.cursor = 0
+        self.base_version = None
+        self._latest = {}
+        self._tombstones = {}
+        self._log = []
+        self._versions = []
+        self.apply(entities)
+        self.cursor = self.base_version = max(self.cursor, version)
+
+    def since(self, version__gt: int) -> Optional[List[Entity]]:
+        """Answers list(version__gt=...) like the storage would, None when the buffer can't."""
+        if self.base_version is None:
+            return None
+        if version__gt == 0:
+            return [entity for entity in self._latest.values() if not entity.is_deleted]
+        if self.cursor == 0 or version__gt < self.base_version:
+            return None
+
+        start = bisect_right(self._versions, version__gt)
+        return [entity for entity in self._log[start:] if self._latest.get(entity.name, None) is entity]
+
+class SharedStorage(AbstractStorage):
+    """Shares a storage's updates between the many clients of a process, for instance:
+
+        shared_storage = SharedStorage(redis_storage)
+        clients = {tenant: Client(storage=shared_storage) for tenant in tenants}
+
+    The shared storage fetches the updates at most once every ttl seconds, and
+    keeps them in memory: each client's list(version__gt=...) is answered from
+    there, whatever its own version. Concurrent calls wait for a single fetch.
+    Writes go straight to the storage, and the next list fetches them.
+
+    The clients can't watch a shared storage, they poll it instead, which is cheap.
+
+    When a fetch fails, the call raises and the next fetches are spaced out by a
+    circuit_breaker (defaults to a CircuitBreaker()): the lists are answered from
+    memory meanwhile. Keep tombstones_retention the same as the storage's.
+    """
+
+    def __init__(
+        self,
+        storage: AbstractStorage,
+        ttl: float = 1.0,
+        time_fn: Callable[[], float] = monotonic,
+        tombstones_retention: int = 10_000,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ):
+        self._storage: AbstractStorage = storage
+        self._ttl: float = ttl
+        self._time_fn: Callable[[], float] = time_fn
+        self._next_fetch: float = 0
+        self._fetch_lock: Lock = Lock()
+        self._buffers_lock: Lock = Lock()
+        self._flags: _ChangeBuffer[Flag] = _ChangeBuffer(tombstones_retention)
+        self._segments: _ChangeBuffer[Segment] = _ChangeBuffer(tombstones_retention)
+        self.circuit_breaker: CircuitBreaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.supports_segments: bool = storage.supports_segments
+        self.supports_current_version: bool = storage.supports_current_version
+
+    def list(self, version__gt: int = 0) -> List[Flag]:
+        self._fetch()
+        with self._buffers_lock:
+            flags = self._flags.since(version__gt)
+        if flags is None:
+            return self._storage.list(version__gt=version__gt)
+        return flags
+
+    def list_segments(self, version__gt: int = 0) -> List[Segment]:
+        if not self.supports_segments:
+            return []
+        self._fetch()
+        with self._buffers_lock:
+            segments = self._segments.since(version__gt)
+        if segments is None:
+            return self._storage.list_segments(version__gt=version__gt)
+        return segments
+
+    def get(self, flag_name: str) -> Optional[Flag]:
+        return self._storage.get(flag_name)
+
+    def list_page(
+        self,
+        prefix: str = "",
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        deleted: Optional[bool] = None,
+    ) -> FlagsPage:
+        return self._storage.list_page(prefix=prefix, cursor=cursor, limit=limit, deleted=deleted)
+
+    def current_version(self) -> int:
+        return self._storage.current_version()
+
+    def upsert(self, flag_data: UnversionedFlagData) -> Flag:
+        flag = self._storage.upsert(flag_data)
+        self._next_fetch = 0
+        return flag
+
+    def delete(self, flag_name: str) -> None:
+        self._storage.delete(flag_name)
+        self._next_fetch = 0
+
+    def write_batch(self, upserts: List[UnversionedFlagData], deletions: List[str]) -> List[Flag]:
+        flags = self._storage.write_batch(upserts=upserts, deletions=deletions)
+        self._next_fetch = 0
+        return flags
+
+    def upsert_segment(self, segment_data: UnversionedSegmentData) -> Segment:
+        segment = self._storage.upsert_segment(segment_data)
+        self._next_fetch = 0
+        return segment
+
+    def delete_segment(self, segment_name: str) -> None:
+        self._storage.delete_segment(segment_name)
+        self._next_fetch = 0
+
+    def commit(self) -> None:
+        self._storage.commit()
+        self._next_fetch = 0
+
+    def record_usage(self, usages: Dict[str, FlagUsage]) -> None:
+        self._storage.record_usage(usages)
+
+    def usage(self) -> Dict[str, FlagUsage]:
+        return self._storage.usage()
+
+    def usage_for(self, flag_names: Iterable[str]) -> Dict[str, FlagUsage]:
+        return self._storage.usage_for(flag_names)
+
+    def _fetch(self) -> None:
+        """Fetches the updates since the previous fetch, if it is more than ttl seconds old."""
+        # Avoid taking the lock while the buffers are fresh.
+        if self._time_fn() < self._next_fetch:
+            return
+
+        with self._fetch_lock:
+            # Another thread may have fetched while this one waited for the lock.
+            now = self._time_fn()
+            if now < self._next_fetch or not self.circuit_breaker.allow(now):
+                return
+
+            try:
+                new_flags = self._storage.list(version__gt=self._flags.cursor)
+                new_segments = (
+                    self._storage.list_segments(version__gt=self._segments.cursor)
+                    if self.supports_segments
+                    else []
+                )
+            except Exception as error:
+                # Space out the next fetches, the lists being answered from memory meanwhile.
+                retry_at = self.circuit_breaker.record_failure(now, error)
+                self._next_fetch = max(retry_at, now + self._ttl)
+                raise
+            self.circuit_breaker.record_success()
+            with self._buffers_lock:
+                if isinstance(new_flags, FullListing):
+                    self._flags.reset(new_flags, new_flags.version)
+                else:
+                    self._flags.apply(new_flags)
+                self._segments.apply(new_segments)
+            self._next_fetch = now + self._ttl
@@ -0,0 +1,320 @@
+import json
+import sqlite3
+from contextlib import contextmanager
+from threading import RLock
+from time import time
+from typing import Dict, Iterable, Iterator, List, Optional, cast
+
+from flypper.entities.flag import Flag, FlagData, UnversionedFlagData
+from flypper.entities.segment import Segment, SegmentData, UnversionedSegmentData, segment_tombstone
+from flypper.entities.usage import FlagUsage
+from flypper.storage.abstract import AbstractStorage, FlagsPage, paginate
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS flypper_flags (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    tombstone INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS flypper_flags_version ON flypper_flags (version);
+CREATE TABLE IF NOT EXISTS flypper_versions (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO flypper_versions (id, version) VALUES (0, 0);
+CREATE TABLE IF NOT EXISTS flypper_segments (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    tombstone INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS flypper_usages (
+    name TEXT PRIMARY KEY,
+    enabled_count INTEGER NOT NULL,
+    disabled_count INTEGER NOT NULL,
+    last_evaluated_at REAL NOT NULL
+);
+"""
+
+class SqliteStorage(AbstractStorage):
+    """Stores the flags in a SQLite database, durable and shared between processes.
+
+    Flags are indexed by version, so listing the flags updated after a version
+    is an index range scan. The database uses the WAL journal mode, readers
+    from other processes don't block the writer and the other way around.
+
+    Each write is committed in its own transaction, so the versions listed are
+    always committed ones, and a failed write leaves nothing behind. Batches are
+    written within a single transaction under a single version.
+
+    Segments are stored in their own table, sharing the flags' versions.
+
+    Like the InMemoryStorage, deleting a flag leaves a tombstone for the clients' delta
+    syncs. Only the most recent tombstones_retention tombstones are kept.
+    Usages are recorded in their own transactions too.
+    """
+
+    supports_segments = True
+    supports_current_version = True
+
+    def __init__(self, path: str, timeout: float = 5.0, tombstones_retention: int = 10_000):
+        self._tombstones_retention: int = tombstones_retention
+        self._lock: RLock = RLock()
+        self._connection: sqlite3.Connection = sqlite3.connect(
+            path,
+            timeout=timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+    def list(self, version__gt: int = 0) -> List[Flag]:
+        with self._lock:
+            if version__gt <= 0:
+                rows = self._connection.execute(
+                    "SELECT data FROM flypper_flags WHERE tombstone = 0"
+                )
+            else:
+                rows = self._connection.execute(
+                    "SELECT data FROM flypper_flags WHERE version > ? ORDER BY version",
+                    (version__gt,),
+                )
+            return [Flag(json.loads(data)) for (data,) in rows]
+
+    def get(self, flag_name: str) -> Optional[Flag]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM flypper_flags WHERE name = ? AND tombstone = 0",
+                (flag_name,),
+            ).fetchone()
+            return Flag(json.loads(row[0])) if row is not None else None
+
+    def list_page(
+        self,
+        prefix: str = "",
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        deleted: Optional[bool] = None,
+    ) -> FlagsPage:
+        with self._lock:
+            # Walk the primary key's index from the page's first name, until the prefix ends.
+            if cursor is not None and cursor >= prefix:
+                rows = self._connection.execute(
+                    "SELECT name, data FROM flypper_flags WHERE name > ? AND tombstone = 0 ORDER BY name",
+                    (cursor,),
+                )
+            else:
+                rows = self._connection.execute(
+                    "SELECT name, data FROM flypper_flags WHERE name >= ? AND tombstone = 0 ORDER BY name",
+                    (prefix,),
+                )
+
+            def flags() -> Iterator[Flag]:
+                for name, data in rows:
+                    if not name.startswith(prefix):
+                        return
+                    flag = Flag(json.loads(data))
+                    if deleted is None or flag.is_deleted == deleted:
+                        yield flag
+
+            return paginate(flags(), limit)
+
+    def current_version(self) -> int:
+        with self._lock:
+            (version,) = self._connection.execute(
+                "SELECT version FROM flypper_versions WHERE id = 0"
+            ).fetchone()
+            return version
+
+    def upsert(self, flag_data: UnversionedFlagData) -> Flag:
+        with self._lock, self._writing():
+            return self._upsert(flag_data, self._next_version())
+
+    def delete(self, flag_name: str) -> None:
+        with self._lock, self._writing():
+            if not self._exists(flag_name):
+                raise KeyError(flag_name)
+            self._delete(flag_name, self._next_version())
+            self._trim_tombstones()
+
+    def write_batch(self, upserts: List[UnversionedFlagData], deletions: List[str]) -> List[Flag]:
+        with self._lock, self._writing():
+            upserted_names = {flag_data["name"] for flag_data in upserts}
+            for flag_name in deletions:
+                if flag_name not in upserted_names and not self._exists(flag_name):
+                    raise KeyError(flag_name)
+            if not upserts and not deletions:
+                return []
+
+            version = self._next_version()
+            flags = [self._upsert(flag_data, version) for flag_data in upserts]
+            for flag_name in deletions:
+                self._delete(flag_name, version)
+            self._trim_tombstones()
+            return flags
+
+    def list_segments(self, version__gt: int = 0) -> List[Segment]:
+        with self._lock:
+            if version__gt <= 0:
+                rows = self._connection.execute(
+                    "SELECT data FROM flypper_segments WHERE tombstone = 0"
+                )
+            else:
+                rows = self._connection.execute(
+                    "SELECT data FROM flypper_segments WHERE version > ? ORDER BY version",
+                    (version__gt,),
+                )
+            return [Segment(data=json.loads(data)) for (data,) in rows]
+
+    def upsert_segment(self, segment_data: UnversionedSegmentData) -> Segment:
+        with self._lock, self._writing():
+            segment = Segment(
+                data=cast(SegmentData, {
+                    **segment_data,
+                    "updated_at": time(),
+                    "version": self._next_version(),
+                }),
+            )
+            self._write_segment(segment, tombstone=False)
+            return segment
+
+    def delete_segment(self, segment_name: str) -> None:
+        with self._lock, self._writing():
+            (exists,) = self._connection.execute(
+                "SELECT COUNT(*) FROM flypper_segments WHERE name = ? AND tombstone = 0",
+                (segment_name,),
+            ).fetchone()
+            if not exists:
+                raise KeyError(segment_name)
+            self._write_segment(segment_tombstone(segment_name, self._next_version(), time()), tombstone=True)
+
+    def record_usage(self, usages: Dict[str, FlagUsage]) -> None:
+        with self._lock, self._writing():
+            self._connection.executemany(
+                """
+                INSERT INTO flypper_usages (name, enabled_count, disabled_count, last_evaluated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    enabled_count = enabled_count + excluded.enabled_count,
+                    disabled_count = disabled_count + excluded.disabled_count,
+                    last_evaluated_at = MAX(last_evaluated_at, excluded.last_evaluated_at)
+                """,
+                [
+                    (name, usage["enabled_count"], usage["disabled_count"], usage["last_evaluated_at"])
+                    for name, usage in usages.items()
+                ],
+            )
+
+    def usage(self) -> Dict[str, FlagUsage]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name, enabled_count, disabled_count, last_evaluated_at FROM flypper_usages"
+            )
+            return {
+                name: {
+                    "enabled_count": enabled_count,
+                    "disabled_count": disabled_count,
+                    "last_evaluated_at": last_evaluated_at,
+                }
+                for name, enabled_count, disabled_count, last_evaluated_at in rows
+            }
+
+    def usage_for(self, flag_names: Iterable[str]) -> Dict[str, FlagUsage]:
+        names = list(flag_names)
+        usages: Dict[str, FlagUsage] = {}
+        with self._lock:
+            # Stay below SQLite's limit on the number of query parameters.
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                rows = self._connection.execute(
+                    "SELECT name, enabled_count, disabled_count, last_evaluated_at FROM flypper_usages"
+                    f" WHERE name IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for name, enabled_count, disabled_count, last_evaluated_at in rows:
+                    usages[name] = {
+                        "enabled_count": enabled_count,
+                        "disabled_count": disabled_count,
+                        "last_evaluated_at": last_evaluated_at,
+                    }
+        return usages
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """Runs the block within a transaction, committed when it ends and rolled back if it raises.
+
+        The transaction takes the write lock first, so versions are assigned in order."""
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def _next_version(self) -> int:
+        self._connection.execute("UPDATE flypper_versions SET version = version + 1 WHERE id = 0")
+        return self.current_version()
+
+    def _write(self, flag: Flag, tombstone: bool) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO flypper_flags (name, version, tombstone, data) VALUES (?, ?, ?, ?)",
+            (flag.name, flag.version, int(tombstone), json.dumps(flag.data, separators=(",", ":"))),
+        )
+
+    def _write_segment(self, segment: Segment, tombstone: bool) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO flypper_segments (name, version, tombstone, data) VALUES (?, ?, ?, ?)",
+            (segment.name, segment.version, int(tombstone), json.dumps(segment.data, separators=(",", ":"))),
+        )
+
+    def _exists(self, flag_name: str) -> bool:
+        (exists,) = self._connection.execute(
+            "SELECT COUNT(*) FROM flypper_flags WHERE name = ? AND tombstone = 0",
+            (flag_name,),
+        ).fetchone()
+        return bool(exists)
+
+    def _upsert(self, flag_data: UnversionedFlagData, version: int) -> Flag:
+        flag = Flag(
+            data=cast(FlagData, {
+                **flag_data,
+                "updated_at": time(),
+                "version": version,
+            }),
+        )
+        self._write(flag, tombstone=False)
+        return flag
+
+    def _delete(self, flag_name: str, version: int) -> None:
+        tombstone = Flag(
+            data={
+                "name": flag_name,
+                "deleted": True,
+                "enabled": False,
+                "enabled_for_actors": None,
+                "enabled_for_percentage_of_actors": None,
+                "updated_at": time(),
+                "version": version,
+            },
+        )
+        self._write(tombstone, tombstone=True)
+
+    def _trim_tombstones(self) -> None:
+        """Only keeps the most recent tombstones, by name among the ones sharing a batch's version."""
+        self._connection.execute(
+            """
+            DELETE FROM flypper_flags WHERE name IN (
+                SELECT name FROM flypper_flags WHERE tombstone = 1
+                ORDER BY version DESC, name LIMIT -1 OFFSET ?
+            )
+            """,
+            (self._tombstones_retention,),
+        )
@@ -0,0 +1,155 @@
+import logging
+from abc import ABC, abstractmethod
+from threading import Event, Lock, Thread, current_thread, local
+from time import time
+from typing import Callable, Dict, List, Optional, TYPE_CHECKING
+from weakref import ref
+
+from flypper.entities.usage import FlagUsage, merge_usage
+
+if TYPE_CHECKING:
+    from flypper.storage.abstract import AbstractStorage
+
+logger = logging.getLogger(__name__)
+
+class _Buffer:
+    """The evaluations recorded by a thread, double buffered between the thread and the flusher."""
+
+    __slots__ = ("counts", "retired_counts", "retired_at", "thread")
+
+    def __init__(self, thread: Thread):
+        # By flag name: [enabled_count, disabled_count]. Only the thread records into it.
+        self.counts: Dict[str, List[int]] = {}
+        # The counts the last flush swapped out, and when: the next flush writes them.
+        self.retired_counts: Dict[str, List[int]] = {}
+        self.retired_at: float = 0.0
+        self.thread: "ref[Thread]" = ref(thread)
+
+    def is_orphan(self) -> bool:
+        """Tells if the thread recording into the buffer is gone."""
+        thread = self.thread()
+        return thread is None or not thread.is_alive()
+
+def _add_usages(usages: Dict[str, FlagUsage], counts: Dict[str, List[int]], evaluated_at: float) -> None:
+    for flag_name, (enabled_count, disabled_count) in counts.items():
+        usage: FlagUsage = {
+            "enabled_count": enabled_count,
+            "disabled_count": disabled_count,
+            "last_evaluated_at": evaluated_at,
+        }
+        previous_usage = usages.get(flag_name, None)
+        usages[flag_name] = merge_usage(previous_usage, usage) if previous_usage else usage
+
+class AbstractUsageSink(ABC):
+    @abstractmethod
+    def write(self, usages: Dict[str, FlagUsage]) -> None:
+        """Persists a batch of usages, by flag name."""
+        raise NotImplementedError
+
+class StorageUsageSink(AbstractUsageSink):
+    """Writes the usages to a storage, so the web UI can show them."""
+
+    def __init__(self, storage: "AbstractStorage"):
+        self._storage: "AbstractStorage" = storage
+
+    def write(self, usages: Dict[str, FlagUsage]) -> None:
+        self._storage.record_usage(usages)
+
+class UsageTracker:
+    """UsageTracker counts the flags' evaluations, and flushes them in batches to a sink.
+
+    Recording an evaluation only updates counts local to the current thread,
+    without any lock. Every flush_interval seconds, a background thread swaps
+    each thread's counts for new ones, and writes the counts it swapped out at
+    the previous flush to the sink: the threads are done updating them by then.
+    The usages hold the time of the flush that swapped out each flag's last
+    evaluation, at most flush_interval seconds after it.
+    """
+
+    def __init__(
+        self,
+        sink: AbstractUsageSink,
+        flush_interval: float = 10.0,
+        time_fn: Callable[[], float] = time,
+    ):
+        self._sink: AbstractUsageSink = sink
+        self._flush_interval: float = flush_interval
+        self._time_fn: Callable[[], float] = time_fn
+        self._local: local = local()
+        # Buffers are dropped once their thread is gone and they are drained.
+        self._buffers: List[_Buffer] = []
+        self._buffers_lock: Lock = Lock()
+        self._flush_lock: Lock = Lock()
+        self._flusher: Optional[Thread] = None
+        self._stop_event: Event = Event()
+
+    def record(self, flag_name: str, enabled: bool) -> None:
+        """Counts an evaluation of a flag."""
+        try:
+            buffer: _Buffer = self._local.buffer
+        except AttributeError:
+            buffer = self._register()
+
+        counts = buffer.counts
+        flag_counts = counts.get(flag_name, None)
+        if flag_counts is None:
+            flag_counts = counts[flag_name] = [0, 0]
+        flag_counts[0 if enabled else 1] += 1
+
+    def flush(self) -> None:
+        """Swaps out the counts of all the threads, and writes the ones swapped out by the previous flush.
+
+        The buffers of the threads that are gone are written at once."""
+        with self._flush_lock:
+            with self._buffers_lock:
+                buffers = list(self._buffers)
+                self._buffers = [buffer for buffer in buffers if not buffer.is_orphan()]
+
+            now = self._time_fn()
+            usages: Dict[str, FlagUsage] = {}
+            for buffer in buffers:
+                retired_counts, retired_at = buffer.retired_counts, buffer.retired_at
+                buffer.retired_counts, buffer.retired_at = buffer.counts, now
+                buffer.counts = {}
+                _add_usages(usages, retired_counts, retired_at)
+                if buffer.is_orphan():
+                    _add_usages(usages, buffer.retired_counts, now)
+            if usages:
+                self._sink.write(usages)
+
+    def start(self) -> None:
+        """Starts flushing the usages from a background thread."""
+        if self._flusher is not None:
+            return
+        self._stop_event = Event()
+        self._flusher = Thread(
+            target=self._flush_loop,
+            args=(self._stop_event,),
+            name="flypper-usage",
+            daemon=True,
+        )
+        self._flusher.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops the background thread, then flushes all the buffers."""
+        flusher = self._flusher
+        if flusher is not None:
+            self._stop_event.set()
+            self._flusher = None
+            flusher.join(timeout)
+        # The second flush writes the counts the first one swaps out.
+        self.flush()
+        self.flush()
+
+    def _register(self) -> _Buffer:
+        buffer = self._local.buffer = _Buffer(current_thread())
+        with self._buffers_lock:
+            self._buffers.append(buffer)
+        return buffer
+
+    def _flush_loop(self, stop_event: Event) -> None:
+        while not stop_event.wait(self._flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flypper failed to flush its flags usage")
@@ -0,0 +1,48 @@
+import gzip
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Dict, Hashable
+
+class RenderCache:
+    """RenderCache keeps the most recently rendered pages, along with their gzipped version.
+
+    Pages are cached by a key that must change whenever the page would, for instance
+    one made of the storage's version and the request's URL. Only the maxsize most
+    recently used pages are kept, the outdated ones being evicted first.
+    """
+
+    def __init__(self, maxsize: int = 128, compresslevel: int = 6):
+        self._maxsize: int = maxsize
+        self._compresslevel: int = compresslevel
+        self._pages: "OrderedDict[Hashable, Dict[str, bytes]]" = OrderedDict()
+        self._lock: Lock = Lock()
+
+    def get(self, key: Hashable, render: Callable[[], str], encoding: str = "identity") -> bytes:
+        """Returns the page in the given encoding, identity or gzip, rendering it if needed."""
+        with self._lock:
+            encodings = self._pages.get(key, None)
+            if encodings is not None:
+                self._pages.move_to_end(key)
+                body = encodings.get(encoding, None)
+                if body is not None:
+                    return body
+
+        # Render without the lock, two threads may render the same page at worst.
+        if encodings is None:
+            encodings = {"identity": render().encode("utf-8")}
+        if encoding == "gzip" and "gzip" not in encodings:
+            encodings = {
+                **encodings,
+                "gzip": gzip.compress(encodings["identity"], compresslevel=self._compresslevel),
+            }
+
+        with self._lock:
+            self._pages[key] = encodings
+            self._pages.move_to_end(key)
+            while len(self._pages) > self._maxsize:
+                self._pages.popitem(last=False)
+        return encodings[encoding]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
@@ -1,8 +1,13 @@
+import json
 import os
-from typing import cast, TYPE_CHECKING
+from datetime import datetime, timezone
+from itertools import chain, islice
+from time import time
+from typing import Callable, Collection, List, Optional, cast, TYPE_CHECKING
 
 from jinja2 import Environment
 from jinja2 import FileSystemLoader
+from werkzeug.exceptions import BadRequest
 from werkzeug.exceptions import HTTPException
 from werkzeug.exceptions import NotFound
 from werkzeug.routing import Map
@@ -12,19 +17,117 @@ from werkzeug.utils import redirect
 from werkzeug.wrappers import Request
 from werkzeug.wrappers import Response
 
+from flypper.entities.actor_ids import ActorIdSet, pack_actor_ids
+from flypper.entities.flag import Flag
+from flypper.entities.rules import compile_rules
+from flypper.storage.abstract import FullListing
+from flypper.wsgi.render_cache import RenderCache
+
 if TYPE_CHECKING:
-    from flypper.entities.flag import UnversionedFlagData
+    from flypper.entities.flag import FlagData, UnversionedFlagData, _EnabledForActors
+    from flypper.entities.rules import Rule as FlagRule
+    from flypper.metrics import MetricsRegistry
     from flypper.storage.abstract import AbstractStorage
 
+def first_actor_ids(actor_ids: Collection[str], count: int = 50) -> List[str]:
+    """Lists the first actor ids, by order, without sorting all of them when they are compact."""
+    if isinstance(actor_ids, ActorIdSet):
+        return list(islice(actor_ids, count))
+    return sorted(actor_ids)[:count]
+
+def edit_actor_ids(
+    flag: Flag,
+    actor_key: str,
+    added_actor_ids: Collection[str],
+    removed_actor_ids: Collection[str],
+    pack_threshold: Optional[int] = None,
+) -> "_EnabledForActors":
+    """Adds and removes some of a flag's actor ids, without sorting or repacking the unchanged ones.
+
+    With a pack_threshold, lists of at least that many actor ids are packed, see pack_actor_ids."""
+    enabled_for_actors = flag.data["enabled_for_actors"]
+    if enabled_for_actors is not None and not added_actor_ids and not removed_actor_ids:
+        return {**enabled_for_actors, "actor_key": actor_key}
+
+    actor_ids = flag.actor_ids
+    if isinstance(actor_ids, ActorIdSet):
+        actor_id_set = actor_ids.evolve(added_actor_ids, removed_actor_ids)
+        if pack_threshold is not None and len(actor_id_set) >= pack_threshold:
+            return {"actor_key": actor_key, "packed_actor_ids": actor_id_set.pack()}
+        return {"actor_key": actor_key, "actor_ids": list(actor_id_set)}
+
+    # Short lists keep their order, the added actor ids going last.
+    listed_actor_ids = (enabled_for_actors.get("actor_ids", None) if enabled_for_actors is not None else None) or []
+    new_actor_ids = list(dict.fromkeys(chain(listed_actor_ids, sorted(added_actor_ids))))
+    new_actor_ids = [actor_id for actor_id in new_actor_ids if actor_id not in removed_actor_ids]
+    if pack_threshold is None:
+        return {"actor_key": actor_key, "actor_ids": new_actor_ids}
+    return pack_actor_ids({"actor_key": actor_key, "actor_ids": new_actor_ids}, threshold=pack_threshold)
+
+def flags_payload(flags: List[Flag]) -> dict:
+    """Serializes the flags listed by the API, flagging a FullListing along with its version."""
+    payload: dict = {"flags": [flag.data for flag in flags]}
+    if isinstance(flags, FullListing):
+        payload.update(full=True, version=flags.version)
+    return payload
+
+def parse_rules(rules: object) -> Optional[List["FlagRule"]]:
+    """Validates a flag's rules, given as JSON or already decoded, raising BadRequest when invalid."""
+    if isinstance(rules, str):
+        if not rules.strip():
+            return None
+        try:
+            rules = json.loads(rules)
+        except ValueError:
+            raise BadRequest("Rules must be valid JSON")
+    if not rules:
+        return None
+    try:
+        compile_rules(cast("List[FlagRule]", rules))
+    except ValueError as error:
+        raise BadRequest(f"Invalid rules: {error}")
+    return cast("List[FlagRule]", rules)
+
 class FlypperWebUI:
+    """FlypperWebUI is a WSGI application to manage the flags of a storage.
+
+    With a storage supporting current_version, its pages are cached by the storage's
+    version: as long as no flag changes, a page is rendered once and then served from
+    the render_cache_size most recently used pages, gzipped when the browser accepts it.
+    Pages carry the version as ETag so browsers polling them get a 304 Not Modified
+    when nothing changed.
+
+    The same goes for the JSON API serving the flags' updates, which HttpStorage
+    syncs from: services can sync through the web UI instead of the storage.
+    The flags' usages aren't versioned: pages showing them are rendered again, with
+    a new ETag, every usage_refresh_interval seconds, so they show up with that delay.
+
+    With a pack_actor_ids_threshold, COMPACT_THRESHOLD for instance, the lists of
+    at least that many actor ids are packed when flags are edited or imported.
+    Clients older than packing can't read packed flags: only set it once all the
+    clients are upgraded.
+    """
+
     def __init__(
         self,
         storage: "AbstractStorage",
         url_prefix: str = "/flypper",
         route_prefix: str = "/flypper",
+        max_watch_timeout: float = 30.0,
+        metrics: Optional["MetricsRegistry"] = None,
+        page_size: int = 100,
+        render_cache_size: int = 128,
+        usage_refresh_interval: float = 10.0,
+        pack_actor_ids_threshold: Optional[int] = None,
     ):
         self._url_prefix = url_prefix
         self._storage = storage
+        self._page_size = page_size
+        self._render_cache = RenderCache(maxsize=render_cache_size)
+        self._usage_refresh_interval = usage_refresh_interval
+        self._pack_actor_ids_threshold = pack_actor_ids_threshold
+        self._max_watch_timeout = max_watch_timeout
+        self._metrics = metrics
         self.jinja_env = Environment(
             loader=FileSystemLoader(
                 os.path.join(os.path.dirname(__file__), "templates")
@@ -32,6 +135,10 @@ class FlypperWebUI:
             autoescape=True,
         )
         self.jinja_env.filters["hostname"] = lambda url: url_parse(url).netloc
+        self.jinja_env.filters["datetime"] = (
+            lambda timestamp: datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+        )
+        self.jinja_env.filters["first_actor_ids"] = first_actor_ids
         self.jinja_env.globals.update(path_for=self._path_for)
         self.url_map = Map(
             [
@@ -42,22 +149,38 @@ class FlypperWebUI:
                 Rule(f"{route_prefix}/soft_delete", endpoint="soft_delete", methods=["POST"]),
                 Rule(f"{route_prefix}/reactivate", endpoint="reactivate", methods=["POST"]),
                 Rule(f"{route_prefix}/delete", endpoint="delete", methods=["POST"]),
+                Rule(f"{route_prefix}/import", endpoint="import_flags", methods=["POST"]),
+                Rule(f"{route_prefix}/export", endpoint="export_flags", methods=["GET"]),
+                Rule(f"{route_prefix}/api/flags", endpoint="flags", methods=["GET"]),
+                Rule(f"{route_prefix}/api/version", endpoint="version", methods=["GET"]),
+                Rule(f"{route_prefix}/api/segments", endpoint="segments", methods=["GET"]),
+                Rule(f"{route_prefix}/api/watch", endpoint="watch", methods=["GET"]),
+                Rule(f"{route_prefix}/metrics", endpoint="metrics", methods=["GET"]),
             ]
         )
 
     def on_index(self, request):
-        flags = self._storage.list()
-        if not request.args.get("deleted", False):
-            return self.render_template(
-                "index.html",
-                flags=[flag for flag in flags if not flag.is_deleted],
+        deleted = bool(request.args.get("deleted", False))
+        query = request.args.get("q", "")
+
+        def render() -> str:
+            page = self._storage.list_page(
+                prefix=query,
+                cursor=request.args.get("cursor", None),
+                limit=self._page_size,
+                deleted=deleted,
             )
-        else:
-            return self.render_template(
-                "deleted.html",
-                flags=[flag for flag in flags if flag.is_deleted],
+            return self.render(
+                "deleted.html" if deleted else "index.html",
+                flags=page.flags,
+                next_cursor=page.next_cursor,
+                query=query,
+                deleted=deleted,
+                usages=self._storage.usage_for(flag.name for flag in page.flags),
             )
 
+        return self.render_cached(request, render)
+
     def on_create_flag(self, request):
         form = request.form
         self._storage.upsert({
@@ -70,12 +193,66 @@ class FlypperWebUI:
         self._storage.commit()
         return redirect("/flypper/")
 
+    def on_import_flags(self, request):
+        """Upserts the flags of an export, from an uploaded file or a JSON body, in a single batch."""
+        if request.is_json:
+            payload = request.get_json(silent=True)
+        elif "flags_file" in request.files:
+            try:
+                payload = json.load(request.files["flags_file"])
+            except ValueError:
+                payload = None
+        else:
+            payload = None
+        if not isinstance(payload, dict) or not isinstance(payload.get("flags", None), list):
+            raise BadRequest("Expected a JSON object with a list of flags")
+
+        flags_data = []
+        for data in payload["flags"]:
+            try:
+                enabled_for_actors = data.get("enabled_for_actors", None)
+                flags_data.append(cast("UnversionedFlagData", {
+                    "name": str(data["name"]),
+                    "enabled": bool(data["enabled"]),
+                    "enabled_for_actors": self._pack_actor_ids(enabled_for_actors) if enabled_for_actors else None,
+                    "enabled_for_percentage_of_actors": data.get("enabled_for_percentage_of_actors", None),
+                    "enabled_for_segments": data.get("enabled_for_segments", None),
+                    "rules": parse_rules(data.get("rules", None)),
+                    "deleted": bool(data.get("deleted", False)),
+                }))
+            except (KeyError, TypeError, AttributeError):
+                raise BadRequest("Each flag needs at least a name and an enabled value")
+
+            # Build each flag before writing any, so an invalid one doesn't fail the batch halfway.
+            try:
+                Flag(data=cast("FlagData", {**flags_data[-1], "updated_at": 0.0, "version": 0}))
+            except (KeyError, TypeError, ValueError, AttributeError) as error:
+                raise BadRequest(f"Invalid flag {flags_data[-1]['name']!r}: {error}")
+
+        with self._storage.batch() as batch:
+            for flag_data in flags_data:
+                batch.upsert(flag_data)
+
+        if request.is_json:
+            return self.render_json({"flags": [flag.data for flag in batch.flags]})
+        return redirect("/flypper/")
+
+    def on_export_flags(self, request):
+        """Downloads all the flags, soft-deleted ones included, in the format import expects."""
+        response = self.render_json({"flags": [flag.data for flag in self._storage.list()]})
+        response.headers["Content-Disposition"] = "attachment; filename=flypper-flags.json"
+        return response
+
     def on_edit_form(self, request):
         flag = self._fetch_flag(flag_name=request.args.get("flag_name", None))
         if not flag:
             return self.error_404()
 
-        return self.render_template("edit_form.html", flag=flag)
+        return self.render_cached(
+            request,
+            lambda: self.render("edit_form.html", flag=flag),
+            shows_usage=False,
+        )
 
     def on_edit(self, request):
         form = request.form
@@ -83,21 +260,26 @@ class FlypperWebUI:
         if not flag:
             return self.error_404()
 
+        # Actor ids are edited incrementally: the form only holds the added and removed ones.
+        enabled_for_actors = edit_actor_ids(
+            flag,
+            actor_key=form["enabled_for_actors_key"],
+            added_actor_ids=set(form.get("enabled_for_actors_added_ids", "").split()),
+            removed_actor_ids=set(form.get("enabled_for_actors_removed_ids", "").split()),
+            pack_threshold=self._pack_actor_ids_threshold,
+        ) if form.get("enabled_for_actors", "off") == "on" else None
+        rules = parse_rules(form.get("rules", ""))
+
         self._storage.upsert({
             "name": form["flag_name"],
             "enabled": form.get("enabled", "off") == "on",
-            "enabled_for_actors": {
-                "actor_key": form["enabled_for_actors_key"],
-                "actor_ids": [
-                    actor_id.strip()
-                    for actor_id in form["enabled_for_actors_ids"].split()
-                    if actor_id
-                ],
-            } if form.get("enabled_for_actors", "off") == "on" else None,
+            "enabled_for_actors": enabled_for_actors,
             "enabled_for_percentage_of_actors": {
                 "actor_key": form["enabled_for_percentage_of_actors_key"],
                 "percentage": float(form["enabled_for_percentage_of_actors_percentage"]),
             } if form.get("enabled_for_percentage_of_actors", "off") == "on" else None,
+            "enabled_for_segments": form.get("enabled_for_segments", "").split() or None,
+            "rules": rules,
             "deleted": flag.is_deleted,
         })
         self._storage.commit()
@@ -136,14 +318,113 @@ class FlypperWebUI:
         self._storage.commit()
         return redirect("/flypper/?deleted=1")
 
+    def on_flags(self, request):
+        """Lists the flags updated after the version__gt argument, all the flags by default."""
+        version__gt = request.args.get("version__gt", 0, type=int)
+        return self.render_cached(
+            request,
+            lambda: self.dump_json(flags_payload(self._storage.list(version__gt=version__gt))),
+            mimetype="application/json",
+            shows_usage=False,
+        )
+
+    def on_segments(self, request):
+        """Lists the segments updated after the version__gt argument, all the segments by default."""
+        version__gt = request.args.get("version__gt", 0, type=int)
+        return self.render_cached(
+            request,
+            lambda: self.dump_json({
+                "segments": [segment.data for segment in self._storage.list_segments(version__gt=version__gt)],
+            }),
+            mimetype="application/json",
+            shows_usage=False,
+        )
+
+    def on_version(self, request):
+        """Returns the version of the storage's latest update, and whether it can be watched."""
+        return self.render_json({
+            "version": self._storage.current_version(),
+            "supports_watch": self._storage.supports_watch,
+        })
+
+    def on_watch(self, request):
+        """Long-polls the storage for the flags updated after the version__gt argument."""
+        version__gt = request.args.get("version__gt", 0, type=int)
+        timeout = min(
+            request.args.get("timeout", self._max_watch_timeout, type=float),
+            self._max_watch_timeout,
+        )
+        flags = self._storage.watch(version__gt=version__gt, timeout=timeout)
+        return self.render_json(flags_payload(flags))
+
+    def on_metrics(self, request):
+        """Renders the metrics registry given to the web UI, in the Prometheus text format."""
+        if self._metrics is None:
+            return self.error_404()
+
+        return Response(
+            self._metrics.render(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
     def error_404(self):
         response = self.render_template("404.html")
         response.status_code = 404
         return response
 
-    def render_template(self, template_name, **context):
+    def _pack_actor_ids(self, enabled_for_actors: "_EnabledForActors") -> "_EnabledForActors":
+        """Packs long lists of actor ids, when a pack_actor_ids_threshold is set."""
+        if self._pack_actor_ids_threshold is None:
+            return enabled_for_actors
+        return pack_actor_ids(enabled_for_actors, threshold=self._pack_actor_ids_threshold)
+
+    def render(self, template_name, **context) -> str:
         t = self.jinja_env.get_template(template_name)
-        return Response(t.render(context), mimetype="text/html")
+        return t.render(context)
+
+    def render_template(self, template_name, **context):
+        return Response(self.render(template_name, **context), mimetype="text/html")
+
+    def render_cached(
+        self,
+        request,
+        render: Callable[[], str],
+        mimetype: str = "text/html",
+        shows_usage: bool = True,
+    ):
+        """Responds to a GET request with a page rendered at most once per storage version.
+
+        Answers 304 Not Modified when the request's If-None-Match holds the page's ETag.
+        Without a cheap current_version, the page is rendered for each request."""
+        if not self._storage.supports_current_version:
+            return Response(render(), mimetype=mimetype)
+
+        version = str(self._storage.current_version())
+        if shows_usage:
+            # Usages aren't versioned: render the page again every usage_refresh_interval.
+            version = f"{version}-{int(time() // self._usage_refresh_interval)}"
+        encoding = "gzip" if request.accept_encodings["gzip"] else "identity"
+        # ETags differ between the encodings of a page.
+        etag = version if encoding == "identity" else f"{version}.gzip"
+        cache_key = (request.path, request.query_string, version)
+
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            body = self._render_cache.get(cache_key, render, encoding)
+            response = Response(body, mimetype=mimetype)
+            if encoding == "gzip":
+                response.content_encoding = "gzip"
+        response.set_etag(etag)
+        response.vary.add("Accept-Encoding")
+        response.cache_control.no_cache = True
+        return response
+
+    def dump_json(self, payload) -> str:
+        return json.dumps(payload, separators=(",", ":"))
+
+    def render_json(self, payload):
+        return Response(self.dump_json(payload), mimetype="application/json")
 
     def dispatch_request(self, request):
         adapter = self.url_map.bind_to_environ(request.environ)
@@ -167,11 +448,7 @@ class FlypperWebUI:
         if not flag_name:
             return None
 
-        flag = next(
-            (flag for flag in self._storage.list() if flag.name == flag_name),
-            None,
-        )
-        return flag
+        return self._storage.get(flag_name)
 
     def _path_for(self, path: str):
         sep = "" if path.startswith("/") else "/"
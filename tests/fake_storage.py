@@ -1,13 +1,44 @@
+from time import sleep
 from typing import List
 
 from flypper import Flag
+from flypper.storage.abstract import FlagsPage
 from flypper.storage.in_memory import InMemoryStorage
 
 class FakeStorage(InMemoryStorage):
     def __init__(self):
         super().__init__()
         self.list_call_count = 0
+        self.list_page_call_count = 0
 
     def list(self, *args, **kwargs) -> List[Flag]:
         self.list_call_count = self.list_call_count + 1
         return super().list(*args, **kwargs)
+
+    def list_page(self, *args, **kwargs) -> FlagsPage:
+        self.list_page_call_count = self.list_page_call_count + 1
+        return super().list_page(*args, **kwargs)
+
+class SlowFakeStorage(FakeStorage):
+    """A FakeStorage taking delay seconds to list the flags, like a remote storage would."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def list(self, *args, **kwargs) -> List[Flag]:
+        sleep(self.delay)
+        return super().list(*args, **kwargs)
+
+class FlakyFakeStorage(FakeStorage):
+    """A FakeStorage failing to list the flags while failing is set, like an unreachable storage would."""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = False
+
+    def list(self, *args, **kwargs) -> List[Flag]:
+        if self.failing:
+            self.list_call_count = self.list_call_count + 1
+            raise ConnectionError("Storage unavailable")
+        return super().list(*args, **kwargs)
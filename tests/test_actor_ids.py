@@ -0,0 +1,52 @@
+from flypper.entities.actor_ids import ActorIdSet, compile_actor_ids, pack_actor_ids
+
+def test_actor_id_set_is_sorted_and_deduplicated():
+    actor_ids = ActorIdSet(["b", "a", "é", "c", "a"])
+
+    assert list(actor_ids) == ["a", "b", "c", "é"]
+    assert len(actor_ids) == 4
+    assert all(actor_id in actor_ids for actor_id in ["a", "b", "c", "é"])
+    assert all(actor_id not in actor_ids for actor_id in ["", "0", "aa", "d", "e", 42])
+    assert "a" not in ActorIdSet()
+
+def test_bloom_filter_keeps_the_same_answers():
+    actor_ids = [f"user_{i}" for i in range(0, 2_000, 2)]
+    with_bloom = ActorIdSet(actor_ids, bloom_bits_per_id=10)
+    without_bloom = ActorIdSet(actor_ids)
+
+    for i in range(2_000):
+        assert (f"user_{i}" in with_bloom) == (f"user_{i}" in without_bloom) == (i % 2 == 0)
+
+def test_pack_then_unpack():
+    actor_ids = ActorIdSet([f"user_{i}" for i in range(1_000)] + ["é\n with spaces"])
+
+    assert ActorIdSet.unpack(actor_ids.pack()) == actor_ids
+    assert ActorIdSet.unpack(ActorIdSet().pack()) == ActorIdSet()
+
+def test_evolve_adds_and_removes_ids():
+    actor_ids = ActorIdSet([f"user_{i}" for i in range(0, 1_000, 2)])
+
+    evolved = actor_ids.evolve(added=["user_1", "user_0", "a", "z"], removed=["user_2", "user_3", "z"])
+
+    assert evolved == ActorIdSet([f"user_{i}" for i in range(0, 1_000, 2) if i != 2] + ["user_1", "a"])
+    assert ActorIdSet.unpack(evolved.pack()) == evolved
+    assert actor_ids.evolve() == actor_ids
+    assert ActorIdSet().evolve(added=["b", "a"]) == ActorIdSet(["a", "b"])
+
+def test_long_lists_are_packed_and_compiled_into_compact_sets():
+    enabled_for_actors = pack_actor_ids(
+        {"actor_key": "user_id", "actor_ids": [f"user_{i}" for i in range(100)]},
+        threshold=100,
+    )
+
+    assert "actor_ids" not in enabled_for_actors
+    compiled = compile_actor_ids(enabled_for_actors)
+    assert isinstance(compiled, ActorIdSet)
+    assert "user_42" in compiled and "user_100" not in compiled
+
+    short = {"actor_key": "user_id", "actor_ids": ["42"]}
+    assert pack_actor_ids(short, threshold=100) is short
+    assert compile_actor_ids(short) == ("42",)
+    assert compile_actor_ids({"actor_key": "user_id", "actor_ids": [str(i) for i in range(20)]}) == frozenset(
+        str(i) for i in range(20)
+    )
@@ -0,0 +1,72 @@
+import asyncio
+from typing import List
+
+from flypper import Flag
+from flypper.async_client import AsyncClient
+from flypper.storage.async_executor import AsyncExecutorStorage
+from flypper.storage.async_in_memory import AsyncInMemoryStorage
+
+from tests.factories import create_flag_data
+from tests.fake_storage import FakeStorage
+
+class SlowAsyncStorage(AsyncInMemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.list_call_count = 0
+
+    async def list(self, version__gt: int = 0) -> List[Flag]:
+        self.list_call_count = self.list_call_count + 1
+        await asyncio.sleep(0.01)
+        return await super().list(version__gt=version__gt)
+
+def test_async_client_shares_in_flight_syncs():
+    async def scenario():
+        storage = SlowAsyncStorage()
+        await storage.upsert(create_flag_data(name="foo"))
+        client = AsyncClient(storage=storage, ttl=60)
+
+        results = await asyncio.gather(*[client.flags() for _ in range(10)])
+
+        assert storage.list_call_count == 1
+        assert all("foo" in flags for flags in results)
+
+    asyncio.run(scenario())
+
+def test_async_client_uses_a_cache_valid_for_ttl_seconds():
+    async def scenario():
+        storage = SlowAsyncStorage()
+        client = AsyncClient(storage=storage, ttl=0)
+        await client.flags()
+        await client.flags()
+        assert storage.list_call_count == 2
+
+        client = AsyncClient(storage=storage, ttl=60)
+        await client.flags()
+        await client.flags()
+        assert storage.list_call_count == 3
+
+    asyncio.run(scenario())
+
+def test_async_client_builds_synchronous_contexts():
+    async def scenario():
+        storage = AsyncInMemoryStorage()
+        await storage.upsert(create_flag_data(name="foo"))
+        client = AsyncClient(storage=storage)
+
+        context = await client.context(user_id="42")
+
+        assert context.is_enabled("foo")
+        assert context["user_id"] == "42"
+
+    asyncio.run(scenario())
+
+def test_async_executor_storage_wraps_a_synchronous_storage():
+    async def scenario():
+        storage = FakeStorage()
+        storage.upsert(create_flag_data(name="foo"))
+        client = AsyncClient(storage=AsyncExecutorStorage(storage))
+
+        assert "foo" in await client.flags()
+        assert storage.list_call_count == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,12 @@
+from benchmarks.__main__ import BENCHMARKS, run
+
+def test_benchmarks_run_quickly():
+    report = run(["evaluation", "sync", "web_ui"], quick=True)
+
+    assert set(report["results"]) == {"evaluation", "sync", "web_ui"}
+    assert all(
+        value >= 0
+        for results in report["results"].values()
+        for value in results.values()
+    )
+    assert "contention" in BENCHMARKS
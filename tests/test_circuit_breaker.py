@@ -0,0 +1,27 @@
+from flypper.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, backoff_base=1.0, backoff_max=3.0, random_fn=lambda: 1.0)
+    error = ConnectionError()
+
+    assert breaker.record_failure(0.0, error) == 0.0
+    assert breaker.state == CLOSED
+    assert breaker.record_failure(0.0, error) == 1.0
+    assert breaker.state == OPEN
+    assert not breaker.allow(0.5)
+
+    assert breaker.allow(1.0)
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow(1.0)
+    assert breaker.record_failure(1.0, error) == 3.0
+    assert breaker.allow(3.0)
+    assert breaker.record_failure(3.0, error) == 6.0  # Capped by backoff_max
+    assert breaker.last_error is error
+
+    assert breaker.allow(6.0)
+    breaker.record_success()
+    assert (breaker.state, breaker.consecutive_failures, breaker.last_error) == (CLOSED, 0, None)
+
+def test_backoff_is_jittered():
+    breaker = CircuitBreaker(failure_threshold=1, backoff_base=10.0, random_fn=lambda: 0.0)
+    assert breaker.record_failure(0.0, ConnectionError()) == 5.0
@@ -1,9 +1,16 @@
+import gc
+import weakref
+from time import monotonic, sleep
 from typing import cast
 
+import pytest
+
 from flypper import Client, Context, UnversionedFlagData
+from flypper import client as client_module
+from flypper.circuit_breaker import CLOSED, OPEN, CircuitBreaker, CircuitOpenError, SyncTimeoutError
 
 from tests.factories import create_flag_data
-from tests.fake_storage import FakeStorage
+from tests.fake_storage import FakeStorage, FlakyFakeStorage, SlowFakeStorage
 
 def test_client_fetches_flags_from_storage():
     storage = FakeStorage()
@@ -51,3 +58,229 @@ def test_call_creates_a_context():
     context = client(foo="bar")
     assert isinstance(context, Context)
     assert context["foo"] == "bar"
+
+def test_client_shares_a_bucket_cache_between_flags():
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=0, bucket_cache_size=10)
+    for name in ("foo", "bar"):
+        storage.upsert(cast(UnversionedFlagData, {
+            **create_flag_data(name=name),
+            "enabled_for_percentage_of_actors": {"actor_key": "user_id", "percentage": 55.55},
+        }))
+
+    with client(user_id="7") as c:
+        assert c.is_enabled("foo")
+        assert c.is_enabled("bar")
+    with client(user_id="53") as c:
+        assert not c.is_enabled("foo")
+
+    assert client.bucket_cache is not None
+    stats = client.bucket_cache.stats()
+    assert (stats.hits, stats.misses, stats.currsize) == (1, 2, 2)
+
+def test_client_has_no_bucket_cache_by_default():
+    client = Client(storage=FakeStorage())
+    assert client.bucket_cache is None
+
+def test_client_refreshes_in_the_background():
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=0.01, background_refresh=True)
+    try:
+        assert storage.list_call_count == 1
+        storage.upsert(create_flag_data(name="foo"))
+
+        deadline = monotonic() + 1.0
+        while "foo" not in client.flags() and monotonic() < deadline:
+            sleep(0.01)
+        assert "foo" in client.flags()
+    finally:
+        client.stop()
+
+    call_count = storage.list_call_count
+    sleep(0.05)
+    assert storage.list_call_count == call_count
+
+def test_client_refreshed_in_the_background_reads_without_syncing():
+    now = [0.0]
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=60, time_fn=lambda: now[0], max_staleness=120)
+    client.start()
+    try:
+        now[0] = 100.0
+        client.flags()
+        assert storage.list_call_count == 1
+
+        # Too stale: the background thread isn't keeping up, sync synchronously.
+        now[0] = 121.0
+        client.flags()
+        assert storage.list_call_count == 2
+    finally:
+        client.stop()
+
+def test_client_removes_hard_deleted_flags_during_sync():
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=0)
+
+    storage.upsert(create_flag_data(name="foo"))
+    assert "foo" in client.flags()
+
+    storage.delete("foo")
+    assert "foo" not in client.flags()
+
+def test_client_ignores_soft_deleted_flags_it_never_saw():
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=0)
+
+    storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name="foo"), "deleted": True}))
+    assert "foo" not in client.flags()
+
+def test_client_watches_the_storage_for_changes():
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=60, watch=True)
+    try:
+        storage.upsert(create_flag_data(name="foo"))
+
+        deadline = monotonic() + 1.0
+        while "foo" not in client.flags() and monotonic() < deadline:
+            sleep(0.01)
+        assert "foo" in client.flags()
+    finally:
+        # Stopping doesn't wait for the storage's watch to time out.
+        stopped_at = monotonic()
+        client.stop(timeout=5)
+        assert monotonic() - stopped_at < 1
+
+def test_client_syncs_the_segments_with_the_flags():
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=0)
+    storage.upsert(cast(UnversionedFlagData, {
+        **create_flag_data(name="foo"),
+        "enabled_for_segments": ["staff"],
+    }))
+    assert not client(user_id="1").is_enabled("foo")
+
+    storage.upsert_segment({
+        "name": "staff",
+        "deleted": False,
+        "actors": {"actor_key": "user_id", "actor_ids": ["1"]},
+    })
+    assert client(user_id="1").is_enabled("foo")
+    assert "staff" in client.segments()
+
+    storage.delete_segment("staff")
+    assert not client(user_id="1").is_enabled("foo")
+    assert "staff" not in client.segments()
+
+def test_client_serves_its_last_flags_while_the_storage_fails():
+    now = [0.0]
+    storage = FlakyFakeStorage()
+    breaker = CircuitBreaker(failure_threshold=2, backoff_base=10.0, random_fn=lambda: 1.0)
+    client = Client(storage=storage, ttl=0, time_fn=lambda: now[0], circuit_breaker=breaker)
+    storage.upsert(create_flag_data(name="foo"))
+    assert "foo" in client.flags()
+
+    storage.failing = True
+    for _ in range(5):
+        assert "foo" in client.flags()
+    assert storage.list_call_count == 3
+    assert client.circuit_breaker.state == "open"
+
+    now[0] = 10.0
+    storage.failing = False
+    storage.upsert(create_flag_data(name="bar"))
+    assert set(client.flags()) == {"foo", "bar"}
+    assert client.circuit_breaker.state == "closed"
+    assert client.staleness() == 0.0
+
+def test_client_raises_when_it_has_no_flags_to_serve():
+    storage = FlakyFakeStorage()
+    storage.failing = True
+    client = Client(storage=storage, ttl=0, circuit_breaker=CircuitBreaker(failure_threshold=1))
+
+    with pytest.raises(ConnectionError):
+        client.flags()
+    with pytest.raises(CircuitOpenError):
+        client.flags()
+    assert storage.list_call_count == 1
+
+def test_client_times_out_slow_syncs():
+    storage = SlowFakeStorage(delay=0)
+    client = Client(storage=storage, ttl=0, sync_timeout=0.05)
+    storage.upsert(create_flag_data(name="foo"))
+    assert "foo" in client.flags()
+    # The syncs share a single thread.
+    fetching_thread = client._fetcher._thread
+    client.flags()
+    assert client._fetcher._thread is fetching_thread
+
+    storage.delay = 0.5
+    started_at = monotonic()
+    assert "foo" in client.flags()
+    assert monotonic() - started_at < 0.4
+    assert isinstance(client.circuit_breaker.last_error, SyncTimeoutError)
+
+def test_watch_failures_open_the_circuit():
+    storage = FlakyFakeStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    breaker = CircuitBreaker(failure_threshold=1, backoff_base=60.0)
+    client = Client(storage=storage, ttl=0.01, watch=True, circuit_breaker=breaker)
+    try:
+        storage.failing = True
+        deadline = monotonic() + 1.0
+        while breaker.state == CLOSED and monotonic() < deadline:
+            sleep(0.01)
+        assert breaker.state == OPEN
+        assert isinstance(breaker.last_error, ConnectionError)
+
+        # The storage isn't called again before the circuit's retry time.
+        list_call_count = storage.list_call_count
+        sleep(0.1)
+        assert storage.list_call_count == list_call_count
+        assert "foo" in client.flags()
+    finally:
+        client.stop()
+
+def test_forked_clients_restart_their_refresh_on_first_read():
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=60, background_refresh=True)
+    try:
+        client_module._after_fork_in_child()
+        # The fork hook doesn't call the storage.
+        assert storage.list_call_count == 1
+        assert client._refresher is None
+
+        client.flags()
+        assert client._refresher is not None and client._refresher.is_alive()
+    finally:
+        client.stop()
+
+def test_clients_are_not_kept_alive_by_the_fork_hook():
+    client = Client(storage=FakeStorage())
+    assert client in client_module._clients
+    client_ref = weakref.ref(client)
+    del client
+    gc.collect()
+    assert client_ref() is None
+
+def test_background_refresh_waits_between_syncs_even_without_ttl():
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=0, background_refresh=True)
+    try:
+        sleep(0.05)
+        assert storage.list_call_count == 1
+    finally:
+        client.stop()
+
+def test_watches_returning_early_are_spaced_out():
+    class EagerWatchStorage(FakeStorage):
+        def watch(self, version__gt, timeout):
+            return self.list(version__gt=version__gt)
+
+    storage = EagerWatchStorage()
+    client = Client(storage=storage, ttl=5, watch=True)
+    try:
+        sleep(0.2)
+    finally:
+        client.stop()
+    # The first sync, then a single watch.
+    assert storage.list_call_count <= 3
@@ -1,6 +1,10 @@
 from typing import cast
 
+import pytest
+
 from flypper import Client, Context, UnversionedFlagData
+from flypper.entities.segment import Segment
+from flypper.payload import FlagsPayload
 
 from tests.factories import create_flag_data
 from tests.fake_storage import FakeStorage
@@ -37,3 +41,91 @@ def test_context_manager():
     with client() as c:
         assert c.is_enabled("foo")
 
+
+def test_context_evaluates_a_flag_for_many_actors():
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=0)
+    storage.upsert(cast(UnversionedFlagData, {
+        **create_flag_data(name="foo"),
+        "enabled_for_actors": {"actor_key": "user_id", "actor_ids": ["2"]},
+    }))
+
+    with client(org_id="acme") as c:
+        assert c.evaluate_many("foo", "user_id", ["1", "2", "3"]) == [False, True, False]
+        assert c.evaluate_many("bar", "user_id", ["1", "2", "3"]) == [False, False, False]
+        # Entries can be named like the parameters.
+        assert c.evaluate_many("foo", "user_id", ["1", "2"], {"actor_ids": "x", "flag_name": "y"}) == [False, True]
+
+def test_context_checks_segment_membership_once_per_actor(monkeypatch):
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=0)
+    storage.upsert_segment({
+        "name": "staff",
+        "deleted": False,
+        "actors": {"actor_key": "user_id", "actor_ids": ["1"]},
+    })
+    for name in ("foo", "bar"):
+        storage.upsert(cast(UnversionedFlagData, {
+            **create_flag_data(name=name),
+            "enabled_for_segments": ["staff"],
+        }))
+
+    contains_calls = []
+    original_contains = Segment.contains
+    def contains(segment, entries):
+        contains_calls.append(entries)
+        return original_contains(segment, entries)
+    monkeypatch.setattr(Segment, "contains", contains)
+
+    with client(user_id="1") as c:
+        assert c.is_enabled("foo")
+        assert c.is_enabled("bar")
+        assert not c.is_enabled("foo", user_id="2")
+        assert c.evaluate_many("bar", "user_id", ["1", "2", "3"]) == [True, False, False]
+        assert len(contains_calls) == 3
+
+def test_context_evaluates_all_the_flags_once():
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=0)
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name="bar"), "enabled": False}))
+    storage.upsert(cast(UnversionedFlagData, {
+        **create_flag_data(name="baz"),
+        "enabled_for_actors": {"actor_key": "user_id", "actor_ids": ["1"]},
+    }))
+
+    context = client(user_id="1")
+    assert context.evaluate_all() == {"bar": False, "baz": True, "foo": True}
+    assert context.evaluate_all(["foo", "missing"]) == {"foo": True, "missing": False}
+    assert context.payload() is context.payload()
+
+    context["user_id"] = "2"
+    assert context.evaluate_all() == {"bar": False, "baz": False, "foo": True}
+    assert storage.list_call_count == 1
+
+def test_payload_packs_the_evaluations_into_a_bitset():
+    storage = FakeStorage()
+    client = Client(storage=storage, ttl=0)
+    for index in range(10):
+        storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name=f"flag_{index}"), "enabled": index % 3 == 0}))
+
+    payload = client().payload()
+    packed = payload.pack()
+    assert len(packed.split(".")[1]) == 3
+
+    unpacked = FlagsPayload.unpack(packed, payload.names)
+    assert unpacked.to_dict() == client().evaluate_all()
+    with pytest.raises(ValueError):
+        FlagsPayload.unpack(packed, tuple(reversed(payload.names)))
+
+def test_clients_keep_their_own_flags_ordering():
+    storage = FakeStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    client, other_client = Client(storage=storage, ttl=0), Client(storage=FakeStorage(), ttl=0)
+
+    names = client().payload().names
+    assert other_client().payload().names == ()
+    assert client().payload().names is names  # Still cached, no sync published new flags
+
+    storage.upsert(create_flag_data(name="bar"))
+    assert client().payload().names == ("bar", "foo")
@@ -1,6 +1,11 @@
+import json
+from hashlib import md5
 from typing import cast
 
+import pytest
+
 from flypper import Flag, FlagData
+from flypper.entities.actor_ids import COMPACT_THRESHOLD, pack_actor_ids
 
 def test_deleted_flag():
     flag = create_flag(deleted=True)
@@ -23,6 +28,16 @@ def test_enabled_for_actors_flag():
     assert not flag.is_enabled(user_id="5")
     assert not flag.is_enabled()
 
+def test_enabled_for_packed_actors_flag():
+    flag = create_flag(enabled_for_actors=pack_actor_ids(
+        {"actor_key": "user_id", "actor_ids": ["8", "6"]},
+        threshold=0,
+    ))
+    assert "actor_ids" not in flag.data["enabled_for_actors"]
+    assert flag.is_enabled(user_id="6")
+    assert not flag.is_enabled(user_id="5")
+    assert list(flag.actor_ids) == ["6", "8"]
+
 def test_enabled_for_percentage_of_actors_flag():
     flag = create_flag(enabled_for_percentage_of_actors={
         "actor_key": "user_id",
@@ -32,6 +47,131 @@ def test_enabled_for_percentage_of_actors_flag():
     assert not flag.is_enabled(user_id="53")
     assert not flag.is_enabled()
 
+def test_enabled_for_100_percent_of_actors_flag():
+    flag = create_flag(enabled_for_percentage_of_actors={
+        "actor_key": "user_id",
+        "percentage": 100.00,
+    })
+    assert flag.is_enabled(user_id="53")
+    assert flag.is_enabled()
+
+def test_enabled_for_percentage_of_actors_matches_the_bucket_formula():
+    for percentage in (0.0, 0.01, 12.5, 55.55, 99.99):
+        flag = create_flag(enabled_for_percentage_of_actors={
+            "actor_key": "user_id",
+            "percentage": percentage,
+        })
+        for actor_id in map(str, range(1000)):
+            actor_md5 = md5(actor_id.encode("utf-8")).digest()
+            expected = (int.from_bytes(actor_md5, "big") % 100_00) / 100.00 <= percentage
+            assert flag.is_enabled(user_id=actor_id) is expected
+
+def test_enabled_for_actors_and_percentage_of_actors_flag():
+    flag = create_flag(
+        enabled_for_actors={
+            "actor_key": "user_id",
+            "actor_ids": ["7", "53"],
+        },
+        enabled_for_percentage_of_actors={
+            "actor_key": "user_id",
+            "percentage": 55.55,
+        },
+    )
+    assert flag.is_enabled(user_id="7")
+    assert not flag.is_enabled(user_id="53")
+
+def test_deleted_flag_ignores_its_rules():
+    flag = create_flag(deleted=True, enabled_for_actors={
+        "actor_key": "user_id",
+        "actor_ids": ["8"],
+    })
+    assert not flag.is_enabled(user_id="8")
+
+def test_flag_rebuilds_its_data():
+    packed_actors = pack_actor_ids({"actor_key": "user_id", "actor_ids": ["8", "6"]}, threshold=1)
+    segments_and_rules = {
+        "enabled_for_segments": ["staff"],
+        "rules": [{"entry": "plan", "operator": "eq", "value": "pro"}],
+    }
+    for overrides in (
+        {"enabled_for_actors": {"actor_key": "user_id", "actor_ids": ["8", "6"]}},
+        {"enabled_for_actors": packed_actors},
+        {"enabled_for_percentage_of_actors": {"actor_key": "user_id", "percentage": 100.0}},
+        segments_and_rules,
+        {"deleted": True},
+    ):
+        flag = create_flag(**overrides)
+        assert flag.data == {**create_flag().data, **overrides}
+        assert Flag(json.loads(json.dumps(flag.data))).data == flag.data
+        assert not hasattr(flag, "__dict__")
+
+    # Lists of actor ids come back in their order, without the duplicates, and unknown keys come back as well.
+    for actor_ids in (["3", "1", "3"], [str(i) for i in range(20, 0, -1)] + ["20"]):
+        flag = create_flag(enabled_for_actors={"actor_key": "user_id", "actor_ids": actor_ids}, owner="team-a")
+        assert flag.data == {
+            **create_flag().data,
+            "enabled_for_actors": {"actor_key": "user_id", "actor_ids": list(dict.fromkeys(actor_ids))},
+            "owner": "team-a",
+        }
+
+    # Only the longest lists, held in an ActorIdSet, come back sorted.
+    flag = create_flag(enabled_for_actors={"actor_key": "user_id", "actor_ids": ["b", "a", "a"] * COMPACT_THRESHOLD})
+    assert flag.data["enabled_for_actors"] == {"actor_key": "user_id", "actor_ids": ["a", "b"]}
+
+def test_flag_data_gives_away_a_copy_of_the_rules():
+    flag = create_flag(rules=[{"entry": "plan", "operator": "eq", "value": "pro"}])
+    flag.data["rules"][0]["value"] = "free"
+    flag.data["rules"].clear()
+
+    assert flag.data["rules"] == [{"entry": "plan", "operator": "eq", "value": "pro"}]
+
+def test_flag_with_rules():
+    flag = create_flag(rules=[
+        {"entry": "plan", "operator": "in", "values": ["pro", "enterprise"]},
+        {"any": [
+            {"entry": "country", "operator": "eq", "value": "FR"},
+            {"entry": "app_version", "operator": "semver_gte", "value": "2.1.0"},
+        ]},
+    ])
+    assert flag.is_enabled(plan="pro", country="FR")
+    assert flag.is_enabled(plan="enterprise", app_version="2.10.0")
+    assert not flag.is_enabled(plan="enterprise", app_version="2.1.0-beta.1")
+    assert not flag.is_enabled(plan="free", country="FR")
+    assert not flag.is_enabled(country="FR")
+
+def test_flag_with_invalid_segments():
+    for segment_names in ("staff", ["staff", 1], {"staff": True}):
+        with pytest.raises(ValueError):
+            create_flag(enabled_for_segments=segment_names)
+
+def test_evaluate_many_matches_is_enabled():
+    actor_ids = [str(i) for i in range(500)]
+    flags = [
+        create_flag(),
+        create_flag(enabled=False),
+        create_flag(enabled_for_actors={"actor_key": "user_id", "actor_ids": ["3", "8", "13"]}),
+        create_flag(enabled_for_percentage_of_actors={"actor_key": "user_id", "percentage": 33.3}),
+        create_flag(
+            enabled_for_actors={"actor_key": "user_id", "actor_ids": actor_ids[::2]},
+            enabled_for_percentage_of_actors={"actor_key": "user_id", "percentage": 50.0},
+        ),
+        create_flag(
+            enabled_for_actors={"actor_key": "org_id", "actor_ids": ["acme"]},
+            enabled_for_percentage_of_actors={"actor_key": "user_id", "percentage": 50.0},
+        ),
+        create_flag(
+            enabled_for_percentage_of_actors={"actor_key": "user_id", "percentage": 50.0},
+            rules=[{"entry": "user_id", "operator": "lt", "value": 250}],
+        ),
+        create_flag(rules=[{"entry": "org_id", "operator": "eq", "value": "acme"}]),
+    ]
+    for flag in flags:
+        for entries in ({}, {"org_id": "acme"}, {"org_id": "other"}):
+            assert flag.evaluate_many("user_id", iter(actor_ids), entries) == [
+                flag.is_enabled(**entries, user_id=actor_id)
+                for actor_id in actor_ids
+            ]
+
 
 def create_flag(**overrides):
     return Flag(
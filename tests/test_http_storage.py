@@ -0,0 +1,118 @@
+from threading import Thread
+from time import sleep
+from typing import List
+
+import pytest
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from flypper import Client
+from flypper.storage.abstract import FullListing
+from flypper.storage.http import HttpStorage, ReadOnlyStorageError
+from flypper.storage.in_memory import InMemoryStorage
+from flypper.storage.sqlite import SqliteStorage
+from flypper.wsgi.web_ui import FlypperWebUI
+
+from tests.factories import create_flag_data
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+@pytest.fixture
+def storage():
+    return InMemoryStorage()
+
+@pytest.fixture
+def statuses():
+    return []
+
+@pytest.fixture
+def url(storage, statuses: List[str]):
+    web_ui = FlypperWebUI(storage=storage)
+
+    def app(environ, start_response):
+        def recording_start_response(status, headers, *args):
+            statuses.append(status)
+            return start_response(status, headers, *args)
+        return web_ui(environ, recording_start_response)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=KeepAliveRequestHandler)
+    thread = Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/flypper"
+    server.shutdown()
+
+def test_list_syncs_the_deltas_from_the_web_ui(storage, url):
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert(create_flag_data(name="bar"))
+    http_storage = HttpStorage(url)
+
+    assert sorted(flag.name for flag in http_storage.list()) == ["bar", "foo"]
+    assert [flag.name for flag in http_storage.list(version__gt=1)] == ["bar"]
+    assert http_storage.current_version() == 2
+
+    storage.delete("foo")
+    [tombstone] = http_storage.list(version__gt=2)
+    assert tombstone.name == "foo" and tombstone.is_deleted
+
+@pytest.mark.parametrize("storage", [InMemoryStorage(tombstones_retention=1)])
+def test_list_is_full_when_the_web_ui_storage_dropped_tombstones(storage, url):
+    for name in ("foo", "bar", "baz"):
+        storage.upsert(create_flag_data(name=name))
+    storage.delete("foo")
+    storage.delete("bar")
+    http_storage = HttpStorage(url)
+
+    full_listing = http_storage.list(version__gt=3)
+    assert isinstance(full_listing, FullListing)
+    assert ([flag.name for flag in full_listing], full_listing.version) == (["baz"], 5)
+    assert not isinstance(http_storage.list(version__gt=4), FullListing)
+
+def test_unchanged_deltas_are_not_modified(storage, url, statuses):
+    storage.upsert(create_flag_data(name="foo"))
+    http_storage = HttpStorage(url)
+
+    assert [flag.name for flag in http_storage.list(version__gt=0)] == ["foo"]
+    assert [flag.name for flag in http_storage.list(version__gt=0)] == ["foo"]
+    assert [status.split()[0] for status in statuses] == ["200", "304"]
+    # Both requests went through the same kept-alive connection.
+    assert http_storage._pool.qsize() == 1
+
+def test_a_client_syncs_and_watches_through_the_web_ui(storage, url):
+    storage.upsert(create_flag_data(name="foo"))
+    client = Client(storage=HttpStorage(url), ttl=0)
+    assert client(user_id="42").is_enabled("foo")
+
+    storage.upsert({**create_flag_data(name="foo"), "enabled": False})
+    assert not client(user_id="42").is_enabled("foo")
+    assert [flag.name for flag in client._storage.watch(version__gt=1, timeout=0)] == ["foo"]
+
+def test_writes_raise_a_read_only_error():
+    http_storage = HttpStorage("http://127.0.0.1/flypper")
+
+    with pytest.raises(ReadOnlyStorageError):
+        http_storage.upsert(create_flag_data(name="foo"))
+    with pytest.raises(ReadOnlyStorageError):
+        with http_storage.batch() as batch:
+            batch.delete("foo")
+
+def test_watch_support_is_the_web_ui_storage_one(url):
+    assert HttpStorage(url).supports_watch is True
+    assert HttpStorage("http://127.0.0.1:1/flypper").supports_watch is False
+
+@pytest.mark.parametrize("storage", [SqliteStorage(":memory:")])
+def test_a_client_polls_a_web_ui_whose_storage_cant_be_watched(storage, url, statuses):
+    storage.upsert(create_flag_data(name="foo"))
+    http_storage = HttpStorage(url)
+    assert http_storage.supports_watch is False
+
+    client = Client(storage=http_storage, ttl=5, watch=True)
+    try:
+        assert "foo" in client.flags()
+        sleep(0.5)
+    finally:
+        client.stop()
+    # The version check and the first sync of the flags and segments.
+    assert len(statuses) <= 4
@@ -0,0 +1,169 @@
+from typing import cast
+
+import pytest
+
+from flypper import Client, UnversionedFlagData
+from flypper.storage.abstract import FullListing
+from flypper.storage.in_memory import InMemoryStorage
+
+from tests.factories import create_flag_data
+
+def test_list_returns_the_flags_updated_after_a_version():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert(create_flag_data(name="bar"))
+    storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name="foo"), "enabled": False}))
+
+    assert sorted(flag.name for flag in storage.list()) == ["bar", "foo"]
+    assert [(flag.name, flag.version) for flag in storage.list(version__gt=1)] == [("bar", 2), ("foo", 3)]
+    assert [flag.name for flag in storage.list(version__gt=2)] == ["foo"]
+    assert storage.list(version__gt=3) == []
+
+def test_delete_leaves_a_tombstone_for_delta_syncs():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    storage.delete("foo")
+
+    assert storage.list() == []
+    [tombstone] = storage.list(version__gt=1)
+    assert tombstone.name == "foo"
+    assert tombstone.is_deleted
+    assert tombstone.version == 2
+
+def test_upsert_replaces_a_tombstone():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    storage.delete("foo")
+    storage.upsert(create_flag_data(name="foo"))
+
+    [flag] = storage.list(version__gt=1)
+    assert not flag.is_deleted
+    assert flag.version == 3
+
+def test_changelog_is_compacted():
+    storage = InMemoryStorage(tombstones_retention=2)
+    for i in range(100):
+        storage.upsert(create_flag_data(name="foo"))
+        storage.upsert(create_flag_data(name=f"bar{i}"))
+        storage.delete(f"bar{i}")
+
+    assert len(storage._changelog) < 10
+    assert [flag.name for flag in storage.list(version__gt=0)] == ["foo"]
+    assert [flag.name for flag in storage.list(version__gt=294)] == ["bar98", "foo", "bar99"]
+
+def test_list_is_full_after_a_version_older_than_the_dropped_tombstones():
+    storage = InMemoryStorage(tombstones_retention=1)
+    for name in ("foo", "bar", "baz"):
+        storage.upsert(create_flag_data(name=name))
+    storage.delete("foo")
+    storage.delete("bar")
+
+    full_listing = storage.list(version__gt=3)
+    assert isinstance(full_listing, FullListing)
+    assert ([flag.name for flag in full_listing], full_listing.version) == (["baz"], 5)
+    assert [flag.name for flag in storage.list(version__gt=4)] == ["bar"]
+
+def test_a_lagging_client_resyncs_once_tombstones_are_dropped():
+    storage = InMemoryStorage(tombstones_retention=1)
+    for name in ("foo", "bar", "baz"):
+        storage.upsert(create_flag_data(name=name))
+    client = Client(storage=storage, ttl=0)
+    assert sorted(client.flags()) == ["bar", "baz", "foo"]
+
+    storage.delete("foo")
+    storage.delete("bar")
+    storage.upsert(create_flag_data(name="qux"))
+
+    assert sorted(client.flags()) == ["baz", "qux"]
+
+def test_get_finds_a_flag_by_name():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name="bar"), "deleted": True}))
+    storage.upsert(create_flag_data(name="baz"))
+    storage.delete("baz")
+
+    assert storage.get("foo").name == "foo"
+    assert storage.get("bar").is_deleted
+    assert storage.get("baz") is None
+    assert storage.get("missing") is None
+
+def test_list_page_paginates_the_flags_by_name_prefix():
+    storage = InMemoryStorage()
+    for name in ["b.3", "a.1", "b.1", "c.1", "b.2", "b.4"]:
+        storage.upsert(create_flag_data(name=name))
+    storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name="b.2"), "deleted": True}))
+    storage.delete("b.4")
+
+    first_page = storage.list_page(prefix="b.", limit=2)
+    assert [flag.name for flag in first_page.flags] == ["b.1", "b.2"]
+    assert first_page.next_cursor == "b.2"
+
+    last_page = storage.list_page(prefix="b.", cursor=first_page.next_cursor, limit=2)
+    assert [flag.name for flag in last_page.flags] == ["b.3"]
+    assert last_page.next_cursor is None
+
+    assert [flag.name for flag in storage.list_page(deleted=False).flags] == ["a.1", "b.1", "b.3", "c.1"]
+    assert [flag.name for flag in storage.list_page(deleted=True).flags] == ["b.2"]
+
+def test_batches_are_written_under_a_single_version():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+
+    with storage.batch() as batch:
+        batch.upsert(create_flag_data(name="bar"))
+        batch.upsert(create_flag_data(name="baz"))
+        batch.delete("foo")
+
+    assert [flag.name for flag in batch.flags] == ["bar", "baz"]
+    assert storage.current_version() == 2
+    assert sorted((flag.name, flag.version, flag.is_deleted) for flag in storage.list(version__gt=1)) == [
+        ("bar", 2, False),
+        ("baz", 2, False),
+        ("foo", 2, True),
+    ]
+
+def test_batches_deleting_missing_flags_write_nothing():
+    storage = InMemoryStorage()
+
+    with pytest.raises(KeyError):
+        with storage.batch() as batch:
+            batch.upsert(create_flag_data(name="foo"))
+            batch.delete("bar")
+
+    assert storage.current_version() == 0
+    assert storage.list() == []
+
+def test_batches_with_an_invalid_flag_write_nothing():
+    storage = InMemoryStorage()
+    invalid_flag_data = {**create_flag_data(name="bar"), "rules": [{"entry": "plan", "operator": "nope"}]}
+
+    with pytest.raises(ValueError):
+        storage.write_batch(upserts=[create_flag_data(name="foo"), invalid_flag_data], deletions=[])
+    with pytest.raises(ValueError):
+        storage.upsert(invalid_flag_data)
+
+    assert storage.current_version() == 0
+    assert storage.list() == []
+
+def test_upsert_many_and_delete_many():
+    storage = InMemoryStorage()
+
+    storage.upsert_many(create_flag_data(name=f"flag_{i}") for i in range(3))
+    storage.delete_many(["flag_0", "flag_2"])
+
+    assert [flag.name for flag in storage.list()] == ["flag_1"]
+    assert storage.current_version() == 2
+
+def test_segments_share_the_flags_version():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert_segment({"name": "staff", "deleted": False, "actors": {"actor_key": "user_id", "actor_ids": ["1"]}})
+    storage.delete_segment("staff")
+
+    assert storage.list_segments() == []
+    [tombstone] = storage.list_segments(version__gt=1)
+    assert (tombstone.name, tombstone.is_deleted, tombstone.version) == ("staff", True, 3)
+    assert storage.current_version() == 3
+    with pytest.raises(KeyError):
+        storage.delete_segment("staff")
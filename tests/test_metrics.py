@@ -0,0 +1,97 @@
+from threading import Thread
+
+import pytest
+from werkzeug.test import Client as WsgiClient
+
+from flypper import Client
+from flypper.metrics import MetricsRegistry, _EvaluationCounts
+from flypper.storage.in_memory import InMemoryStorage
+from flypper.wsgi.web_ui import FlypperWebUI
+
+from tests.factories import create_flag_data
+
+def test_metrics_registry_reports_syncs_and_evaluations():
+    now = [0.0]
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    metrics = MetricsRegistry()
+    client = Client(storage=storage, ttl=1, time_fn=lambda: now[0], instrumentation=metrics, name="main")
+
+    with client() as flags:
+        flags.is_enabled("foo")
+        flags.is_enabled("foo")
+        flags.is_enabled("bar")
+    storage.upsert(create_flag_data(name="bar"))
+    now[0] = 0.5
+
+    rendered = metrics.render()
+
+    assert 'flypper_sync_delta_size_bucket{le="0"} 0' in rendered
+    assert 'flypper_sync_delta_size_bucket{le="1"} 1' in rendered
+    assert "flypper_sync_duration_seconds_count 1" in rendered
+    assert "flypper_sync_lock_wait_seconds_count 1" in rendered
+    assert 'flypper_evaluations_total{result="enabled"} 2' in rendered
+    assert 'flypper_client_version{client="main"} 1' in rendered
+    # Measured when rendering, the storage being one version ahead.
+    assert 'flypper_client_version_lag{client="main"} 1' in rendered
+    assert 'flypper_client_staleness_seconds{client="main"} 0.5' in rendered
+
+def test_metrics_registry_only_queries_the_storages_supporting_current_version():
+    storage = BrokenVersionStorage()
+    metrics = MetricsRegistry()
+    clients = [Client(storage=storage, ttl=1, instrumentation=metrics) for _ in range(2)]
+    clients[1].flags()
+
+    rendered = metrics.render()
+
+    assert "flypper_client_version_lag{" not in rendered
+    assert 'flypper_client_version{client="1"} 0' in rendered
+    with pytest.raises(ValueError):
+        Client(storage=storage, instrumentation=metrics, name="1")
+
+def test_syncs_dont_query_the_storage_current_version():
+    storage = CountingVersionStorage()
+    metrics = MetricsRegistry()
+    client = Client(storage=storage, ttl=0, instrumentation=metrics, name="main")
+    client.flags()
+    client.flags()
+    assert storage.current_version_call_count == 0
+
+    assert 'flypper_client_version_lag{client="main"} 0' in metrics.render()
+    assert storage.current_version_call_count == 1
+
+def test_web_ui_exposes_the_metrics():
+    metrics = MetricsRegistry()
+    storage = InMemoryStorage()
+
+    response = WsgiClient(FlypperWebUI(storage=storage, metrics=metrics)).get("/flypper/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE flypper_sync_duration_seconds histogram" in response.get_data(as_text=True)
+
+    response = WsgiClient(FlypperWebUI(storage=storage)).get("/flypper/metrics")
+    assert response.status_code == 404
+
+def test_evaluation_counts_release_the_finished_threads_counters():
+    counts = _EvaluationCounts()
+    threads = [Thread(target=counts.increment, args=(index % 2 == 0,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counts.totals() == (2, 2)
+    assert counts._cells == []
+
+class BrokenVersionStorage(InMemoryStorage):
+    supports_current_version = False
+
+    def current_version(self) -> int:
+        raise ConnectionError("Storage unavailable")
+
+class CountingVersionStorage(InMemoryStorage):
+    current_version_call_count = 0
+
+    def current_version(self) -> int:
+        self.current_version_call_count += 1
+        return super().current_version()
@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from flypper.persistent_map import PersistentMap
+
+class CollidingKey:
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 42
+
+    def __eq__(self, other):
+        return isinstance(other, CollidingKey) and other.name == self.name
+
+def test_persistent_map_behaves_like_a_dict():
+    rng = random.Random(0)
+    expected = {}
+    persistent_map = PersistentMap()
+
+    for _ in range(5_000):
+        key = rng.choice([str(rng.randrange(500)), CollidingKey(rng.randrange(5)), rng.randrange(500)])
+        if rng.random() < 0.3:
+            persistent_map = persistent_map.discard(key)
+            expected.pop(key, None)
+        else:
+            value = rng.random()
+            persistent_map = persistent_map.set(key, value)
+            expected[key] = value
+
+    assert len(persistent_map) == len(expected)
+    assert dict(persistent_map.items()) == expected
+    for key, value in expected.items():
+        assert key in persistent_map
+        assert persistent_map[key] == value
+    assert persistent_map.get("missing") is None
+    assert "missing" not in persistent_map
+
+def test_persistent_map_versions_are_isolated():
+    before = PersistentMap({"foo": 1, "bar": 2})
+    after = before.set("foo", 3).delete("bar").set("baz", 4)
+
+    assert dict(before.items()) == {"foo": 1, "bar": 2}
+    assert dict(after.items()) == {"foo": 3, "baz": 4}
+
+    with pytest.raises(KeyError):
+        before.delete("baz")
+    with pytest.raises(KeyError):
+        before["baz"]
@@ -0,0 +1,81 @@
+import pytest
+
+from flypper.entities.rules import compile_rule, compile_rules, rule_entries
+
+def test_comparisons_compare_numbers_or_strings():
+    older_than_18 = compile_rule({"entry": "age", "operator": "gte", "value": 18})
+    assert older_than_18({"age": "18"})
+    assert older_than_18({"age": "42.5"})
+    assert not older_than_18({"age": "9"})
+    assert not older_than_18({"age": "unknown"})
+    assert not older_than_18({})
+
+    not_french = compile_rule({"entry": "country", "operator": "ne", "value": "FR"})
+    assert not_french({"country": "DE"})
+    assert not not_french({"country": "FR"})
+    assert not not_french({})
+
+def test_set_membership():
+    paid_plans = compile_rule({"entry": "plan", "operator": "in", "values": ["pro", "enterprise"]})
+    free_plans = compile_rule({"entry": "plan", "operator": "not_in", "values": ["pro", "enterprise"]})
+    assert paid_plans({"plan": "pro"}) and not free_plans({"plan": "pro"})
+    assert free_plans({"plan": "free"}) and not paid_plans({"plan": "free"})
+    assert not paid_plans({}) and not free_plans({})
+
+@pytest.mark.parametrize("version, expected", [
+    ("1.10.0", True),
+    ("v1.2.3", True),
+    ("1.2.3-rc.1", False),
+    ("1.2", False),
+    ("1.2.3+build.7", True),
+    ("not a version", False),
+])
+def test_semver_comparisons(version, expected):
+    rule = compile_rule({"entry": "app_version", "operator": "semver_gte", "value": "1.2.3"})
+    assert rule({"app_version": version}) is expected
+
+def test_semver_orders_prereleases():
+    rule = compile_rule({"entry": "app_version", "operator": "semver_lt", "value": "1.0.0-beta.11"})
+    assert rule({"app_version": "1.0.0-alpha"})
+    assert rule({"app_version": "1.0.0-beta.2"})
+    assert rule({"app_version": "1.0.0-beta"})
+    assert not rule({"app_version": "1.0.0-rc.1"})
+
+def test_time_windows():
+    now = [100.0]
+    window = compile_rules(
+        [{"operator": "after", "value": 100}, {"operator": "before", "value": "1970-01-01T00:03:20Z"}],
+        time_fn=lambda: now[0],
+    )
+    assert window is not None
+    assert window({})
+    now[0] = 99.0
+    assert not window({})
+    now[0] = 200.0
+    assert not window({})
+
+def test_rules_are_nested_with_all_and_any():
+    rule = compile_rule({"any": [
+        {"entry": "plan", "operator": "eq", "value": "pro"},
+        {"all": [
+            {"entry": "plan", "operator": "eq", "value": "free"},
+            {"entry": "country", "operator": "in", "values": ["FR", "BE"]},
+        ]},
+    ]})
+    assert rule({"plan": "pro"})
+    assert rule({"plan": "free", "country": "BE"})
+    assert not rule({"plan": "free", "country": "US"})
+    assert rule_entries([{"any": [{"entry": "plan", "operator": "eq", "value": "pro"}]}]) == {"plan"}
+
+@pytest.mark.parametrize("rules", [
+    [{"entry": "plan", "operator": "like", "value": "pro"}],
+    [{"entry": "plan", "operator": "in", "values": "pro"}],
+    [{"operator": "eq", "value": "pro"}],
+    [{"entry": "app_version", "operator": "semver_gt", "value": "latest"}],
+    [{"operator": "after", "value": "tomorrow"}],
+    [{"all": []}],
+    {"entry": "plan", "operator": "eq", "value": "pro"},
+])
+def test_invalid_rules_raise_a_value_error(rules):
+    with pytest.raises(ValueError):
+        compile_rules(rules)
@@ -0,0 +1,117 @@
+from threading import Thread
+
+import pytest
+
+from flypper import Client
+from flypper.circuit_breaker import CircuitBreaker
+from flypper.storage.in_memory import InMemoryStorage
+from flypper.storage.shared import SharedStorage
+
+from tests.factories import create_flag_data
+from tests.fake_storage import FakeStorage, FlakyFakeStorage, SlowFakeStorage
+
+def test_clients_share_a_single_fetch_per_ttl():
+    now = [0.0]
+    storage = FakeStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    shared_storage = SharedStorage(storage, ttl=1, time_fn=lambda: now[0])
+    clients = [Client(storage=shared_storage, ttl=0) for _ in range(10)]
+
+    for client in clients:
+        assert list(client.flags()) == ["foo"]
+    assert storage.list_call_count == 1
+
+    storage.upsert(create_flag_data(name="bar"))
+    assert "bar" not in clients[0].flags()
+    now[0] = 1.0
+    for client in clients:
+        assert set(client.flags()) == {"foo", "bar"}
+    assert storage.list_call_count == 2
+
+def test_deltas_are_answered_from_memory():
+    storage = FakeStorage()
+    shared_storage = SharedStorage(storage, ttl=0)
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert(create_flag_data(name="bar"))
+    assert sorted(flag.name for flag in shared_storage.list()) == ["bar", "foo"]
+
+    storage.upsert(create_flag_data(name="foo"))
+    storage.delete("bar")
+    assert sorted(flag.name for flag in shared_storage.list()) == ["foo"]
+    assert [(flag.name, flag.version, flag.is_deleted) for flag in shared_storage.list(version__gt=2)] == [
+        ("foo", 3, False),
+        ("bar", 4, True),
+    ]
+    assert shared_storage.list(version__gt=4) == []
+
+def test_writes_are_fetched_right_away():
+    storage = FakeStorage()
+    shared_storage = SharedStorage(storage, ttl=60)
+    assert shared_storage.list() == []
+
+    shared_storage.upsert(create_flag_data(name="foo"))
+    assert [flag.name for flag in shared_storage.list(version__gt=0)] == ["foo"]
+
+def test_concurrent_lists_wait_for_a_single_fetch():
+    storage = SlowFakeStorage(delay=0.1)
+    storage.upsert(create_flag_data(name="foo"))
+    shared_storage = SharedStorage(storage, ttl=60)
+
+    threads = [Thread(target=shared_storage.list) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert storage.list_call_count == 1
+
+def test_only_the_most_recent_tombstones_are_kept():
+    storage = FakeStorage()
+    shared_storage = SharedStorage(storage, ttl=0, tombstones_retention=2)
+    for name in ("foo", "bar", "baz"):
+        storage.upsert(create_flag_data(name=name))
+    shared_storage.list()
+    for name in ("foo", "bar", "baz"):
+        storage.delete(name)
+
+    assert [flag.name for flag in shared_storage.list(version__gt=5)] == ["baz"]
+    assert shared_storage._flags.since(version__gt=3) is None
+    assert sorted(shared_storage._flags._latest) == ["bar", "baz"]
+
+def test_a_full_listing_resets_the_shared_updates():
+    storage = InMemoryStorage(tombstones_retention=1)
+    shared_storage = SharedStorage(storage, ttl=0)
+    for name in ("foo", "bar", "baz"):
+        storage.upsert(create_flag_data(name=name))
+    shared_storage.list()
+    storage.delete("foo")
+    storage.delete("bar")
+
+    assert [flag.name for flag in shared_storage.list(version__gt=5)] == []
+    assert [flag.name for flag in shared_storage.list(version__gt=3)] == ["baz"]
+    assert (shared_storage._flags.cursor, shared_storage._flags.base_version) == (5, 5)
+
+def test_fetches_back_off_while_the_storage_fails():
+    now = [0.0]
+    storage = FlakyFakeStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    shared_storage = SharedStorage(
+        storage,
+        ttl=1,
+        time_fn=lambda: now[0],
+        circuit_breaker=CircuitBreaker(failure_threshold=1, backoff_base=10.0, random_fn=lambda: 1.0),
+    )
+    assert [flag.name for flag in shared_storage.list()] == ["foo"]
+
+    storage.failing = True
+    now[0] = 1.0
+    with pytest.raises(ConnectionError):
+        shared_storage.list()
+    list_call_count = storage.list_call_count
+    now[0] = 5.0
+    assert [flag.name for flag in shared_storage.list()] == ["foo"]
+    assert storage.list_call_count == list_call_count
+
+    storage.failing = False
+    now[0] = 11.0
+    assert [flag.name for flag in shared_storage.list()] == ["foo"]
+    assert storage.list_call_count == list_call_count + 1
@@ -0,0 +1,132 @@
+import json
+import os
+import struct
+from typing import List, cast
+
+import pytest
+
+from flypper import Client, Flag, UnversionedFlagData
+from flypper.snapshot import Snapshot, SnapshotClient, SnapshotPublisher, read_snapshot_version, write_snapshot
+from flypper.storage.in_memory import InMemoryStorage
+
+from tests.factories import create_flag_data
+from tests.fake_storage import FakeStorage
+
+def test_snapshot_roundtrip(tmp_path):
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name="bar"), "enabled": False}))
+    path = os.path.join(tmp_path, "flags.snapshot")
+
+    write_snapshot(path, {flag.name: flag for flag in storage.list()}, version=2)
+    snapshot = Snapshot(path)
+
+    assert read_snapshot_version(path) == 2
+    assert snapshot.version == 2
+    assert sorted(snapshot) == ["bar", "foo"]
+    assert "baz" not in snapshot
+    assert snapshot["foo"].is_enabled()
+    assert not snapshot["bar"].is_enabled()
+    assert snapshot["foo"].data == storage.list(version__gt=0)[0].data
+
+def test_snapshot_client_follows_the_published_snapshots(tmp_path):
+    now = [0.0]
+    storage = InMemoryStorage()
+    path = os.path.join(tmp_path, "flags.snapshot")
+    publisher = SnapshotPublisher(Client(storage=storage, ttl=0), path)
+    snapshot_client = SnapshotClient(path, ttl=1, time_fn=lambda: now[0])
+
+    storage.upsert(create_flag_data(name="foo"))
+    assert publisher.publish()
+    assert not publisher.publish()
+    with snapshot_client() as flags:
+        assert flags.is_enabled("foo")
+
+    storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name="foo"), "enabled": False}))
+    assert publisher.publish()
+    with snapshot_client() as flags:
+        assert flags.is_enabled("foo")  # Checked less than ttl seconds ago
+
+    now[0] = 1.0
+    with snapshot_client() as flags:
+        assert not flags.is_enabled("foo")
+    assert snapshot_client.version == 2
+
+def test_client_bootstraps_from_a_snapshot(tmp_path):
+    storage = FakeStorage()
+    path = os.path.join(tmp_path, "flags.snapshot")
+    storage.upsert(create_flag_data(name="foo"))
+    Client(storage=storage, ttl=0).dump_snapshot(path)  # Nothing synced yet
+    assert Snapshot(path).version == 0
+
+    client = Client(storage=storage, ttl=0)
+    client.flags()
+    client.dump_snapshot(path)
+    storage.upsert(create_flag_data(name="bar"))
+    storage.list_call_count = 0
+
+    client = Client.from_snapshot(storage, path, ttl=0)
+    assert client.version == 1
+    assert sorted(client.flags()) == ["bar", "foo"]
+    assert storage.list_call_count == 1
+
+def test_client_serves_its_snapshot_when_the_storage_is_down_at_boot(tmp_path):
+    storage = FakeStorage()
+    path = os.path.join(tmp_path, "flags.snapshot")
+    storage.upsert(create_flag_data(name="foo"))
+    client = Client(storage=storage, ttl=0)
+    client.flags()
+    client.dump_snapshot(path)
+
+    broken_storage = BrokenStorage()
+    client = Client.from_snapshot(broken_storage, path, ttl=0)
+    assert list(client.flags()) == ["foo"]
+
+    assert list(Client.from_snapshot(storage, path, ttl=0).flags()) == ["foo"]
+    with pytest.raises(ConnectionError):
+        Client.from_snapshot(broken_storage, os.path.join(tmp_path, "missing"), missing_ok=True).flags()
+    with pytest.raises(FileNotFoundError):
+        Client.from_snapshot(storage, os.path.join(tmp_path, "missing"))
+
+def test_snapshots_hold_the_segments(tmp_path):
+    now = [0.0]
+    storage = InMemoryStorage()
+    storage.upsert_segment({"name": "staff", "deleted": False, "actors": {"actor_key": "user_id", "actor_ids": ["1"]}})
+    storage.upsert({**create_flag_data(name="foo"), "enabled_for_segments": ["staff"]})
+    path = os.path.join(tmp_path, "flags.snapshot")
+    publisher = SnapshotPublisher(Client(storage=storage, ttl=0), path)
+    snapshot_client = SnapshotClient(path, ttl=1, time_fn=lambda: now[0])
+
+    assert publisher.publish()
+    with snapshot_client(user_id="1") as flags:
+        assert flags.is_enabled("foo")
+
+    client = Client.from_snapshot(BrokenStorage(), path, ttl=0)
+    assert client.segments_version == 1
+    with client(user_id="1") as flags:
+        assert flags.is_enabled("foo")
+
+    # Segments have their own version: updating one publishes a new snapshot.
+    storage.upsert_segment({"name": "staff", "deleted": False, "actors": {"actor_key": "user_id", "actor_ids": ["2"]}})
+    assert publisher.publish()
+    now[0] = 1.0
+    with snapshot_client(user_id="1") as flags:
+        assert not flags.is_enabled("foo")
+
+def test_snapshots_written_before_segments_are_read(tmp_path):
+    path = os.path.join(tmp_path, "flags.snapshot")
+    document = json.dumps({**create_flag_data(name="foo"), "updated_at": 0.0, "version": 3}).encode("utf-8")
+    index = json.dumps({"foo": [32, len(document)]}).encode("utf-8")
+    with open(path, "wb") as snapshot_file:
+        snapshot_file.write(struct.pack("<8sQQQ", b"FLYPPER1", 3, 32 + len(document), len(index)))
+        snapshot_file.write(document + index)
+
+    snapshot = Snapshot(path)
+    assert (snapshot.version, snapshot.segments_version) == (3, 0)
+    assert snapshot["foo"].is_enabled()
+    assert snapshot.segments == {}
+    assert read_snapshot_version(path) == 3
+
+class BrokenStorage(InMemoryStorage):
+    def list(self, version__gt: int = 0) -> List[Flag]:
+        raise ConnectionError("Storage unavailable")
@@ -0,0 +1,144 @@
+import os
+from typing import cast
+
+import pytest
+
+from flypper import Client, UnversionedFlagData
+from flypper.storage.sqlite import SqliteStorage
+
+from tests.factories import create_flag_data
+
+@pytest.fixture
+def path(tmp_path):
+    return os.path.join(tmp_path, "flypper.sqlite3")
+
+def test_list_returns_the_flags_updated_after_a_version(path):
+    storage = SqliteStorage(path)
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert(create_flag_data(name="bar"))
+    storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name="foo"), "enabled": False}))
+
+    assert sorted(flag.name for flag in storage.list()) == ["bar", "foo"]
+    assert [(flag.name, flag.version) for flag in storage.list(version__gt=1)] == [("bar", 2), ("foo", 3)]
+    assert not storage.list(version__gt=2)[0].is_enabled()
+    assert storage.list(version__gt=3) == []
+
+def test_each_write_is_committed(path):
+    writer = SqliteStorage(path)
+    reader = SqliteStorage(path)
+
+    writer.upsert(create_flag_data(name="foo"))
+    assert not writer._connection.in_transaction
+    assert [flag.name for flag in reader.list()] == ["foo"]
+
+def test_delete_leaves_a_tombstone_for_delta_syncs(path):
+    storage = SqliteStorage(path, tombstones_retention=1)
+    client = Client(storage=storage, ttl=0)
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert(create_flag_data(name="bar"))
+    assert sorted(client.flags()) == ["bar", "foo"]
+
+    storage.delete("foo")
+    assert list(client.flags()) == ["bar"]
+    assert [flag.name for flag in storage.list()] == ["bar"]
+
+    storage.delete("bar")
+    assert [flag.name for flag in storage.list(version__gt=2)] == ["bar"]
+
+    with pytest.raises(KeyError):
+        storage.delete("foo")
+    with pytest.raises(KeyError):
+        storage.delete_segment("staff")
+
+def test_get_and_list_page_use_the_flags_names(path):
+    storage = SqliteStorage(path)
+    for name in ["b.3", "a.1", "b.1", "c.1", "b.2", "b.4"]:
+        storage.upsert(create_flag_data(name=name))
+    storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name="b.2"), "deleted": True}))
+    storage.delete("b.4")
+
+    assert storage.get("b.1").name == "b.1"
+    assert storage.get("b.4") is None
+
+    first_page = storage.list_page(prefix="b.", limit=2)
+    assert [flag.name for flag in first_page.flags] == ["b.1", "b.2"]
+    last_page = storage.list_page(prefix="b.", cursor=first_page.next_cursor, limit=2)
+    assert [flag.name for flag in last_page.flags] == ["b.3"]
+    assert last_page.next_cursor is None
+    assert [flag.name for flag in storage.list_page(deleted=True).flags] == ["b.2"]
+
+def test_batches_are_committed_under_a_single_version(path):
+    storage = SqliteStorage(path)
+    reader = SqliteStorage(path)
+    storage.upsert(create_flag_data(name="foo"))
+
+    with storage.batch() as batch:
+        batch.upsert(create_flag_data(name="bar"))
+        batch.delete("foo")
+
+    assert storage.current_version() == 2
+    assert sorted((flag.name, flag.version, flag.is_deleted) for flag in reader.list(version__gt=1)) == [
+        ("bar", 2, False),
+        ("foo", 2, True),
+    ]
+    with pytest.raises(KeyError):
+        storage.delete_many(["foo"])
+
+def test_failed_batches_write_nothing_and_release_the_write_lock(path):
+    storage = SqliteStorage(path)
+    other_storage = SqliteStorage(path, timeout=0.1)
+    storage.upsert(create_flag_data(name="foo"))
+    invalid_flag_data = cast(UnversionedFlagData, {
+        **create_flag_data(name="baz"),
+        "enabled_for_percentage_of_actors": {"actor_key": "user_id", "percentage": "12"},
+    })
+
+    with pytest.raises(TypeError):
+        storage.write_batch(upserts=[create_flag_data(name="bar"), invalid_flag_data], deletions=[])
+    assert [flag.name for flag in storage.list()] == ["foo"]
+    assert storage.current_version() == 1
+
+    with pytest.raises(TypeError):
+        with storage.batch() as batch:
+            batch.upsert(create_flag_data(name="bar"))
+            batch.upsert(invalid_flag_data)
+    assert [flag.name for flag in storage.list()] == ["foo"]
+    assert storage.current_version() == 1
+
+    other_storage.upsert(create_flag_data(name="qux"))
+
+def test_only_the_most_recent_tombstones_are_kept_even_within_a_batch(path):
+    storage = SqliteStorage(path, tombstones_retention=2)
+    storage.upsert_many([create_flag_data(name=name) for name in ("foo", "bar", "baz")])
+    storage.delete_many(["foo", "bar", "baz"])
+
+    assert sorted((flag.name, flag.version) for flag in storage.list(version__gt=1)) == [("bar", 2), ("baz", 2)]
+
+def test_failed_writes_release_the_write_lock(path):
+    storage = SqliteStorage(path)
+    other_storage = SqliteStorage(path, timeout=0.1)
+
+    with pytest.raises(KeyError):
+        storage.delete("foo")
+    with pytest.raises(KeyError):
+        storage.delete_segment("staff")
+    with pytest.raises(ValueError):
+        storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name="foo"), "rules": [{"operator": "nope"}]}))
+
+    assert not storage._connection.in_transaction
+    other_storage.upsert(create_flag_data(name="bar"))
+    assert storage.current_version() == 1
+
+def test_segments_are_stored_with_their_own_table(path):
+    storage = SqliteStorage(path)
+    storage.upsert_segment({"name": "staff", "deleted": False, "actors": {"actor_key": "user_id", "actor_ids": ["1"]}})
+    storage.upsert(create_flag_data(name="foo"))
+
+    [segment] = SqliteStorage(path).list_segments()
+    assert (segment.name, segment.version) == ("staff", 1)
+    assert segment.contains({"user_id": "1"})
+
+    storage.delete_segment("staff")
+    assert storage.list_segments() == []
+    [tombstone] = storage.list_segments(version__gt=2)
+    assert tombstone.is_deleted
@@ -0,0 +1,107 @@
+from threading import Event, Thread
+from typing import cast
+
+import pytest
+
+from flypper import Client, UnversionedFlagData
+from flypper.storage.in_memory import InMemoryStorage
+from flypper.storage.sqlite import SqliteStorage
+from flypper.usage import StorageUsageSink, UsageTracker
+
+from tests.factories import create_flag_data
+
+def test_usage_tracker_counts_evaluations_and_flushes_them_to_the_storage():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    tracker = UsageTracker(sink=StorageUsageSink(storage), time_fn=lambda: 42.0)
+    client = Client(storage=storage, usage_tracker=tracker)
+
+    def evaluate():
+        with client() as flags:
+            for _ in range(100):
+                flags.is_enabled("foo")
+                flags.is_enabled("bar")
+
+    threads = [Thread(target=evaluate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tracker.flush()
+
+    assert storage.usage() == {
+        "foo": {"enabled_count": 400, "disabled_count": 0, "last_evaluated_at": 42.0},
+    }
+
+def test_usage_tracker_flushes_partial_buffers_on_stop():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert(cast(UnversionedFlagData, {**create_flag_data(name="bar"), "enabled": False}))
+    tracker = UsageTracker(sink=StorageUsageSink(storage), time_fn=lambda: 42.0)
+    tracker.start()
+
+    with Client(storage=storage, usage_tracker=tracker)() as flags:
+        flags.is_enabled("foo")
+        flags.is_enabled("bar")
+        flags.is_enabled("bar")
+    tracker.stop()
+
+    assert storage.usage() == {
+        "foo": {"enabled_count": 1, "disabled_count": 0, "last_evaluated_at": 42.0},
+        "bar": {"enabled_count": 0, "disabled_count": 2, "last_evaluated_at": 42.0},
+    }
+
+def test_usage_tracker_flushes_the_buffers_of_idle_threads():
+    now = [10.0]
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    tracker = UsageTracker(sink=StorageUsageSink(storage), time_fn=lambda: now[0])
+    client = Client(storage=storage, usage_tracker=tracker)
+    evaluated = Event()
+    done = Event()
+
+    def evaluate():
+        with client() as flags:
+            flags.is_enabled("foo")
+        evaluated.set()
+        done.wait(5)
+
+    thread = Thread(target=evaluate)
+    thread.start()
+    evaluated.wait(5)
+    now[0] = 20.0
+    tracker.flush()
+    assert storage.usage() == {}
+    now[0] = 30.0
+    tracker.flush()
+    done.set()
+    thread.join()
+
+    # The thread's counts are written by the flush after the one swapping them out, at the time of the swap.
+    assert storage.usage() == {
+        "foo": {"enabled_count": 1, "disabled_count": 0, "last_evaluated_at": 20.0},
+    }
+
+@pytest.mark.parametrize("storage_factory", [InMemoryStorage, lambda: SqliteStorage(":memory:")])
+def test_storages_return_the_usages_of_some_flags(storage_factory):
+    storage = storage_factory()
+    storage.record_usage({
+        name: {"enabled_count": 1, "disabled_count": 0, "last_evaluated_at": 42.0}
+        for name in ("foo", "bar", "baz")
+    })
+
+    assert storage.usage_for(["foo", "baz", "missing"]) == {
+        "foo": {"enabled_count": 1, "disabled_count": 0, "last_evaluated_at": 42.0},
+        "baz": {"enabled_count": 1, "disabled_count": 0, "last_evaluated_at": 42.0},
+    }
+    assert storage.usage_for([]) == {}
+
+def test_storage_usage_sink_records_the_usages_in_their_own_transaction(tmp_path):
+    path = str(tmp_path / "flypper.sqlite3")
+    storage = SqliteStorage(path)
+    StorageUsageSink(storage).write({"foo": {"enabled_count": 1, "disabled_count": 0, "last_evaluated_at": 42.0}})
+
+    assert not storage._connection.in_transaction
+    assert SqliteStorage(path).usage() == {
+        "foo": {"enabled_count": 1, "disabled_count": 0, "last_evaluated_at": 42.0},
+    }
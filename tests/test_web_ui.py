@@ -0,0 +1,261 @@
+import gzip
+import io
+from threading import Timer
+
+from werkzeug.test import Client as WsgiClient
+
+from flypper.entities.actor_ids import pack_actor_ids
+from flypper.storage.in_memory import InMemoryStorage
+from flypper.wsgi.web_ui import FlypperWebUI
+
+from tests.factories import create_flag_data
+from tests.fake_storage import FakeStorage
+
+def test_watch_returns_the_flags_updated_after_a_version():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert(create_flag_data(name="bar"))
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+
+    response = web_ui.get("/flypper/api/watch?version__gt=1&timeout=0")
+
+    assert response.status_code == 200
+    assert [flag["name"] for flag in response.get_json()["flags"]] == ["bar"]
+
+def test_watch_waits_for_updates():
+    storage = InMemoryStorage()
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+    Timer(0.05, lambda: storage.upsert(create_flag_data(name="foo"))).start()
+
+    response = web_ui.get("/flypper/api/watch?version__gt=0&timeout=5")
+
+    assert [flag["name"] for flag in response.get_json()["flags"]] == ["foo"]
+
+def test_index_shows_the_flags_usage():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert(create_flag_data(name="bar"))
+    storage.record_usage({"foo": {"enabled_count": 3, "disabled_count": 1, "last_evaluated_at": 0.0}})
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+
+    page = web_ui.get("/flypper/").get_data(as_text=True)
+
+    assert "Last evaluated on 1970-01-01 00:00 UTC" in page
+    assert "enabled 3 times out of 4" in page
+    assert page.count("Last evaluated") == 1
+
+def test_index_paginates_and_searches_the_flags():
+    storage = InMemoryStorage()
+    for i in range(5):
+        storage.upsert(create_flag_data(name=f"app.flag_{i}"))
+    storage.upsert(create_flag_data(name="other.flag"))
+    web_ui = WsgiClient(FlypperWebUI(storage=storage, page_size=2))
+
+    first_page = web_ui.get("/flypper/?q=app.").get_data(as_text=True)
+    assert "app.flag_0" in first_page and "app.flag_1" in first_page
+    assert "app.flag_2" not in first_page
+    assert "cursor=app.flag_1" in first_page
+
+    last_page = web_ui.get("/flypper/?q=app.&cursor=app.flag_3").get_data(as_text=True)
+    assert "app.flag_4" in last_page
+    assert "other.flag" not in last_page
+    assert "Next page" not in last_page
+
+def test_edit_form_looks_the_flag_up():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+
+    assert web_ui.get("/flypper/edit_form?flag_name=foo").status_code == 200
+    assert web_ui.get("/flypper/edit_form?flag_name=bar").status_code == 404
+    assert web_ui.get("/flypper/?deleted=1").status_code == 200
+
+def test_index_is_rendered_once_per_storage_version():
+    storage = FakeStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+
+    first_response = web_ui.get("/flypper/")
+    second_response = web_ui.get("/flypper/")
+    assert storage.list_page_call_count == 1
+    assert first_response.get_data() == second_response.get_data()
+
+    storage.upsert(create_flag_data(name="bar"))
+    third_response = web_ui.get("/flypper/")
+    assert storage.list_page_call_count == 2
+    assert "bar" in third_response.get_data(as_text=True)
+    assert third_response.headers["ETag"] != first_response.headers["ETag"]
+
+def test_index_honors_if_none_match():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+
+    etag = web_ui.get("/flypper/").headers["ETag"]
+    response = web_ui.get("/flypper/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+
+    storage.upsert(create_flag_data(name="bar"))
+    assert web_ui.get("/flypper/", headers={"If-None-Match": etag}).status_code == 200
+
+def test_index_changes_its_etag_as_usages_refresh():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    web_ui = WsgiClient(FlypperWebUI(storage=storage, usage_refresh_interval=1e-9))
+
+    etag = web_ui.get("/flypper/").headers["ETag"]
+    storage.record_usage({"foo": {"enabled_count": 3, "disabled_count": 1, "last_evaluated_at": 0.0}})
+    response = web_ui.get("/flypper/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "enabled 3 times out of 4" in response.get_data(as_text=True)
+
+def test_edit_form_keeps_its_etag_while_usages_refresh():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    web_ui = WsgiClient(FlypperWebUI(storage=storage, usage_refresh_interval=1e-9))
+
+    etag = web_ui.get("/flypper/edit_form?flag_name=foo").headers["ETag"]
+    assert web_ui.get("/flypper/edit_form?flag_name=foo", headers={"If-None-Match": etag}).status_code == 304
+
+def test_pages_are_not_cached_without_a_cheap_version():
+    class UnversionedStorage(FakeStorage):
+        supports_current_version = False
+
+    storage = UnversionedStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+
+    response = web_ui.get("/flypper/")
+    web_ui.get("/flypper/")
+    assert "ETag" not in response.headers
+    assert storage.list_page_call_count == 2
+
+def test_index_is_gzipped_when_accepted():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+
+    response = web_ui.get("/flypper/", headers={"Accept-Encoding": "gzip, deflate"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.get_data()) == web_ui.get("/flypper/").get_data()
+
+def test_flags_are_exported_then_imported_in_a_single_batch():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    storage.upsert({**create_flag_data(name="bar"), "deleted": True})
+    export = WsgiClient(FlypperWebUI(storage=storage)).get("/flypper/export")
+    assert export.headers["Content-Disposition"].startswith("attachment")
+
+    other_storage = InMemoryStorage()
+    web_ui = WsgiClient(FlypperWebUI(storage=other_storage))
+    response = web_ui.post("/flypper/import", json=export.get_json())
+
+    assert response.status_code == 200
+    assert sorted((flag.name, flag.is_deleted) for flag in other_storage.list()) == [("bar", True), ("foo", False)]
+    assert other_storage.current_version() == 1
+
+    response = web_ui.post("/flypper/import", data={"flags_file": (io.BytesIO(b'{"flags": [{"name": "baz"}]}'), "flags.json")})
+    assert response.status_code == 400
+
+def test_imports_with_an_invalid_flag_write_nothing():
+    storage = InMemoryStorage()
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+
+    response = web_ui.post("/flypper/import", json={"flags": [
+        create_flag_data(name="foo"),
+        {**create_flag_data(name="bar"), "enabled_for_percentage_of_actors": {"actor_key": "user_id", "percentage": "12"}},
+    ]})
+
+    assert response.status_code == 400
+    assert storage.current_version() == 0
+
+    response = web_ui.post("/flypper/import", json={"flags": [
+        {**create_flag_data(name="foo"), "enabled_for_segments": "staff"},
+    ]})
+
+    assert response.status_code == 400
+    assert storage.current_version() == 0
+
+def test_edit_adds_and_removes_actor_ids():
+    storage = InMemoryStorage()
+    storage.upsert({
+        **create_flag_data(name="foo"),
+        "enabled_for_actors": {"actor_key": "user_id", "actor_ids": ["1", "2", "3"]},
+    })
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+
+    form = web_ui.get("/flypper/edit_form?flag_name=foo").get_data(as_text=True)
+    assert "Enabled for 3 actors: 1, 2, 3" in " ".join(form.split())
+
+    web_ui.post("/flypper/edit", data={
+        "flag_name": "foo",
+        "enabled": "on",
+        "enabled_for_actors": "on",
+        "enabled_for_actors_key": "user_id",
+        "enabled_for_actors_added_ids": "4\n5",
+        "enabled_for_actors_removed_ids": "2",
+    })
+
+    assert sorted(storage.get("foo").actor_ids) == ["1", "3", "4", "5"]
+
+def test_edit_updates_packed_actor_ids_with_a_threshold():
+    storage = InMemoryStorage()
+    storage.upsert({
+        **create_flag_data(name="foo"),
+        "enabled_for_actors": pack_actor_ids(
+            {"actor_key": "user_id", "actor_ids": [str(i) for i in range(100)]},
+            threshold=10,
+        ),
+    })
+    web_ui = WsgiClient(FlypperWebUI(storage=storage, pack_actor_ids_threshold=10))
+    form = {
+        "flag_name": "foo",
+        "enabled": "on",
+        "enabled_for_actors": "on",
+        "enabled_for_actors_key": "user_id",
+    }
+
+    web_ui.post("/flypper/edit", data={**form, "enabled_for_actors_added_ids": "100", "enabled_for_actors_removed_ids": "0"})
+    enabled_for_actors = storage.get("foo").data["enabled_for_actors"]
+    assert "packed_actor_ids" in enabled_for_actors
+    assert set(storage.get("foo").actor_ids) == {str(i) for i in range(1, 101)}
+
+    # Without changes to the actor ids, they aren't packed again.
+    web_ui.post("/flypper/edit", data=form)
+    assert storage.get("foo").data["enabled_for_actors"] == enabled_for_actors
+
+def test_actor_ids_are_not_packed_by_default():
+    storage = InMemoryStorage()
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+    actor_ids = [str(i) for i in range(20_000)]
+
+    web_ui.post("/flypper/import", json={"flags": [{
+        "name": "foo",
+        "enabled": False,
+        "enabled_for_actors": {"actor_key": "user_id", "actor_ids": actor_ids},
+    }]})
+
+    enabled_for_actors = storage.get("foo").data["enabled_for_actors"]
+    assert "packed_actor_ids" not in enabled_for_actors
+    assert len(enabled_for_actors["actor_ids"]) == 20_000
+
+def test_edit_sets_the_rules():
+    storage = InMemoryStorage()
+    storage.upsert(create_flag_data(name="foo"))
+    web_ui = WsgiClient(FlypperWebUI(storage=storage))
+    form = {"flag_name": "foo", "enabled": "on"}
+
+    response = web_ui.post("/flypper/edit", data={**form, "rules": '[{"entry": "plan", "operator": "in", "values": ["pro"]}]'})
+    assert response.status_code == 302
+    assert storage.get("foo").is_enabled(plan="pro")
+    assert not storage.get("foo").is_enabled(plan="free")
+    assert "\"operator\": \"in\"" in web_ui.get("/flypper/edit_form?flag_name=foo").get_data(as_text=True)
+
+    assert web_ui.post("/flypper/edit", data={**form, "rules": '[{"entry": "plan"}]'}).status_code == 400
+    assert web_ui.post("/flypper/edit", data={**form, "rules": "not json"}).status_code == 400
+
+    web_ui.post("/flypper/edit", data={**form, "rules": ""})
+    assert storage.get("foo").is_enabled(plan="free")